@@ -1,7 +1,5 @@
 from flask import Flask
-from flask_bootstrap import Bootstrap
 from flask_mail import Mail
-from flask_moment import Moment
 # from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 # from flask_pagedown import PageDown
@@ -9,12 +7,34 @@ from flask_mongoengine import MongoEngine
 from flask_cors import CORS
 from pymongo import MongoClient
 from config import config
+from .last_seen import LastSeenTracker
+from .user_cache import UserCache
+from .tokens import TokenVersions
+from .credential_cache import CredentialCache
+from .ratelimit import RateLimiter
+from .metrics import Metrics
+from .db_monitor import CommandMonitor, PoolMonitor
+from .slow_queries import SlowQueryRecorder
+from .scheduler import Scheduler
+from .read_routing import ReadRouter
 
-bootstrap = Bootstrap()
+# 只有HTML页面需要的扩展，create_app(profile='full') 时才导入和创建
+bootstrap = None
+moment = None
 mail = Mail()
-moment = Moment()
 db = MongoEngine()
 cors = CORS()
+last_seen = LastSeenTracker()
+user_cache = UserCache()
+token_versions = TokenVersions()
+credential_cache = CredentialCache()
+limiter = RateLimiter()
+metrics = Metrics()
+db_monitor = CommandMonitor()
+pool_monitor = PoolMonitor()
+slow_queries = SlowQueryRecorder()
+scheduler = Scheduler()
+read_router = ReadRouter()
 
 login_manager = LoginManager()
 
@@ -28,21 +48,67 @@ login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Please log in first.'
 
 
-def create_app(config_name):
+PROFILES = ('full', 'api')
+
+
+def init_html_extensions(app):
+    global bootstrap, moment
+    from flask_bootstrap import Bootstrap
+    from flask_moment import Moment
+    if bootstrap is None:
+        bootstrap = Bootstrap()
+        moment = Moment()
+    bootstrap.init_app(app)
+    moment.init_app(app)
+
+
+def create_app(config_name, profile='full'):
+    ''' profile='api' 时只加载 JSON API（/api/v1 和 /auth）需要的部分，
+    不导入 Bootstrap、Moment 和 HTML 页面的 main 蓝本，启动更快
+    '''
+    if profile not in PROFILES:
+        raise ValueError('Unknown app profile: %s' % profile)
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
 
     cors.init_app(app)
-    bootstrap.init_app(app)
+    if profile == 'full':
+        init_html_extensions(app)
     mail.init_app(app)
-    moment.init_app(app)
+    # 命令监听器必须在创建MongoClient之前注册
+    db_monitor.init_app(app)
+    slow_queries.init_app(app, db_monitor)
+    pool_monitor.init_app(app, metrics)
     db.init_app(app)
+    read_router.init_app(app)
+    # 预加载部署时 fork 后重新连接数据库
+    from .prefork import install
+    install()
     login_manager.init_app(app)
+    last_seen.init_app(app)
+    user_cache.init_app(app)
+    token_versions.init_app(app)
+    credential_cache.init_app(app)
+    limiter.init_app(app)
+    metrics.init_app(app)
+    metrics.register_collector(user_cache.collect)
+    scheduler.init_app(app)
+    # 每个进程写回自己缓冲的访问时间
+    scheduler.add_job('last_seen.flush', last_seen.flush, app.config['LAST_SEEN_FLUSH_INTERVAL'],
+                      leader_only=False)
+    # 每个进程刷新自己的令牌版本表
+    scheduler.add_job('token_versions.refresh', token_versions.refresh, token_versions.refresh_interval,
+                      leader_only=False)
+    if metrics.multiproc_dir:
+        # 每个进程写出自己的指标，供其他进程的 /metrics 汇总
+        scheduler.add_job('metrics.dump', metrics.dump, app.config['METRICS_DUMP_INTERVAL'],
+                          leader_only=False)
     # pagedown.init_app(app)
 
-    from .main import main as main_blueprint
-    app.register_blueprint(main_blueprint)
+    if profile == 'full':
+        from .main import main as main_blueprint
+        app.register_blueprint(main_blueprint)
 
     # from .auth import auth as auth_blueprint
     from .api import auth as auth_blueprint
@@ -50,17 +116,14 @@ def create_app(config_name):
 
     from .api import api as api_blueprint
     app.register_blueprint(api_blueprint, url_prefix='/api/v1')
+    # 模拟车辆回放、在线车辆的历史位置和GPS原始数据的保留时间按 app.config 设置
+    from .api import ghost_car, tasks, telemetry
+    ghost_car.init_app(app)
+    tasks.init_app(app)
+    telemetry.init_app(app)
 
-    import logging
-    from logging.handlers import RotatingFileHandler
-
-    # handler = RotatingFileHandler('nds.log', maxBytes=10000, backupCount=1)
-    formatter = logging.Formatter(
-        "[%(asctime)s] {%(pathname)s:%(lineno)d} %(levelname)s - %(message)s")
-    handler = RotatingFileHandler('nds.log', maxBytes=10000000, backupCount=5)
-    handler.setLevel(logging.INFO)
-    handler.setFormatter(formatter)
-    app.logger.addHandler(handler)
+    from .logs import init_logging
+    init_logging(app)
 
     return app
 
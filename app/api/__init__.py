@@ -3,4 +3,4 @@ from flask import Blueprint
 api = Blueprint('api', __name__)
 auth = Blueprint('auth', 'auth')
 
-from . import authentication, user, user_admin, cars, drivers, tasks, ghost_car
\ No newline at end of file
+from . import authentication, user, user_admin, cars, drivers, tasks, ghost_car, admin, profiling, telemetry
\ No newline at end of file
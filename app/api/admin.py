@@ -0,0 +1,47 @@
+from flask import jsonify, request
+from .. import user_cache, slow_queries, scheduler
+from ..models import datetime_to_timestamp
+from . import api
+from .authentication import http_auth
+from .decorators import admin_required
+
+
+@api.route('/admin/user-cache/')
+@http_auth.login_required
+@admin_required
+def get_user_cache_stats():
+    ''' 用户缓存的命中率等统计信息（仅当前进程） '''
+    return jsonify(user_cache.stats())
+
+
+@api.route('/admin/scheduler/')
+@http_auth.login_required
+@admin_required
+def get_scheduler_status():
+    ''' 当前进程的定时任务及是否为 leader '''
+    return jsonify(scheduler.status())
+
+
+@api.route('/admin/slow-queries')
+@http_auth.login_required
+@admin_required
+def get_slow_queries():
+    ''' 慢查询汇总：按集合、命令和过滤条件结构分组，按总耗时倒序 '''
+    limit = request.args.get('limit', 50, type=int)
+    groups = slow_queries.summary(limit)
+    return jsonify({
+        'threshold_ms': slow_queries.threshold,
+        'queries': [{
+            'collection': group['_id']['collection'],
+            'command': group['_id']['command'],
+            'shape': group['_id']['shape'],
+            'count': group['count'],
+            'total_ms': group['total_ms'],
+            'avg_ms': group['avg_ms'],
+            'max_ms': group['max_ms'],
+            'endpoints': sorted(group['endpoints']),
+            'last_seen': datetime_to_timestamp(group['last_seen']),
+            'explain': group.get('explain')
+        } for group in groups],
+        'count': len(groups)
+    })
@@ -1,11 +1,19 @@
-from flask import g, jsonify, request, current_app
+import hmac
+from flask import g, jsonify
 from flask_httpauth import HTTPBasicAuth
+from werkzeug.security import generate_password_hash, check_password_hash
+from .. import credential_cache, user_cache
 from ..models import User
 from . import api
 from .errors import unauthorized, forbidden
+from .decorators import rate_limit
+from ..logs import log_request, log_response
 
 http_auth = HTTPBasicAuth()
 
+# 用户不存在时也计算一次哈希，使响应时间不暴露邮箱是否已注册
+_dummy_password_hash = generate_password_hash('')
+
 
 @http_auth.verify_password
 def verify_password(email_or_token, password):
@@ -15,12 +23,24 @@ def verify_password(email_or_token, password):
         g.current_user = User.verify_auth_token(email_or_token)  # get user by token
         g.token_used = True
         return g.current_user is not None
+    g.token_used = False
+    digest = credential_cache.digest(email_or_token, password)
+    cached = credential_cache.lookup(digest)
+    if cached:
+        user = user_cache.get(cached[0])
+        if user is not None and user.email == email_or_token and \
+                hmac.compare_digest(cached[1], user.password_hash):
+            g.current_user = user
+            return True
     user = User.objects(email=email_or_token).first()
     if not user:
+        check_password_hash(_dummy_password_hash, password)
         return False
     g.current_user = user
-    g.token_used = False
-    return user.verify_password(password)
+    if not user.verify_password(password):
+        return False
+    credential_cache.add(digest, user)
+    return True
 
 
 @http_auth.error_handler
@@ -33,19 +53,19 @@ def auth_error():
 @api.before_request
 # @http_auth.login_required
 def before_request():
-    current_app.logger.info('------------------------------------------------------------------------------------')
-    # current_app.logger.info('Headers: %s', request.headers)
-    current_app.logger.info('Address: %s  Methods: %s' % (request.remote_addr, request.method))
-    current_app.logger.info('Args: %s' % request.args)
-    current_app.logger.info('Body: %s' % request.get_data())
-    if hasattr(request, 'json'):
-        current_app.logger.info('Json data: %s' % request.json)
+    log_request()
     if g.get('current_user', default=None):
         if g.current_user.is_authenticated:
             g.current_user.ping()
 
 
+@api.after_request
+def after_request(response):
+    return log_response(response)
+
+
 @api.route('/tokens/', methods=['POST'])
+@rate_limit(10, per=60)
 @http_auth.login_required
 def get_token():
     if g.current_user.is_anonymous or g.token_used:
@@ -0,0 +1,108 @@
+''' 把同一份已编码的数据推送给所有订阅者（Server-Sent Events）
+
+每个订阅者有一个容量很小的队列。订阅者读取太慢、队列已满时丢弃最旧的一条，
+只保留最新的数据，因此慢客户端不会拖慢发布者，也不会无限占用内存。
+ASGI 服务器中的订阅者使用 LoopQueue，由事件循环读取，publish 仍可在任意线程中调用。
+'''
+import asyncio
+import queue
+import threading
+
+
+class LoopQueue(object):
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def put_nowait(self, data):
+        try:
+            self.loop.call_soon_threadsafe(self._put, data)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    def _put(self, data):
+        # 在事件循环线程中运行：队列已满时丢弃最旧的一条
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(data)
+
+    def get_nowait(self):
+        return self.queue.get_nowait()
+
+
+class Broadcaster(object):
+    def __init__(self, queue_size=2):
+        self.queue_size = queue_size
+        self.latest = None
+        self.dropped = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def subscribe_async(self):
+        ''' 在事件循环中调用 '''
+        q = LoopQueue(asyncio.get_event_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def publish(self, data):
+        self.latest = data
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(data)
+            except queue.Full:
+                # 慢客户端：丢弃最旧的数据，只保留最新的
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+                self.dropped += 1
+                try:
+                    q.put_nowait(data)
+                except queue.Full:
+                    pass
+
+    def listen(self, q, keepalive=15):
+        ''' 订阅者的数据流：先发送最近一次的数据，之后逐条发送；空闲时发送注释行保持连接 '''
+        try:
+            if self.latest is not None:
+                yield self.latest
+            while True:
+                try:
+                    yield q.get(timeout=keepalive)
+                except queue.Empty:
+                    yield b': keepalive\n\n'
+        finally:
+            self.unsubscribe(q)
+
+    async def listen_async(self, q, keepalive=15):
+        ''' listen 的异步版本，q 由 subscribe_async 得到 '''
+        try:
+            if self.latest is not None:
+                yield self.latest
+            while True:
+                try:
+                    yield await asyncio.wait_for(q.queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield b': keepalive\n\n'
+        finally:
+            self.unsubscribe(q)
@@ -1,8 +1,9 @@
 from datetime import datetime
 from flask import jsonify, request, g, url_for, current_app, abort, current_app
-from .. import db
+from .. import db, read_router
 from . import api
 from .authentication import http_auth
+from .decorators import rate_limit
 from ..models import Car, Task
 from .errors import bad_request, resource_not_found, TimestampError
 from flask_mongoengine import ValidationError
@@ -12,7 +13,7 @@ from flask_mongoengine import ValidationError
 # @http_auth.login_required
 def get_cars():
     page = request.args.get('page', 1, type=int)
-    pagination = Car.objects.paginate(page=page, per_page=10)
+    pagination = read_router.queryset(Car).paginate(page=page, per_page=10)
     cars = pagination.items
     prev = None
     if pagination.has_prev:
@@ -30,7 +31,7 @@ def get_cars():
 
 @api.route('/cars/dropdown/')
 def get_cars_dropdown():
-    cars = Car.objects()
+    cars = read_router.queryset(Car)
     return jsonify({
         'cars': [car.to_simple_json() for car in cars]
     })
@@ -135,6 +136,7 @@ def edit_car(id):
 
 # http://127.0.0.1:5000/api/v1/cars/search/?page=2&CarId=&LicensePlate=&Project=&minBuyTime=&maxBuyTime=
 @api.route('/cars/search/')
+@rate_limit(60, per=60)
 def search_cars():
     args = request.args
     page = args.get('page', 1, type=int)
@@ -156,7 +158,7 @@ def search_cars():
         conditions.update(condition)
 
     try:
-        pagination = Car.objects(**conditions).paginate(page=page, per_page=10)
+        pagination = read_router.queryset(Car)(**conditions).paginate(page=page, per_page=10)
     except:
         return resource_not_found('Resource not found, please check your url or parameter.')
     cars = pagination.items
@@ -1,6 +1,7 @@
 from functools import wraps
-from flask import g
-from .errors import forbidden
+from flask import g, request
+from .. import limiter
+from .errors import forbidden, too_many_requests
 
 
 def admin_required(f):
@@ -10,3 +11,19 @@ def admin_required(f):
             return forbidden('Insufficient permissions')
         return f(*args, **kwargs)
     return decorated_function
+
+
+def rate_limit(rate, per=60, burst=None):
+    ''' 按客户端和路由限流：每个客户端在每个路由上每 per 秒最多 rate 个请求（允许突发 burst 个）。
+    放在 http_auth.login_required 之上时，超限的请求在认证（密码哈希）之前就被拒绝。
+    '''
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            key = '%s:%s' % (request.endpoint, request.remote_addr)
+            allowed, retry_after = limiter.consume(key, rate, per, burst)
+            if not allowed:
+                return too_many_requests('Rate limit exceeded, retry later.', retry_after)
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
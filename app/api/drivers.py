@@ -1,9 +1,10 @@
 from datetime import datetime
 from flask import jsonify, request, g, url_for, current_app, abort
-from .. import db
+from .. import db, read_router
 from . import api
 from .errors import bad_request, resource_not_found, TimestampError
 from .authentication import http_auth
+from .decorators import rate_limit
 from ..models import Driver, Task
 from flask_mongoengine import ValidationError
 
@@ -12,7 +13,7 @@ from flask_mongoengine import ValidationError
 # @http_auth.login_required
 def get_drivers():
     page = request.args.get('page', 1, type=int)
-    pagination = Driver.objects.paginate(page=page, per_page=10)
+    pagination = read_router.queryset(Driver).paginate(page=page, per_page=10)
     drivers = pagination.items
     prev = None
     if pagination.has_prev:
@@ -30,7 +31,7 @@ def get_drivers():
 
 @api.route('/drivers/dropdown/')
 def get_drivers_dropdown():
-    drivers = Driver.objects()
+    drivers = read_router.queryset(Driver)
     return jsonify({
         'drivers': [driver.to_simple_json() for driver in drivers]
     })
@@ -118,6 +119,7 @@ def edit_driver(id):
 
 
 @api.route('/drivers/search/')
+@rate_limit(60, per=60)
 def search_drivers():
     page = request.args.get('page', 1, type=int)
     driverId = request.args.get('DriverId', '', type=str)
@@ -135,7 +137,7 @@ def search_drivers():
         conditions['Name'] = regex
     
     try:
-        pagination = Driver.objects(**conditions).paginate(page=page, per_page=10)
+        pagination = read_router.queryset(Driver)(**conditions).paginate(page=page, per_page=10)
     except:
         return resource_not_found('Resource not found, please check your url or parameter.')
     drivers = pagination.items
@@ -1,4 +1,5 @@
-from flask import jsonify
+import math
+from flask import jsonify, request
 from app.exceptions import ValidationError
 from . import api
 
@@ -21,6 +22,13 @@ def forbidden(message):
     return response
 
 
+def too_many_requests(message, retry_after):
+    response = jsonify({'error': 'too many requests', 'message': message})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(int(math.ceil(retry_after)))
+    return response
+
+
 def resource_not_found(message):
     response = jsonify({'error': 'notfound', 'message': message})
     response.status_code = 404
@@ -32,6 +40,36 @@ def validation_error(e):
     return bad_request(e.args[0])
 
 
+# abort(403/404/500) 默认返回HTML页面，对API客户端不太友好：根据客户端请求的格式改写响应（内容协商）。
+# 注册在 api 蓝本上，full 和 api 两种 profile 都会加载
+def wants_json():
+    return request.accept_mimetypes.accept_json and \
+        not request.accept_mimetypes.accept_html
+
+
+@api.app_errorhandler(403)
+def forbidden_error(e):
+    if wants_json():
+        return forbidden(e.description)
+    return e
+
+
+@api.app_errorhandler(404)
+def page_not_found(e):
+    if wants_json():
+        return resource_not_found(e.description)
+    return e
+
+
+@api.app_errorhandler(500)
+def internal_server_error(e):
+    if wants_json():
+        response = jsonify({'error': 'internal server error'})
+        response.status_code = 500
+        return response
+    return e
+
+
 class TimestampError(Exception):
     def __init__(self, *args):
         self.args = args
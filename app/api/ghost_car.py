@@ -1,40 +1,237 @@
+''' 模拟车辆（ghost car）轨迹回放
+
+每条轨迹来自 ghost_data/car_<i>.csv（第 2、3 列为经度、纬度），相邻两行相隔 GHOST_SAMPLE_INTERVAL 秒。
+首次使用时把 CSV 转换为同名的 .npy 文件（int32，单位 1e-6 度，每个点 8 字节），CSV 更新后会重新转换。
+所有轨迹再按编号顺序依次写入一个打包文件 tracks.npy（各轨迹的点数保存在 tracks_lengths.npy），
+任何 CSV 更新后重新打包。ReplayEngine 以 mmap_mode='r' 打开打包文件，轨迹数据不复制到进程内存中，
+预加载部署时各 worker 共享操作系统的页缓存。
+
+ReplayEngine 用 offsets 记录每条轨迹在打包数组中的起点，所有车辆共享一个模拟时钟：
+模拟时间 = 实际经过的时间 × 回放倍速。车辆 i 在模拟时间 t 的位置是其轨迹上
+(t + start[i]) / 采样间隔 处的点，在相邻两个采样点之间线性插值，轨迹结束后从头开始。
+每次 tick 只做几次数组运算，耗时与请求数量无关，上万辆车也只需几毫秒。
+
+tick 只在调度器的 leader 进程中运行，位置和模拟时钟写入共享状态；每个进程的 sync 任务读取
+最新位置并通知本进程的监听者（SSE 推送、空间索引）。回放参数和定时任务在 init_app 中按 app.config 设置。
+'''
+import glob
+import os
+import re
+import threading
 import time
-import atexit
-import csv
-# from queue import Queue
-from collections import deque
 
-from apscheduler.schedulers.background import BackgroundScheduler
+import numpy as np
+
+from .. import scheduler
+
+COORD_SCALE = 1000000  # 坐标以 1e-6 度为单位保存
+PACKED_FILE = 'tracks.npy'
+LENGTHS_FILE = 'tracks_lengths.npy'
+
+
+def convert_track(csv_path):
+    ''' 把 CSV 轨迹转换为 .npy 文件（若已是最新则直接返回），返回 .npy 路径 '''
+    npy_path = os.path.splitext(csv_path)[0] + '.npy'
+    if os.path.exists(npy_path) and os.path.getmtime(npy_path) >= os.path.getmtime(csv_path):
+        return npy_path
+    data = np.loadtxt(csv_path, delimiter=',', skiprows=1, usecols=(1, 2), ndmin=2)
+    track = np.round(data * COORD_SCALE).astype(np.int32)
+    tmp_path = npy_path + '.%d.tmp' % os.getpid()
+    with open(tmp_path, 'wb') as f:
+        np.save(f, track)
+    os.replace(tmp_path, npy_path)
+    return npy_path
+
+
+def track_paths(data_dir):
+    ''' data_dir 中的所有轨迹 CSV，按编号顺序排列 '''
+    def car_index(path):
+        match = re.search(r'car_(\d+)\.csv$', path)
+        return int(match.group(1)) if match else -1
+    return sorted(glob.glob(os.path.join(data_dir, 'car_*.csv')), key=car_index)
+
+
+def load_tracks(data_dir):
+    ''' 按编号顺序读取 data_dir 中的所有轨迹，返回 int32 数组的列表（忽略空轨迹） '''
+    tracks = [np.load(convert_track(path), mmap_mode='r') for path in track_paths(data_dir)]
+    return [track for track in tracks if len(track)]
+
+
+def pack_tracks(data_dir):
+    ''' 把所有轨迹依次写入 tracks.npy（若已是最新则直接返回），返回 (打包文件路径, 各轨迹点数)。
+    逐条复制到 open_memmap 打开的文件中，不需要把所有轨迹同时读入内存
+    '''
+    paths = track_paths(data_dir)
+    packed_path = os.path.join(data_dir, PACKED_FILE)
+    lengths_path = os.path.join(data_dir, LENGTHS_FILE)
+    if os.path.exists(packed_path) and os.path.exists(lengths_path):
+        lengths = np.load(lengths_path)
+        packed_time = min(os.path.getmtime(packed_path), os.path.getmtime(lengths_path))
+        if len(lengths) == len(paths) and all(os.path.getmtime(path) <= packed_time for path in paths):
+            return packed_path, lengths
+    tracks = [np.load(convert_track(path), mmap_mode='r') for path in paths]
+    lengths = np.array([len(track) for track in tracks], dtype=np.int64)
+    tmp_path = packed_path + '.%d.tmp' % os.getpid()
+    packed = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.int32, shape=(int(lengths.sum()), 2))
+    start = 0
+    for track in tracks:
+        packed[start:start + len(track)] = track
+        start += len(track)
+    packed.flush()
+    del packed
+    os.replace(tmp_path, packed_path)
+    tmp_path = lengths_path + '.%d.tmp' % os.getpid()
+    with open(tmp_path, 'wb') as f:
+        np.save(f, lengths)
+    os.replace(tmp_path, lengths_path)
+    return packed_path, lengths
+
 
+class ReplayEngine(object):
+    def __init__(self, data_dir='./ghost_data', sample_interval=2.0, speed=1.0,
+                 fleet_size=0, start_offsets='spread', seed=0):
+        self.sim_time = 0.0
+        self.points = None
+        self._positions = None
+        self._wall_time = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.configure(data_dir, sample_interval, speed, fleet_size, start_offsets, seed)
 
-ghost_cars = [deque(), deque(), deque(), deque(), deque()]
+    def configure(self, data_dir, sample_interval, speed, fleet_size=0, start_offsets='spread', seed=0):
+        ''' 设置回放参数；已加载的轨迹在下次使用时按新参数重新加载 '''
+        with self._load_lock:
+            self.data_dir = data_dir
+            self.sample_interval = float(sample_interval)
+            self.speed = float(speed)
+            self.fleet_size = fleet_size
+            self.start_offsets = start_offsets
+            self.seed = seed
+            self.points = None
 
+    def load(self, tracks=None):
+        ''' tracks 默认为 data_dir 中的打包文件（mmap）；也可以直接传入 [(n, 2) 数组, ...]（压力测试用） '''
+        if tracks is None:
+            packed_path, lengths = pack_tracks(self.data_dir)
+            points = np.load(packed_path, mmap_mode='r')
+        else:
+            lengths = np.array([len(track) for track in tracks], dtype=np.int64)
+            points = np.concatenate(tracks).astype(np.int32, copy=False) if len(tracks) \
+                else np.empty((0, 2), np.int32)
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+        # 忽略空轨迹
+        nonempty = np.flatnonzero(lengths)
 
-def load_file(i):
-    with open('./ghost_data/car_'+str(i)+'.csv') as csv_file:
-        csv_reader = csv.reader(csv_file)
-        next(csv_reader)
-        for row in csv_reader:
-            ghost_cars[i].append((row[1], row[2]))
+        # 车辆数多于轨迹数时循环复用轨迹，错开起始偏移后看起来就是不同的车
+        count = (self.fleet_size or len(nonempty)) if len(nonempty) else 0
+        track_ids = nonempty[np.arange(count, dtype=np.int64) % max(len(nonempty), 1)]
+        durations = lengths[track_ids] * self.sample_interval
+        if self.start_offsets == 'spread':
+            start = np.random.RandomState(self.seed).uniform(0, 1, count) * durations
+        else:
+            start = np.zeros(count)
+
+        with self._lock:
+            self.points = points
+            self.car_offsets = offsets[track_ids]
+            self.car_lengths = lengths[track_ids]
+            self.car_start = start
+            self._positions = None
+            self._wall_time = time.monotonic()
+
+    def _ensure_loaded(self):
+        if self.points is None:
+            with self._load_lock:
+                if self.points is None:
+                    self.load()
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self.car_offsets)
+
+    def positions_at(self, sim_time):
+        ''' 所有车辆在模拟时间 sim_time 的位置，(车辆数, 2) 的数组，列为经度、纬度 '''
+        self._ensure_loaded()
+        lengths = self.car_lengths
+        step = np.mod((sim_time + self.car_start) / self.sample_interval, lengths)
+        index = np.floor(step).astype(np.int64)
+        frac = (step - index)[:, None]
+        # 最后一个点之后直接回到起点，不向起点插值
+        following = np.minimum(index + 1, lengths - 1)
+        p0 = self.points[self.car_offsets + index]
+        p1 = self.points[self.car_offsets + following]
+        return np.round((p0 + (p1 - p0) * frac) / COORD_SCALE, 6)
+
+    def advance(self, seconds=None):
+        ''' 推进模拟时钟：默认按上次推进以来实际经过的时间 × 倍速，返回新的位置 '''
+        self._ensure_loaded()
+        with self._lock:
+            now = time.monotonic()
+            if seconds is None:
+                seconds = now - self._wall_time
+            self._wall_time = now
+            self.sim_time += seconds * self.speed
+            self._positions = self.positions_at(self.sim_time)
+            return self._positions
+
+    def resume(self, sim_time):
+        ''' 从 sim_time 继续回放（接替前一个 leader 的时钟） '''
+        self._ensure_loaded()
+        with self._lock:
+            self.sim_time = sim_time
+            self._wall_time = time.monotonic()
+
+    def current(self):
+        ''' 最近一次推进后的位置（不推进时钟） '''
+        self._ensure_loaded()
+        positions = self._positions
+        if positions is None:
+            positions = self._positions = self.positions_at(self.sim_time)
+        return positions
+
+
+engine = ReplayEngine()
+listeners = []
+synced_version = [None]
 
 
 def get_current_pos():
-    # print('')
-    # print(time.strftime("%A, %d. %B %Y %I:%M:%S %p"))
-    positions = []
-    for i in range(5):
-        if not len(ghost_cars[i]):
-            load_file(i)
-        positions.append(ghost_cars[i].popleft())
+    ''' 返回所有车辆的当前位置（不推进时钟，时钟只由定时任务 tick 推进） '''
+    positions = scheduler.state.get_array('ghost_positions')
+    return positions if positions is not None else engine.current()
+
+
+def add_listener(listener):
+    ''' listener(positions) 在每次 tick 之后被调用 '''
+    listeners.append(listener)
+
+
+def tick():
+    ''' 按实际经过的时间推进模拟时钟，把位置写入共享状态（只在 leader 进程中运行） '''
+    clock = scheduler.state.get_json('ghost_clock')
+    if clock and clock['sim_time'] > engine.sim_time:
+        engine.resume(clock['sim_time'])
+    positions = engine.advance()
+    scheduler.state.put_array('ghost_positions', positions)
+    scheduler.state.put_json('ghost_clock', {'sim_time': engine.sim_time})
     return positions
-    # print(ghost_cars[0].qsize())
-    # print(len(ghost_cars[0]))
-    
 
 
-scheduler = BackgroundScheduler()
-scheduler.add_job(func=get_current_pos, trigger="interval", seconds=2)
-scheduler.start()
+def sync():
+    ''' 读取 leader 写入的最新位置，有更新时通知本进程的监听者 '''
+    version = scheduler.state.array_version('ghost_positions')
+    if version is None or version == synced_version[0]:
+        return
+    positions = scheduler.state.get_array('ghost_positions')
+    synced_version[0] = version
+    for listener in listeners:
+        listener(positions)
+
 
-# Shut down the scheduler when exiting the app
-atexit.register(lambda: scheduler.shutdown())
\ No newline at end of file
+def init_app(app):
+    ''' 按 app.config 设置回放参数并登记定时任务（create_app 中调用） '''
+    config = app.config
+    engine.configure(config['GHOST_DATA_DIR'], config['GHOST_SAMPLE_INTERVAL'], config['GHOST_REPLAY_SPEED'],
+                     config['GHOST_FLEET_SIZE'], config['GHOST_START_OFFSETS'])
+    scheduler.add_job('ghost_car.tick', tick, config['GHOST_TICK_INTERVAL'])
+    scheduler.add_job('ghost_car.sync', sync, config['GHOST_TICK_INTERVAL'] / 2.0, leader_only=False)
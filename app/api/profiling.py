@@ -0,0 +1,101 @@
+''' 按需的请求性能分析（仅管理员）
+
+PROFILING_ENABLED 为 True 时，管理员的请求带上 X-Profile: 1 头（或 ?_profile=1 参数），
+该请求会在 cProfile 下执行，同时由采样线程定时记录调用栈。结果保存在 PROFILE_DIR 中：
+<id>.prof（pstats 格式）和 <id>.collapsed（火焰图工具可用的折叠调用栈），
+响应头 X-Profile-Id 返回 id。PROFILING_ENABLED 为 False 时不注册任何钩子，没有额外开销。
+'''
+import cProfile
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import current_app, g, request
+from . import api
+from .errors import forbidden
+
+
+class StackSampler(threading.Thread):
+    ''' 定时采样指定线程的调用栈，统计每个调用栈出现的次数 '''
+    def __init__(self, thread_id, interval):
+        super(StackSampler, self).__init__(name='nds-profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                                             code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _requested():
+    return request.headers.get('X-Profile') == '1' or request.args.get('_profile') == '1'
+
+
+def start_profile():
+    if request.blueprint != 'api' or not _requested():
+        return
+    from .authentication import verify_password
+    auth = request.authorization
+    if not auth or not verify_password(auth.username, auth.password) or \
+            not g.current_user.is_administrator():
+        return forbidden('Profiling requires administrator credentials.')
+    sampler = StackSampler(threading.get_ident(),
+                           current_app.config.get('PROFILE_SAMPLE_INTERVAL', 0.005))
+    profiler = cProfile.Profile()
+    g._profile = (profiler, sampler, time.time())
+    sampler.start()
+    profiler.enable()
+
+
+def finish_profile(response):
+    profile = g.pop('_profile', None)
+    if profile is None:
+        return response
+    profiler, sampler, started = profile
+    profiler.disable()
+    sampler.stop()
+
+    directory = current_app.config.get('PROFILE_DIR', 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    profile_id = '%s-%s-%s' % (time.strftime('%Y%m%d%H%M%S', time.localtime(started)),
+                               request.endpoint, uuid.uuid4().hex[:8])
+    profiler.dump_stats(os.path.join(directory, profile_id + '.prof'))
+    with open(os.path.join(directory, profile_id + '.collapsed'), 'w') as f:
+        for stack, count in sampler.stacks.most_common():
+            f.write('%s %d\n' % (stack, count))
+    current_app.logger.info('Profile %s saved (%.1fms)', profile_id, (time.time() - started) * 1000)
+    response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+def stop_profile(exc):
+    # 未处理的异常不会经过 after_request，这里停止分析器
+    profile = g.pop('_profile', None)
+    if profile is not None:
+        profile[0].disable()
+        profile[1].stop()
+
+
+@api.record_once
+def register_profiling(state):
+    if state.app.config.get('PROFILING_ENABLED'):
+        state.app.before_request(start_profile)
+        state.app.after_request(finish_profile)
+        state.app.teardown_request(stop_profile)
@@ -1,10 +1,12 @@
 from datetime import datetime
-from flask import jsonify, request, g, url_for, current_app, abort, redirect
-from .. import db
+from flask import jsonify, request, g, url_for, current_app, abort, redirect, Response
+from .. import db, read_router
 from . import api
 from .errors import bad_request, resource_not_found, TimestampError
 from .authentication import http_auth
+from .decorators import rate_limit
 from ..models import Task, Car, Driver
+from ..trajectory import track_cache
 from flask_mongoengine import ValidationError
 from mongoengine.queryset.visitor import Q
 
@@ -15,7 +17,7 @@ def get_tasks():
     page = request.args.get('page', 1, type=int)
     end_time = request.args.get('end_time', None, type=datetime)
 
-    pagination = Task.objects.paginate(page=page, per_page=10)
+    pagination = read_router.queryset(Task).paginate(page=page, per_page=10)
     tasks = pagination.items
     prev = None
     if pagination.has_prev:
@@ -45,6 +47,31 @@ def get_task(id):
         abort(404)
 
 
+# http://127.0.0.1:5000/api/v1/tasks/<id>/track?tolerance=10
+@api.route('/tasks/<id>/track')
+def get_task_track(id):
+    ''' 任务期间车辆的轨迹，按容差（米）抽稀，容差越大返回的点越少 '''
+    tolerance = request.args.get('tolerance', 10.0, type=float)
+    if tolerance is None or tolerance < 0:
+        return bad_request('tolerance must be a non-negative number.')
+    try:
+        task = Task.objects(id=id).first()
+    except:
+        abort(404)
+    if not task:
+        abort(404)
+
+    track = track_cache.get(task)
+    points = track.simplify(tolerance)
+    return jsonify({
+        'task': url_for('api.get_task', id=task.id),
+        'tolerance': tolerance,
+        'points': points,
+        'count': len(points),
+        'total': len(track)
+    })
+
+
 @api.route('/tasks/', methods=['POST'])
 # @http_auth.login_required
 def new_task():
@@ -165,6 +192,7 @@ def generate_query(args):
 # http://127.0.0.1:5000/api/v1/tasks/search/
 # ?page=2&is_return=0&car=""&driver=""&minstart_time=""&maxstart_time=""&minend_time=""&maxend_time=""
 @api.route('/tasks/search/')
+@rate_limit(60, per=60)
 def search_tasks():
     args = request.args
     page = args.get('page', 1, type=int)
@@ -195,7 +223,7 @@ def search_tasks():
         conditions.update(condition)
 
     try:
-        pagination = Task.objects(**conditions).paginate(page=page, per_page=10)
+        pagination = read_router.queryset(Task)(**conditions).paginate(page=page, per_page=10)
     except:
         return resource_not_found('Resource not found, please check your url or parameter.')
     tasks = pagination.items
@@ -219,36 +247,133 @@ def search_tasks():
         'count': pagination.total
     })
 
+import json
 import random
-from .ghost_car import get_current_pos
-cars = []
-drivers = []
-@api.route('/tasks/online/')
-def online_tasks():
-    # random select 5 car
-    if not len(cars):
-        cs = Car.objects()
-        for i in range(5):
-            car = random.choice(cs)
-            cars.append(car)
-        # cars.extend(random.sample(cs, 5))
-    if not len(drivers):
-        drs = Driver.objects()
-        for i in range(5):
-            driver = random.choice(drs)
-            drivers.append(driver)
-        # drivers.extend(random.sample(drs, 5))
-
-    positions = get_current_pos()
+import time
+import numpy as np
+from .broadcast import Broadcaster
+from .ghost_car import get_current_pos, add_listener
+from ..geo import GridIndex, parse_bbox, parse_point
+from ..history import RingBuffer
+# 每条模拟轨迹对应的车辆和司机信息（已序列化，推送时无需再查询数据库或调用url_for）
+fleet = []
+online_broadcaster = Broadcaster()
+# 最近一次tick的位置及其网格索引，(positions, GridIndex)
+online_index = [None]
+online_history = RingBuffer()
+
+
+def init_app(app):
+    ''' 按 app.config 设置每辆车保留的历史位置数（create_app 中调用） '''
+    online_history.resize(app.config['ONLINE_HISTORY_SIZE'])
+
+
+def update_fleet(count):
+    ''' 为每条模拟轨迹随机选择车辆和司机（轨迹数量由ghost_data中的文件决定） '''
+    if len(fleet) >= count:
+        return fleet
+    cs = list(read_router.queryset(Car).only('id', 'LicensePlate'))
+    drs = list(read_router.queryset(Driver).only('id', 'Name'))
+    for i in range(count - len(fleet)):
+        car = random.choice(cs)
+        driver = random.choice(drs)
+        fleet.append({
+            'car': {'LicensePlate': car.LicensePlate, 'url': url_for('api.get_car', id=car.id)},
+            'driver': {'Name': driver.Name, 'url': url_for('api.get_driver', id=driver.id)}
+        })
+    return fleet
+
+
+def online_snapshot(positions, indices=None, distances=None, history=None):
+    ''' indices 为要返回的车辆下标（默认全部），distances 为对应的距离（米），
+    history 为最近 history 秒内的位置（[[时间戳, 经度, 纬度], ...]）
+    '''
+    if indices is None:
+        indices = list(range(min(len(fleet), len(positions))))
+    # 与原来直接返回 CSV 中的文本一致，位置为字符串（精确到 1e-6 度）
+    points = [['%.6f' % lon, '%.6f' % lat] for lon, lat in positions[indices].tolist()]
+    if history is not None:
+        times, tracks = online_history.window(time.time() - history, indices)
+        tracks = np.concatenate((np.broadcast_to(times[None, :, None], tracks.shape[:2] + (1,)),
+                                 tracks), axis=2).tolist()
     targets = []
-    for i, pos in enumerate(positions):
-        json_task = {}
-        json_task['car'] = {'LicensePlate': cars[i].LicensePlate, 'url': url_for('api.get_car', id=cars[i].id)}
-        json_task['driver'] = {'Name': drivers[i].Name, 'url': url_for('api.get_driver', id=drivers[i].id)}
-        json_task['position'] = pos
+    for n, i in enumerate(indices):
+        json_task = dict(fleet[i])
+        json_task['position'] = points[n]
+        if distances is not None:
+            json_task['distance'] = round(float(distances[n]), 1)
+        if history is not None:
+            json_task['history'] = tracks[n]
         targets.append(json_task)
+    return {'tasks': targets, 'count': len(targets)}
 
-    return jsonify({
-        'tasks': targets,
-        'count': len(targets)
-    })
+
+def index_positions(positions):
+    online_index[0] = (positions, GridIndex(positions[:, 0], positions[:, 1]))
+    return online_index[0]
+
+
+def record_positions(positions):
+    online_history.append(positions, time.time())
+
+
+def publish_positions(positions):
+    ''' 每次tick只编码一次，推送给所有订阅者，开销与订阅者数量无关 '''
+    if not online_broadcaster.has_subscribers() or not fleet:
+        return
+    payload = json.dumps(online_snapshot(positions), separators=(',', ':'))
+    online_broadcaster.publish(('event: positions\ndata: %s\n\n' % payload).encode('utf-8'))
+
+
+add_listener(publish_positions)
+add_listener(index_positions)
+add_listener(record_positions)
+
+
+# http://127.0.0.1:5000/api/v1/tasks/online/?bbox=121.1,31.1,121.3,31.3
+# http://127.0.0.1:5000/api/v1/tasks/online/?near=121.2,31.2&radius=2000
+# http://127.0.0.1:5000/api/v1/tasks/online/?history=300
+@api.route('/tasks/online/')
+def online_tasks():
+    bbox = request.args.get('bbox')
+    near = request.args.get('near')
+    history = None
+    if 'history' in request.args:
+        history = request.args.get('history', type=float)
+        if history is None or history <= 0:
+            return bad_request('history must be a positive number of seconds.')
+    if not bbox and not near:
+        positions = get_current_pos()
+        update_fleet(len(positions))
+        return jsonify(online_snapshot(positions, history=history))
+
+    try:
+        bbox = parse_bbox(bbox) if bbox else None
+        near = parse_point(near) if near else None
+    except ValueError as err:
+        return bad_request(str(err))
+    radius = request.args.get('radius', 1000.0, type=float)
+    if radius is None or radius <= 0:
+        return bad_request('radius must be a positive number of meters.')
+
+    positions, grid = online_index[0] or index_positions(get_current_pos())
+    update_fleet(len(positions))
+    distances = None
+    if near:
+        indices, distances = grid.near(near[0], near[1], radius)
+        if bbox:
+            inside = np.isin(indices, grid.bbox(*bbox))
+            indices, distances = indices[inside], distances[inside]
+    else:
+        indices = grid.bbox(*bbox)
+    indices = indices[indices < len(fleet)]
+    return jsonify(online_snapshot(positions, indices.tolist(), distances, history))
+
+
+@api.route('/tasks/online/stream')
+def online_tasks_stream():
+    ''' 以Server-Sent Events推送所有在线车辆的位置，每次tick推送一次 '''
+    update_fleet(len(get_current_pos()))
+    q = online_broadcaster.subscribe()
+    return Response(online_broadcaster.listen(q), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -0,0 +1,117 @@
+import math
+from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import jsonify, request, current_app
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app.exceptions import ValidationError
+from . import api
+from .authentication import http_auth
+from .decorators import rate_limit
+from .errors import bad_request
+from ..models import Car, TelemetryBucket
+
+MAX_TIMESTAMP = 253402300799  # 9999-12-31 23:59:59 UTC，datetime 能表示的最大时间
+DUPLICATE_KEY = 11000
+WRITE_RETRIES = 3
+# 原始数据的保留时间，init_app 时按 app.config 设置，本进程第一次写入前检查 TTL 索引
+_ttl = {'seconds': None, 'checked': False}
+
+
+def init_app(app):
+    ''' 按 app.config 设置原始数据保留时间（create_app 中调用） '''
+    _ttl['seconds'] = app.config['TELEMETRY_RAW_TTL']
+    _ttl['checked'] = False
+
+
+def ensure_ttl_index():
+    if not _ttl['checked'] and _ttl['seconds'] is not None:
+        TelemetryBucket.ensure_ttl_index(_ttl['seconds'])
+        _ttl['checked'] = True
+
+
+def parse_point(point):
+    ''' 一个点可以是 [car, timestamp, lat, lon, speed] 数组，也可以是同名字段的对象 '''
+    if isinstance(point, dict):
+        point = [point.get('car'), point.get('timestamp'), point.get('lat'),
+                 point.get('lon'), point.get('speed')]
+    if not isinstance(point, (list, tuple)) or len(point) not in (4, 5):
+        raise ValidationError('point must be [car, timestamp, lat, lon, speed]')
+    try:
+        car = ObjectId(point[0])
+        timestamp = float(point[1])
+        lat = float(point[2])
+        lon = float(point[3])
+        speed = float(point[4]) if len(point) > 4 and point[4] is not None else None
+    except (InvalidId, TypeError, ValueError, OverflowError):
+        raise ValidationError('invalid point: %s' % (point,))
+    # float() 接受 nan、inf，这里一并拒绝
+    if not all(math.isfinite(value) for value in (timestamp, lat, lon, speed) if value is not None):
+        raise ValidationError('invalid point: %s' % (point,))
+    if not 0 <= timestamp <= MAX_TIMESTAMP:
+        raise ValidationError('timestamp out of range: %s' % (point,))
+    if not -90 <= lat <= 90 or not -180 <= lon <= 180:
+        raise ValidationError('coordinate out of range: %s' % (point,))
+    return car, timestamp, lat, lon, speed
+
+
+# {"points": [["5c3d...", 1547536244, 31.28, 121.21, 35.2], ...]}
+@api.route('/telemetry/batch', methods=['POST'])
+@http_auth.login_required
+@rate_limit(60, per=60)
+def telemetry_batch():
+    ''' 批量上报车辆GPS数据，按车辆和时间桶分组，每组一次 $push 追加 '''
+    if not request.json or not isinstance(request.json.get('points'), list):
+        return bad_request('No points recived.')
+    points = request.json['points']
+    if len(points) > current_app.config['TELEMETRY_MAX_BATCH']:
+        return bad_request('Too many points in one batch.')
+
+    minutes = current_app.config['TELEMETRY_BUCKET_MINUTES']
+    groups = {}
+    for point in points:
+        car, timestamp, lat, lon, speed = parse_point(point)
+        key = (car, TelemetryBucket.bucket_start(timestamp, minutes))
+        groups.setdefault(key, []).append((timestamp, lat, lon, speed))
+
+    cars = set(car for car, _ in groups)
+    known = set(car.id for car in Car.objects(id__in=list(cars)).only('id'))
+    if cars - known:
+        return bad_request('Unknown car: %s' % ', '.join(str(car) for car in cars - known))
+
+    requests = []
+    for (car, start), rows in groups.items():
+        rows.sort(key=lambda row: row[0])
+        times = [datetime.utcfromtimestamp(row[0]) for row in rows]
+        requests.append(UpdateOne({'car': car, 'start': start}, {
+            '$push': {'t': {'$each': times},
+                      'lat': {'$each': [row[1] for row in rows]},
+                      'lon': {'$each': [row[2] for row in rows]},
+                      'speed': {'$each': [row[3] for row in rows]}},
+            '$inc': {'count': len(rows)},
+            '$min': {'first': times[0]},
+            '$max': {'last': times[-1]}
+        }, upsert=True))
+    if requests:
+        write_buckets(requests)
+    return jsonify({'accepted': len(points), 'buckets': len(requests)})
+
+
+def write_buckets(requests):
+    ''' 同一个桶的首次写入同时发生时，其中一个 upsert 会因 (car, start) 唯一索引报重复键错误，
+    此时桶已由另一个请求创建，只需重试失败的操作（ordered=False 时其余操作已经完成）
+    '''
+    ensure_ttl_index()
+    collection = TelemetryBucket._get_collection()
+    for attempt in range(WRITE_RETRIES + 1):
+        try:
+            collection.bulk_write(requests, ordered=False)
+            return
+        except BulkWriteError as why:
+            errors = why.details.get('writeErrors') or []
+            if attempt == WRITE_RETRIES or not errors or \
+                    any(error.get('code') != DUPLICATE_KEY for error in errors) or \
+                    why.details.get('writeConcernErrors'):
+                raise
+            requests = [requests[error['index']] for error in errors]
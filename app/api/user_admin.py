@@ -1,10 +1,10 @@
 from flask import jsonify, request, g, url_for, current_app, abort
-from .. import db
+from .. import db, last_seen, read_router, user_cache
 from . import api
 from .authentication import http_auth
-from ..models import User, Task
+from ..models import User, Task, datetime_to_timestamp
 from ..email import send_email
-from .decorators import admin_required
+from .decorators import admin_required, rate_limit
 from .errors import bad_request, resource_not_found
 from .validators import validate_email, validate_username, validate_length, validate_require
 from flask_mongoengine import ValidationError
@@ -15,7 +15,7 @@ from flask_mongoengine import ValidationError
 # @admin_required
 def get_users():
     page = request.args.get('page', 1, type=int)
-    pagination = User.objects.paginate(page=page, per_page=10)
+    pagination = read_router.queryset(User).paginate(page=page, per_page=10)
     users = pagination.items
     prev = None
     if pagination.has_prev:
@@ -31,6 +31,24 @@ def get_users():
     })
 
 
+@api.route('/users/online/')
+@http_auth.login_required
+@admin_required
+def get_online_users():
+    ''' 最近访问过的用户，数据来自本进程内存中的访问记录，不查询数据库 '''
+    window = request.args.get('window', None, type=int)
+    if window is not None and window <= 0:
+        return bad_request('window must be a positive number of seconds')
+    users = [{'id': str(user_id),
+              'url': url_for('api.get_user', id=user_id),
+              'last_seen': datetime_to_timestamp(when)}
+             for user_id, when in last_seen.online_users(window)]
+    return jsonify({
+        'users': users,
+        'count': len(users)
+    })
+
+
 @api.route('/users/<id>')
 # @http_auth.login_required
 # @admin_required
@@ -103,7 +121,7 @@ def delete_user(id):
     if not user:
         abort(404)
 
-    if hasattr(g, 'current_user') and user == g.current_user:
+    if hasattr(g, 'current_user') and str(user.id) == str(g.current_user.id):
         return bad_request('Can not delete current user.')
     
     # 删除关联的task
@@ -175,12 +193,14 @@ def change_password():
 
     validate_length(new_password, 6, 32, fieldName='Password')
 
-    if not g.current_user.verify_password(old_password):
+    # 使用令牌认证时g.current_user是TokenPrincipal，这里需要完整的User文档
+    user = user_cache.get(g.current_user.id)
+    if user is None or not user.verify_password(old_password):
         return bad_request('The old password not matched.')
 
-    g.current_user.password = new_password
+    user.password = new_password
     try:
-        g.current_user.save()
+        user.save()
     except Exception as why:
         current_app.logger.error(str(why))
         return bad_request(str(why))
@@ -188,6 +208,7 @@ def change_password():
 
 
 @api.route('/users/search/')
+@rate_limit(60, per=60)
 def search_users():
     ''' 根据关键字检索用户，输入参数为filter，匹配字段包括email, username, name '''
     page = request.args.get('page', 1, type=int)
@@ -195,7 +216,7 @@ def search_users():
 
     if not match:  # 没有输入匹配条件，查询所有
         try:
-            pagination = User.objects().paginate(page=page, per_page=10)
+            pagination = read_router.queryset(User).paginate(page=page, per_page=10)
         except:
             return resource_not_found('Resource not found, please check your url or parameter.')
 
@@ -204,7 +225,7 @@ def search_users():
     regex = re.compile('.*' + match + '.*')
 
     try:
-        pagination = User.objects(Q(email=regex) | Q(username=regex) | Q(name=regex)).paginate(page=page, per_page=10)
+        pagination = read_router.queryset(User)(Q(email=regex) | Q(username=regex) | Q(name=regex)).paginate(page=page, per_page=10)
     except:
         return resource_not_found('Resource not found, please check your url or parameter.')
     
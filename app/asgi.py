@@ -0,0 +1,278 @@
+''' ASGI 版本的 API 服务器（uvicorn asgi:app）
+
+Flask 应用是同步的，每个 worker 线程在等待 Mongo 时都被占用，慢客户端和 SSE 长连接各占一个线程。
+这里用 Starlette 提供访问量最大的只读接口（车辆、司机、任务的列表和详情）以及在线车辆推送，
+数据库访问使用异步驱动 motor，单个进程可以同时保持数千个连接。其余路由原样交给 Flask 应用
+（a2wsgi 的 WSGIMiddleware，在线程池中运行），因此两种部署方式的接口完全一致。
+只读查询与 read_router 相同：配置了 MONGODB_READ_SETTINGS 时连接该节点，否则按 MONGODB_READ_PREFERENCE 读取。
+
+查询结果用 Document._from_son 还原为模型对象，再调用 app/models.py 中的 to_json，序列化格式与
+Flask 路由相同。任务引用的车辆、司机和记录人由 motor 批量查出后放入对象中，to_json 不会再触发
+同步查询。url_for 和模型的构造函数需要 Flask 的上下文，序列化时用 ASGI 请求的 scope 直接构造 WSGI environ
+并进入 Flask 的请求上下文（每个请求一次，不经过 test_request_context 的 EnvironBuilder）。
+
+异步路由不经过 api 蓝本的 before_request/after_request，由 AsyncApi.endpoint 做同样的事：
+记录 Request:/Response: 日志（格式相同，logstats 可以统计）、计入 /metrics（endpoint 名称与
+Flask 路由相同），并附带 X-DB-Queries / X-DB-Time 头（按本请求发出的 motor 查询计数和计时）。
+这些路由在 Flask 中也没有限流和认证；X-Profile 性能分析只适用于交给 Flask 的路由。
+路径中的 {id} 只匹配 ObjectId，/tasks/search 这类路径仍交给 Flask（重定向到带斜杠的地址）。
+'''
+import asyncio
+import contextlib
+import io
+import sys
+import time
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from a2wsgi import WSGIMiddleware
+from flask import url_for
+from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.convertors import Convertor, register_url_convertor
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+from . import create_app, metrics, read_router, scheduler
+from .db_monitor import RequestStats
+from .logs import request_sampled, write_request, write_response
+from .models import Car, Driver, Task, User
+from .read_routing import client_options
+
+PER_PAGE = 10
+
+
+class ObjectIdConvertor(Convertor):
+    regex = '[0-9a-fA-F]{24}'
+
+    def convert(self, value):
+        return value
+
+    def to_string(self, value):
+        return str(value)
+
+
+register_url_convertor('objectid', ObjectIdConvertor())
+
+
+def not_found():
+    return JSONResponse({'error': 'not found'}, status_code=404)
+
+
+class AsyncApi(object):
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        # 这里的接口都是只读的，与 read_router.queryset 使用相同的连接或读偏好
+        if read_router.alias:
+            settings, preference = flask_app.config['MONGODB_READ_SETTINGS'], None
+        else:
+            settings, preference = flask_app.config['MONGODB_SETTINGS'], read_router.read_preference
+        self.client = AsyncIOMotorClient(settings.get('host') or 'localhost', settings.get('port') or 27017,
+                                         **client_options(settings))
+        self.db = self.client.get_database(settings['db'], read_preference=preference)
+
+    def collection(self, document):
+        return self.db[document._get_collection_name()]
+
+    @staticmethod
+    async def query(request, awaitable):
+        ''' 等待一次 motor 查询，计入本请求的 X-DB-Queries / X-DB-Time '''
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            stats = request.state.db_stats
+            stats.count += 1
+            stats.time += (time.perf_counter() - started) * 1000
+
+    def endpoint(self, name, handler):
+        ''' 包装异步路由，代替 api 蓝本的 before_request/after_request 钩子 '''
+        logger = self.flask_app.logger
+        config = self.flask_app.config
+
+        async def wrapped(request):
+            started = time.perf_counter()
+            request.state.db_stats = stats = RequestStats()
+            if request_sampled(config):
+                args = {}
+                for key, value in request.query_params.multi_items():
+                    args.setdefault(key, []).append(value)
+                write_request(logger, config, request.client.host if request.client else None,
+                              request.method, request.url.path, args, b'')
+            metrics.in_flight.inc(name)
+            try:
+                response = await handler(request)
+            except Exception:
+                metrics.observe(name, request.method, 500, time.perf_counter() - started, 0, None)
+                raise
+            elapsed = time.perf_counter() - started
+            response.headers['X-DB-Queries'] = str(stats.count)
+            response.headers['X-DB-Time'] = '%.1f' % stats.time
+            length = response.headers.get('content-length')
+            metrics.observe(name, request.method, response.status_code, elapsed, 0,
+                            int(length) if length is not None else None)
+            write_response(logger, request.method, request.url.path, name, response.status_code,
+                           elapsed * 1000)
+            return response
+        return wrapped
+
+    def request_context(self, request):
+        ''' 由 ASGI 请求构造 Flask 的请求上下文，只包含 url_for 和路由匹配需要的 environ '''
+        server = request.scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'SCRIPT_NAME': request.scope.get('root_path', ''),
+            'PATH_INFO': request.url.path,
+            'QUERY_STRING': request.url.query,
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': 'HTTP/%s' % request.scope.get('http_version', '1.1'),
+            'REMOTE_ADDR': request.client.host if request.client else '',
+            'wsgi.url_scheme': request.url.scheme,
+            'wsgi.input': io.BytesIO(),
+            'wsgi.errors': sys.stderr,
+        }
+        if 'host' in request.headers:
+            environ['HTTP_HOST'] = request.headers['host']
+        return self.flask_app.request_context(environ)
+
+    def serialize(self, request, build):
+        ''' 在 Flask 的请求上下文中调用 build() '''
+        with self.request_context(request):
+            return build()
+
+    async def fetch_by_ids(self, request, document, ids, projection=None):
+        ids = list(set(ids))
+        if not ids:
+            return {}
+        sons = await self.query(request, self.collection(document).find({'_id': {'$in': ids}},
+                                                                         projection).to_list(None))
+        return {son['_id']: son for son in sons}
+
+    async def task_references(self, request, sons):
+        ''' 批量查出任务引用的车辆、司机和记录人 '''
+        def ids(field):
+            return [son[field] for son in sons if isinstance(son.get(field), ObjectId)]
+        return await asyncio.gather(
+            self.fetch_by_ids(request, Car, ids('car'), {'LicensePlate': True}),
+            self.fetch_by_ids(request, Driver, ids('driver'), {'Name': True}),
+            self.fetch_by_ids(request, User, ids('recorder'), {'name': True}))
+
+    @staticmethod
+    def build_task(son, cars, drivers, users):
+        task = Task._from_son(son)
+        for field, document, refs in (('car', Car, cars), ('driver', Driver, drivers),
+                                      ('recorder', User, users)):
+            ref = refs.get(son.get(field))
+            task._data[field] = document._from_son(ref) if ref is not None else None
+        return task
+
+    async def paginate(self, request, document, endpoint, key):
+        try:
+            page = int(request.query_params.get('page', 1))
+        except ValueError:
+            page = 1
+        if page < 1:
+            return not_found()
+        collection = self.collection(document)
+        total, sons = await asyncio.gather(
+            self.query(request, collection.count_documents({})),
+            self.query(request, collection.find().skip((page - 1) * PER_PAGE).limit(PER_PAGE)
+                       .to_list(PER_PAGE)))
+        if not sons and page != 1:
+            return not_found()
+        refs = await self.task_references(request, sons) if document is Task else None
+
+        def build():
+            if refs is not None:
+                items = [self.build_task(son, *refs) for son in sons]
+            else:
+                items = [document._from_son(son) for son in sons]
+            return {
+                key: [item.to_json() for item in items],
+                'prev': url_for(endpoint, page=page - 1) if page > 1 else None,
+                'next': url_for(endpoint, page=page + 1) if page * PER_PAGE < total else None,
+                'count': total
+            }
+        return JSONResponse(self.serialize(request, build))
+
+    async def get_one(self, request, document):
+        try:
+            oid = ObjectId(request.path_params['id'])
+        except (InvalidId, TypeError):
+            return not_found()
+        son = await self.query(request, self.collection(document).find_one({'_id': oid}))
+        if son is None:
+            return not_found()
+        refs = await self.task_references(request, [son]) if document is Task else None
+
+        def build():
+            if refs is not None:
+                return self.build_task(son, *refs).to_json()
+            return document._from_son(son).to_json()
+        return JSONResponse(self.serialize(request, build))
+
+    async def get_cars(self, request):
+        return await self.paginate(request, Car, 'api.get_cars', 'cars')
+
+    async def get_car(self, request):
+        return await self.get_one(request, Car)
+
+    async def get_drivers(self, request):
+        return await self.paginate(request, Driver, 'api.get_drivers', 'drivers')
+
+    async def get_driver(self, request):
+        return await self.get_one(request, Driver)
+
+    async def get_tasks(self, request):
+        return await self.paginate(request, Task, 'api.get_tasks', 'tasks')
+
+    async def get_task(self, request):
+        return await self.get_one(request, Task)
+
+    async def online_tasks_stream(self, request):
+        ''' 与 /tasks/online/stream 相同，每个连接只占用一个协程 '''
+        from .api.tasks import online_broadcaster, update_fleet
+        from .api.ghost_car import get_current_pos
+
+        def prepare():
+            with self.request_context(request):
+                update_fleet(len(get_current_pos()))
+        await run_in_threadpool(prepare)
+        q = online_broadcaster.subscribe_async()
+        return StreamingResponse(online_broadcaster.listen_async(q), media_type='text/event-stream',
+                                 headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    def routes(self, prefix='/api/v1'):
+        return [
+            Route(prefix + path, self.endpoint(name, handler), methods=['GET'])
+            for path, name, handler in (
+                ('/cars/', 'api.get_cars', self.get_cars),
+                ('/cars/{id:objectid}', 'api.get_car', self.get_car),
+                ('/drivers/', 'api.get_drivers', self.get_drivers),
+                ('/drivers/{id:objectid}', 'api.get_driver', self.get_driver),
+                ('/tasks/', 'api.get_tasks', self.get_tasks),
+                ('/tasks/online/stream', 'api.online_tasks_stream', self.online_tasks_stream),
+                ('/tasks/{id:objectid}', 'api.get_task', self.get_task),
+            )
+        ]
+
+
+def create_asgi_app(config_name):
+    flask_app = create_app(config_name)
+    api = AsyncApi(flask_app)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        # Flask 的调度器在第一个请求时启动，异步路由不经过 Flask，因此在这里启动
+        scheduler.start()
+        try:
+            yield
+        finally:
+            api.client.close()
+
+    routes = api.routes() + [Mount('/', app=WSGIMiddleware(flask_app))]
+    app = Starlette(routes=routes, lifespan=lifespan)
+    app.state.flask_app = flask_app
+    return app
@@ -0,0 +1,62 @@
+''' 已验证凭据（邮箱、密码）的短期缓存
+
+HTTP Basic 认证的每个请求都要做一次 check_password_hash（PBKDF2），轮询脚本会占满一个 CPU 核。
+这里用 SECRET_KEY 对 (email, password) 计算 HMAC 摘要作为键，缓存验证通过的结果
+CREDENTIAL_CACHE_TTL 秒，缓存中不保存明文密码。条目同时记录验证时的 password_hash，
+命中后与当前用户的 password_hash 比较，修改密码后旧条目自动失效。
+'''
+import hashlib
+import hmac
+import threading
+import time
+
+
+class CredentialCache(object):
+    def __init__(self, app=None):
+        self.ttl = 60
+        self.max_size = 10000
+        self._secret = b''
+        self._entries = {}   # digest -> (过期时间, user id, password_hash)
+        self._by_user = {}   # user id -> set(digest)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('CREDENTIAL_CACHE_TTL', self.ttl)
+        self.max_size = app.config.get('CREDENTIAL_CACHE_SIZE', self.max_size)
+        self._secret = app.config['SECRET_KEY'].encode('utf-8')
+
+    def digest(self, email, password):
+        message = email.encode('utf-8') + b'\0' + password.encode('utf-8')
+        return hmac.new(self._secret, message, hashlib.sha256).digest()
+
+    def lookup(self, digest):
+        ''' 返回 (user id, password_hash)，没有或已过期时返回 None '''
+        if self.ttl <= 0:
+            return None
+        entry = self._entries.get(digest)
+        if entry is None or entry[0] <= time.time():
+            return None
+        return entry[1], entry[2]
+
+    def add(self, digest, user):
+        if self.ttl <= 0:
+            return
+        user_id = str(user.id)
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                self._entries.clear()
+                self._by_user.clear()
+            self._entries[digest] = (time.time() + self.ttl, user_id, user.password_hash)
+            self._by_user.setdefault(user_id, set()).add(digest)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for digest in self._by_user.pop(str(user_id), ()):
+                self._entries.pop(digest, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
@@ -0,0 +1,180 @@
+''' 数据迁移（数据维护）框架
+
+模型中原有的维护函数（Task.update_is_return、Driver.merge_firstname_lastname_to_name、
+Driver.delete_all_drivers）逐个文档 save()/delete()，数据量大时非常慢。
+这里把它们改写为按 _id 顺序遍历游标、每批一次 bulk_write 的批量更新，
+每批结束后在 data_migrations 集合中记录检查点，中断后再次运行会从检查点继续。
+
+游标只取出 projection 中的字段，需要计算的新值（如拼接姓名、解析 DriverId）在 Python 中完成，
+只使用 MongoDB 3.6 就支持的更新操作，不依赖聚合管道更新（4.2+）或 $expr/$convert（4.0+）。
+'''
+import time
+from datetime import datetime
+
+from mongoengine.connection import get_db
+from pymongo import ASCENDING, DeleteMany, UpdateMany, UpdateOne
+
+from .models import Task, Driver
+
+
+CHECKPOINT_COLLECTION = 'data_migrations'
+
+
+class DataMigration(object):
+    ''' 一个按批执行的数据迁移。
+
+    子类需要给出 name、document（mongoengine Document 类），并实现 batch_operations，
+    为一批文档返回要执行的写操作列表。query 用于缩小需要遍历的文档范围，
+    projection 为计算写操作需要读取的字段（_id 总是包含在内）。
+    '''
+    name = None
+    description = ''
+    document = None
+    query = {}
+    projection = ()
+
+    def batch_operations(self, docs):
+        raise NotImplementedError
+
+    def collection(self):
+        return self.document._get_collection()
+
+
+class TaskIsReturnMigration(DataMigration):
+    ''' 根据 end_time 是否为空重新计算 is_return '''
+    name = 'task-is-return'
+    description = 'Set Task.is_return from end_time.'
+    document = Task
+
+    def batch_operations(self, docs):
+        ids = [doc['_id'] for doc in docs]
+        return [
+            UpdateMany({'_id': {'$in': ids}, 'end_time': {'$ne': None}},
+                       {'$set': {'is_return': True}}),
+            UpdateMany({'_id': {'$in': ids}, 'end_time': None},
+                       {'$set': {'is_return': False}}),
+        ]
+
+
+class DriverMergeNameMigration(DataMigration):
+    ''' 将 FirstName 和 LastName 融合为 Name，然后删除原先字段 '''
+    name = 'driver-merge-name'
+    description = 'Merge Driver.FirstName/LastName into Name and drop the old fields.'
+    document = Driver
+    query = {'$or': [{'Name': None},
+                     {'FirstName': {'$exists': True}},
+                     {'LastName': {'$exists': True}}]}
+    projection = ('Name', 'FirstName', 'LastName')
+
+    def batch_operations(self, docs):
+        operations = []
+        for doc in docs:
+            update = {'$unset': {'FirstName': '', 'LastName': ''}}
+            if doc.get('Name') is None:
+                # 与原来的实现相同：只拼接非空的部分
+                update['$set'] = {'Name': ' '.join(part for part in (doc.get('FirstName'), doc.get('LastName'))
+                                                   if part)}
+            operations.append(UpdateOne({'_id': doc['_id']}, update))
+        return operations
+
+
+def driver_number(driver_id):
+    try:
+        return int(driver_id)
+    except (TypeError, ValueError):
+        return 0
+
+
+class DeleteGeneratedDriversMigration(DataMigration):
+    ''' 删除 DriverId 大于 100000 的司机（随机生成的测试数据） '''
+    name = 'delete-generated-drivers'
+    description = 'Delete drivers whose numeric DriverId is greater than 100000.'
+    document = Driver
+    projection = ('DriverId',)
+
+    def batch_operations(self, docs):
+        ids = [doc['_id'] for doc in docs if driver_number(doc.get('DriverId')) > 100000]
+        return [DeleteMany({'_id': {'$in': ids}})] if ids else []
+
+
+migrations = {m.name: m for m in (TaskIsReturnMigration(),
+                                  DriverMergeNameMigration(),
+                                  DeleteGeneratedDriversMigration())}
+
+
+def checkpoints():
+    return get_db()[CHECKPOINT_COLLECTION]
+
+
+def reset_checkpoint(name):
+    checkpoints().delete_one({'_id': name})
+
+
+def run_migration(name, batch_size=1000, restart=False, log=print):
+    ''' 执行指定的迁移，返回处理的文档数和耗时。
+
+    文档按 _id 升序遍历，每 batch_size 个文档执行一次 bulk_write，并记录最后处理的 _id。
+    restart 为 True 时忽略已有的检查点，从头开始。
+    '''
+    migration = migrations.get(name)
+    if migration is None:
+        raise KeyError('unknown data migration: %s' % name)
+    if restart:
+        reset_checkpoint(name)
+
+    state = checkpoints().find_one({'_id': name}) or {}
+    if state.get('finished_at') and not restart:
+        log('%s: already finished at %s, use --restart to run again.' % (name, state['finished_at']))
+        return 0, 0.0
+
+    query = dict(migration.query)
+    if state.get('last_id') is not None:
+        query = {'$and': [query, {'_id': {'$gt': state['last_id']}}]}
+        log('%s: resuming after %s (%d documents done).' % (name, state['last_id'], state.get('processed', 0)))
+
+    collection = migration.collection()
+    projection = dict.fromkeys(('_id',) + tuple(migration.projection), True)
+    cursor = collection.find(query, projection=projection, sort=[('_id', ASCENDING)],
+                             batch_size=batch_size, no_cursor_timeout=True)
+    processed = state.get('processed', 0)
+    count = 0
+    started = time.time()
+    try:
+        docs = []
+        for doc in cursor:
+            docs.append(doc)
+            if len(docs) >= batch_size:
+                _apply_batch(migration, collection, docs, processed + count)
+                count += len(docs)
+                _report(log, name, count, started)
+                docs = []
+        if docs:
+            _apply_batch(migration, collection, docs, processed + count)
+            count += len(docs)
+    finally:
+        cursor.close()
+
+    elapsed = time.time() - started
+    checkpoints().update_one({'_id': name},
+                             {'$set': {'finished_at': datetime.utcnow()}},
+                             upsert=True)
+    log('%s: %d documents in %.2fs (%.0f docs/s).'
+        % (name, count, elapsed, count / elapsed if elapsed else 0))
+    return count, elapsed
+
+
+def _apply_batch(migration, collection, docs, processed):
+    operations = migration.batch_operations(docs)
+    if operations:
+        collection.bulk_write(operations, ordered=True)
+    checkpoints().update_one({'_id': migration.name},
+                             {'$set': {'last_id': docs[-1]['_id'],
+                                       'processed': processed + len(docs),
+                                       'updated_at': datetime.utcnow()},
+                              '$unset': {'finished_at': ''}},
+                             upsert=True)
+
+
+def _report(log, name, count, started):
+    elapsed = time.time() - started
+    log('%s: %d documents, %.0f docs/s' % (name, count, count / elapsed if elapsed else 0))
@@ -0,0 +1,184 @@
+''' MongoDB 命令监控：统计每个 Flask 请求执行的数据库命令
+
+通过 pymongo 的 CommandListener 记录每条命令的名称、集合、耗时和返回的文档数，
+计入当前请求（pymongo 在执行命令的线程中同步调用监听器）。
+响应中附带 X-DB-Queries / X-DB-Time（毫秒）头，单个请求的命令数超过
+DB_QUERY_WARN_THRESHOLD 时记录警告，便于发现 Task.to_json 中逐条解引用这类 N+1 查询。
+'''
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from pymongo import monitoring
+
+
+class RequestStats(object):
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0       # 毫秒
+        self.commands = []    # (命令名, 集合, 耗时毫秒, 返回文档数)
+        self.pending = {}     # request_id -> started 事件
+
+
+def _collection(event):
+    value = event.command.get(event.command_name)
+    return value if isinstance(value, str) else None
+
+
+def _documents(reply):
+    cursor = reply.get('cursor')
+    if isinstance(cursor, dict):
+        return len(cursor.get('firstBatch') or cursor.get('nextBatch') or ())
+    return reply.get('n', 0)
+
+
+class CommandMonitor(monitoring.CommandListener):
+    def __init__(self, app=None):
+        self.warn_threshold = 20
+        self._registered = False
+        self._observers = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        ''' 必须在创建 MongoClient（db.init_app）之前调用 '''
+        self.warn_threshold = app.config.get('DB_QUERY_WARN_THRESHOLD', self.warn_threshold)
+        if not self._registered:
+            monitoring.register(self)
+            self._registered = True
+        app.after_request(self._after_request)
+
+    def add_observer(self, observer):
+        ''' observer(started_event, succeeded_event) 在请求中每条命令成功后被调用，
+        多次 create_app 时同一个 observer 只登记一次
+        '''
+        if observer not in self._observers:
+            self._observers.append(observer)
+
+    @staticmethod
+    def stats():
+        ''' 当前请求的统计，不在请求中时返回 None '''
+        if not has_request_context():
+            return None
+        stats = g.get('_db_stats')
+        if stats is None:
+            stats = g._db_stats = RequestStats()
+        return stats
+
+    def started(self, event):
+        stats = self.stats()
+        if stats is not None:
+            stats.pending[event.request_id] = event
+
+    def succeeded(self, event):
+        stats = self.stats()
+        if stats is None:
+            return
+        started = stats.pending.pop(event.request_id, None)
+        duration = event.duration_micros / 1000.0
+        collection = _collection(started) if started is not None else None
+        stats.count += 1
+        stats.time += duration
+        stats.commands.append((event.command_name, collection, duration, _documents(event.reply)))
+        if started is not None:
+            for observer in self._observers:
+                observer(started, event)
+
+    def failed(self, event):
+        stats = self.stats()
+        if stats is None:
+            return
+        started = stats.pending.pop(event.request_id, None)
+        duration = event.duration_micros / 1000.0
+        stats.count += 1
+        stats.time += duration
+        stats.commands.append((event.command_name,
+                               _collection(started) if started is not None else None,
+                               duration, 0))
+
+    def _after_request(self, response):
+        # 没有执行数据库命令的请求同样输出 0
+        stats = g.get('_db_stats') or RequestStats()
+        response.headers['X-DB-Queries'] = str(stats.count)
+        response.headers['X-DB-Time'] = '%.1f' % stats.time
+        if self.warn_threshold and stats.count > self.warn_threshold:
+            summary = Counter('%s %s' % (name, collection) for name, collection, _, _ in stats.commands)
+            current_app.logger.warning(
+                'Too many DB queries: %s %s ran %d commands in %.1fms (%s)',
+                request.method, request.endpoint, stats.count, stats.time,
+                ', '.join('%s x%d' % item for item in summary.most_common(5)))
+        return response
+
+
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0)
+
+
+def _address(event):
+    host, port = event.address
+    return '%s:%s' % (host, port)
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    ''' 连接池监控：从开始获取连接到拿到连接的等待时间、获取失败次数（如 waitQueueTimeoutMS 超时）
+    以及当前借出的连接数，导出到 /metrics。等待时间持续偏高说明 maxPoolSize 不够用。
+    '''
+    def __init__(self):
+        self._registered = False
+        self._local = threading.local()
+        self.wait = None
+
+    def init_app(self, app, metrics):
+        ''' 必须在创建 MongoClient（db.init_app）之前调用 '''
+        if self._registered:
+            return
+        self.wait = metrics.histogram('nds_mongo_pool_wait_seconds',
+                                      'Time spent waiting for a pooled MongoDB connection.',
+                                      ('address',), POOL_WAIT_BUCKETS)
+        self.failures = metrics.counter('nds_mongo_pool_checkout_failures_total',
+                                        'Failed MongoDB connection checkouts by reason.',
+                                        ('address', 'reason'))
+        self.checked_out = metrics.gauge('nds_mongo_pool_checked_out',
+                                         'MongoDB connections currently checked out.', ('address',))
+        self.connections = metrics.gauge('nds_mongo_pool_connections',
+                                         'Open MongoDB connections.', ('address',))
+        monitoring.register(self)
+        self._registered = True
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        started = getattr(self._local, 'started', None)
+        if started is not None:
+            self._local.started = None
+            self.wait.observe(_address(event), value=time.perf_counter() - started)
+        self.checked_out.inc(_address(event))
+
+    def connection_check_out_failed(self, event):
+        self._local.started = None
+        self.failures.inc(_address(event), str(event.reason))
+
+    def connection_checked_in(self, event):
+        self.checked_out.dec(_address(event))
+
+    def connection_created(self, event):
+        self.connections.inc(_address(event))
+
+    def connection_closed(self, event):
+        self.connections.dec(_address(event))
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
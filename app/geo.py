@@ -0,0 +1,89 @@
+''' 在线车辆位置的网格索引
+
+把经纬度按 cell_size 度划分网格，各点按网格编号排序保存（类似 CSR 结构），
+矩形范围查询只需对覆盖到的每一列网格做一次 searchsorted，再精确过滤候选点；
+圆形范围（near + radius）先按外接矩形取候选点，再按球面距离过滤。
+'''
+import numpy as np
+
+EARTH_RADIUS = 6371008.8
+METERS_PER_DEGREE_LAT = 110574.0
+ROW_SPAN = 1 << 20  # 每列网格的编号空间，纬度方向的网格数不会超过它
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + \
+        np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+class GridIndex(object):
+    def __init__(self, lon, lat, cell_size=0.01, max_columns=256):
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.cell_size = cell_size
+        self.max_columns = max_columns
+        keys = self._key(self._column(self.lon), self._row(self.lat))
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    def __len__(self):
+        return len(self.lon)
+
+    def _column(self, lon):
+        return np.floor((np.asarray(lon) + 180.0) / self.cell_size).astype(np.int64)
+
+    def _row(self, lat):
+        return np.floor((np.asarray(lat) + 90.0) / self.cell_size).astype(np.int64)
+
+    @staticmethod
+    def _key(column, row):
+        return column * ROW_SPAN + row
+
+    def bbox(self, min_lon, min_lat, max_lon, max_lat):
+        ''' 矩形范围内的点的下标 '''
+        if not len(self):
+            return np.empty(0, dtype=np.int64)
+        first, last = int(self._column(min_lon)), int(self._column(max_lon))
+        row0, row1 = int(self._row(min_lat)), int(self._row(max_lat))
+        if last - first + 1 > self.max_columns:
+            # 范围太大时直接全量过滤更快
+            candidates = np.arange(len(self))
+        else:
+            columns = np.arange(first, last + 1, dtype=np.int64)
+            starts = np.searchsorted(self.keys, self._key(columns, row0), side='left')
+            stops = np.searchsorted(self.keys, self._key(columns, row1), side='right')
+            if not len(starts) or not (stops - starts).any():
+                return np.empty(0, dtype=np.int64)
+            candidates = self.order[np.concatenate([np.arange(a, b) for a, b in zip(starts, stops)])]
+        lon, lat = self.lon[candidates], self.lat[candidates]
+        inside = (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+        return np.sort(candidates[inside])
+
+    def near(self, lon, lat, radius):
+        ''' 距 (lon, lat) 不超过 radius 米的点的下标，按距离由近到远排列 '''
+        dlat = radius / METERS_PER_DEGREE_LAT
+        dlon = dlat / max(np.cos(np.radians(lat)), 1e-6)
+        candidates = self.bbox(lon - dlon, lat - dlat, lon + dlon, lat + dlat)
+        distances = haversine(lon, lat, self.lon[candidates], self.lat[candidates])
+        inside = distances <= radius
+        candidates, distances = candidates[inside], distances[inside]
+        order = np.argsort(distances, kind='stable')
+        return candidates[order], distances[order]
+
+
+def parse_bbox(value):
+    ''' "minlon,minlat,maxlon,maxlat" '''
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4 or parts[0] > parts[2] or parts[1] > parts[3]:
+        raise ValueError('bbox must be minlon,minlat,maxlon,maxlat')
+    return parts
+
+
+def parse_point(value):
+    ''' "lon,lat" '''
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 2 or not -180 <= parts[0] <= 180 or not -90 <= parts[1] <= 90:
+        raise ValueError('near must be lon,lat')
+    return parts
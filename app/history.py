@@ -0,0 +1,63 @@
+''' 在线车辆最近位置的环形缓冲区
+
+每次 tick 所有车辆的位置作为一行写入固定大小的数组（capacity 行 × 车辆数 × 2，int32，单位 1e-6 度），
+时间戳所有车辆共用一列。写入只覆盖最旧的一行，O(1)；按时间窗口读取时先用 searchsorted
+找到起始行，再一次取出所需车辆的所有点，不为单个点创建 Python 对象。
+'''
+import threading
+
+import numpy as np
+
+COORD_SCALE = 1000000
+
+
+class RingBuffer(object):
+    def __init__(self, capacity=150):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.points = None
+        self.count = 0  # 累计写入的行数
+        self._lock = threading.Lock()
+
+    def resize(self, capacity):
+        ''' 修改保留的行数（按 app.config 设置），已记录的位置被清空 '''
+        with self._lock:
+            if capacity != self.capacity:
+                self.capacity = capacity
+                self.times = np.zeros(capacity, dtype=np.float64)
+                self.points = None
+                self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, positions, when):
+        ''' positions 为 (车辆数, 2) 的经纬度数组，when 为 UNIX 时间戳 '''
+        points = np.round(np.asarray(positions, dtype=np.float64) * COORD_SCALE).astype(np.int32)
+        with self._lock:
+            if self.points is None or self.points.shape[1:] != points.shape:
+                # 车辆数变化时重新开始记录
+                self.points = np.zeros((self.capacity,) + points.shape, dtype=np.int32)
+                self.count = 0
+            slot = self.count % self.capacity
+            self.points[slot] = points
+            self.times[slot] = when
+            self.count += 1
+
+    def window(self, since, indices=None):
+        ''' 返回 since 之后的 (times, positions)：times 按时间先后排列，
+        positions 的形状为 (车辆数, 点数, 2)，indices 为要读取的车辆下标（默认全部）
+        '''
+        with self._lock:
+            size = len(self)
+            if not size:
+                return np.empty(0), np.empty((0 if indices is None else len(indices), 0, 2))
+            rows = np.arange(self.count - size, self.count) % self.capacity
+            start = np.searchsorted(self.times[rows], since, side='left')
+            rows = rows[start:]
+            times = self.times[rows]
+            if indices is None:
+                points = self.points[rows]
+            else:
+                points = self.points[np.ix_(rows, np.asarray(indices, dtype=np.int64))]
+        return times, points.transpose(1, 0, 2) / float(COORD_SCALE)
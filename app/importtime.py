@@ -0,0 +1,61 @@
+''' 应用启动耗时报告（manage.py importtime）
+
+在子进程中以 python -X importtime 导入 app 并调用 create_app，得到每个模块的导入耗时
+（self 为模块本身，cumulative 包括它导入的其他模块）以及从导入到 create_app 返回的总耗时。
+--budget 设置总耗时的上限（毫秒），超过时返回非零退出码，可以放在 CI 中防止启动时间退化。
+'''
+import os
+import re
+import subprocess
+import sys
+
+LINE_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = '\n'.join([
+    'import sys, time',
+    'started = time.perf_counter()',
+    'from app import create_app',
+    'create_app(sys.argv[1], profile=sys.argv[2])',
+    "print('create_app %.1f' % ((time.perf_counter() - started) * 1000))",
+])
+
+
+def measure(config_name, profile):
+    ''' 返回 (总耗时毫秒, [(模块, self 毫秒, cumulative 毫秒, 层级), ...]) '''
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', SCRIPT, config_name, profile],
+                            cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    if result.returncode:
+        raise RuntimeError('create_app failed:\n' + result.stderr[-2000:])
+    modules = []
+    for line in result.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if match:
+            modules.append((match.group(4), int(match.group(1)) / 1000.0,
+                            int(match.group(2)) / 1000.0, (len(match.group(3)) - 1) // 2))
+    totals = [line for line in result.stdout.splitlines() if line.startswith('create_app ')]
+    return float(totals[-1].split()[1]), modules
+
+
+def report(config_name, profiles=('full', 'api'), top=15, budget=None, log=print):
+    exceeded = False
+    for profile in profiles:
+        total, modules = measure(config_name, profile)
+        log("profile '%s': create_app ready in %.1fms, %d modules imported" % (profile, total, len(modules)))
+        log('  slowest top-level imports (cumulative ms):')
+        roots = sorted((module for module in modules if module[3] == 0), key=lambda module: module[2],
+                       reverse=True)
+        for name, _, cumulative, _ in roots[:top]:
+            log('  %10.1f  %s' % (cumulative, name))
+        log('  app modules (self ms):')
+        own = sorted((module for module in modules if module[0] == 'app' or module[0].startswith('app.')),
+                     key=lambda module: module[1], reverse=True)
+        for name, self_ms, _, _ in own[:top]:
+            log('  %10.1f  %s' % (self_ms, name))
+        if budget is not None and total > budget:
+            log('  over budget: %.1fms > %.1fms' % (total, budget))
+            exceeded = True
+        log('')
+    return 1 if exceeded else 0
@@ -0,0 +1,76 @@
+''' 用户最后访问时间（last_seen）的缓冲记录
+
+User.ping() 原本每次请求都 save() 整个用户文档。这里改为只在内存中记录每个用户最近一次
+访问的时间，由后台定时任务每隔 LAST_SEEN_FLUSH_INTERVAL 秒用一次 bulk_write（$max 更新）
+写回数据库，请求线程中不访问数据库。在线用户列表直接由内存中的记录给出（仅包含本进程见过的请求）。
+'''
+import atexit
+import threading
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+
+class LastSeenTracker(object):
+    def __init__(self, app=None):
+        self.online_window = 300
+        self._seen = {}      # user id -> 最近访问时间，进程内全部用户
+        self._pending = {}   # user id -> 尚未写回数据库的访问时间
+        self._lock = threading.Lock()
+        self._atexit_registered = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.online_window = app.config.get('ONLINE_USER_WINDOW', self.online_window)
+        # 多次 init_app（如测试中多次 create_app）时只注册一次
+        if not self._atexit_registered:
+            atexit.register(self.flush)
+            self._atexit_registered = True
+
+    def ping(self, user_id, when=None):
+        when = when or datetime.utcnow()
+        with self._lock:
+            self._seen[user_id] = when
+            self._pending[user_id] = when
+
+    def flush(self):
+        ''' 把缓冲的访问时间一次写回数据库，返回更新的用户数 '''
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        from .models import User
+        requests = [UpdateOne({'_id': user_id}, {'$max': {'last_seen': when}})
+                    for user_id, when in pending.items()]
+        try:
+            User._get_collection().bulk_write(requests, ordered=False)
+        except Exception:
+            # 写入失败时放回缓冲区，等待下次写回（保留较新的时间）
+            with self._lock:
+                for user_id, when in pending.items():
+                    if self._pending.get(user_id, when) <= when:
+                        self._pending[user_id] = when
+            raise
+        return len(requests)
+
+    def last_seen(self, user_id):
+        return self._seen.get(user_id)
+
+    def online_users(self, window=None):
+        ''' 返回最近 window 秒内访问过的用户，按时间倒序排列的 (user id, 时间) 列表
+
+        window 不能超过 ONLINE_USER_WINDOW，更早的记录已被清理。
+        '''
+        if not window or window > self.online_window:
+            window = self.online_window
+        now = datetime.utcnow()
+        expired = now - timedelta(seconds=self.online_window)
+        since = now - timedelta(seconds=window)
+        with self._lock:
+            # 顺便清理超出 ONLINE_USER_WINDOW 的记录，避免字典无限增长
+            recent = [(user_id, when) for user_id, when in self._seen.items() if when >= expired]
+            if len(recent) < len(self._seen):
+                self._seen = dict(recent)
+        online = [(user_id, when) for user_id, when in recent if when >= since]
+        return sorted(online, key=lambda item: item[1], reverse=True)
@@ -0,0 +1,148 @@
+''' 日志：请求线程只把日志记录放入队列，由监听器写入 nds.log
+
+LOG_LISTENER = 'thread'：本进程内的后台线程写文件（开发服务器）。
+LOG_LISTENER = 'process'：由单独的监听进程写文件。应用在父进程中创建（预加载）后再 fork 出的
+多个 worker 共享同一个队列和监听进程，只有一个进程负责写入和轮转日志文件，轮转时不会互相破坏。
+每个进程只创建一个监听器：多次 create_app（测试、manage.py serve --no-preload 的 worker）时复用已有的
+监听器和 QueueHandler，不会重复写日志；日志配置不同时先停止原来的监听器。
+'''
+import atexit
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import current_app, g, request
+
+LOG_FORMAT = "[%(asctime)s] {%(pathname)s:%(lineno)d} %(levelname)s - %(message)s"
+
+
+def _file_handler(config):
+    handler = RotatingFileHandler(config.get('LOG_FILE', 'nds.log'),
+                                  maxBytes=config.get('LOG_MAX_BYTES', 10000000),
+                                  backupCount=config.get('LOG_BACKUP_COUNT', 5))
+    handler.setLevel(logging.INFO)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return handler
+
+
+def _listen(log_queue, config):
+    ''' 监听进程：从队列中取出日志记录写入文件，收到 None 时退出 '''
+    handler = _file_handler(config)
+    while True:
+        try:
+            record = log_queue.get()
+        except (EOFError, OSError):
+            break
+        if record is None:
+            break
+        handler.handle(record)
+    handler.close()
+
+
+def _start_thread_listener(config):
+    log_queue = queue.Queue(-1)
+    listener = QueueListener(log_queue, _file_handler(config), respect_handler_level=True)
+    listener.start()
+    return log_queue, listener
+
+
+# 本进程的监听器，每个进程只有一个；多次 create_app 时复用，日志配置变化时才重新创建
+_listener = {}
+_hooks_installed = []
+
+
+def _start_listener(mode, config):
+    if mode == 'process':
+        log_queue = multiprocessing.Queue(-1)
+        process = multiprocessing.Process(target=_listen, args=(log_queue, config),
+                                          name='nds-log-listener', daemon=True)
+        process.start()
+        return {'process': process, 'handler': QueueHandler(log_queue)}
+    log_queue, listener = _start_thread_listener(config)
+    return {'thread': listener, 'handler': QueueHandler(log_queue)}
+
+
+def _stop_listener():
+    if 'thread' in _listener:
+        _listener['thread'].stop()
+    elif 'process' in _listener and os.getpid() == _listener['owner']:
+        # 只有创建监听进程的进程负责停止它，fork 出的 worker 退出时不影响其他 worker
+        _listener['handler'].queue.put(None)
+        _listener['process'].join(5)
+    for logger in _listener.get('loggers', ()):
+        logger.removeHandler(_listener['handler'])
+    _listener.clear()
+
+
+def _restart_after_fork():
+    # fork 后子进程中没有监听线程，重新创建队列和监听线程；监听进程则由各 worker 共享
+    if 'thread' in _listener:
+        _listener['handler'].queue, _listener['thread'] = _start_thread_listener(_listener['config'])
+
+
+def _install_hooks():
+    ''' 注册退出和 fork 后的处理，多次调用只注册一次 '''
+    if _hooks_installed:
+        return
+    atexit.register(_stop_listener)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_restart_after_fork)
+    _hooks_installed.append(True)
+
+
+def init_logging(app):
+    config = {key: app.config.get(key) for key in
+              ('LOG_FILE', 'LOG_MAX_BYTES', 'LOG_BACKUP_COUNT') if app.config.get(key)}
+    mode = 'process' if app.config.get('LOG_LISTENER') == 'process' else 'thread'
+    key = (mode, sorted(config.items()))
+    if _listener.get('key') != key:
+        _stop_listener()
+        _listener.update(_start_listener(mode, config), key=key, config=config,
+                         owner=os.getpid(), loggers=[])
+        _listener['handler'].setLevel(logging.INFO)
+        _install_hooks()
+    handler = _listener['handler']
+    if handler not in app.logger.handlers:
+        app.logger.addHandler(handler)
+        _listener['loggers'].append(app.logger)
+    app.logger.setLevel(logging.INFO)
+    return handler
+
+
+def request_sampled(config):
+    return random.random() < config.get('LOG_REQUEST_SAMPLE_RATE', 1.0)
+
+
+def write_request(logger, config, remote_addr, method, path, args, body):
+    ''' 请求行的格式，ASGI 服务器（app/asgi.py）也使用它，manage.py logstats 解析这种格式 '''
+    limit = config.get('LOG_BODY_MAX', 1024)
+    if len(body) > limit:
+        body = body[:limit] + b'...(%d bytes)' % len(body)
+    logger.info('Request: %s %s %s args=%s body=%s', remote_addr, method, path, args, body)
+
+
+def write_response(logger, method, path, endpoint, status, ms):
+    logger.info('Response: %s %s %s %d %.1fms', method, path, endpoint, status, ms)
+
+
+def log_request():
+    ''' 记录请求信息。按 LOG_REQUEST_SAMPLE_RATE 采样，请求体最多记录 LOG_BODY_MAX 字节 '''
+    g._log_start = time.perf_counter()
+    config = current_app.config
+    if not request_sampled(config):
+        return
+    write_request(current_app.logger, config, request.remote_addr, request.method, request.path,
+                  request.args.to_dict(flat=False), request.get_data(cache=True))
+
+
+def log_response(response):
+    ''' 记录响应状态和耗时，供 manage.py logstats 统计各接口延迟（不采样） '''
+    start = g.pop('_log_start', None)
+    if start is not None:
+        write_response(current_app.logger, request.method, request.path, request.endpoint,
+                       response.status_code, (time.perf_counter() - start) * 1000)
+    return response
@@ -0,0 +1,263 @@
+''' nds.log 日志统计（manage.py logstats）
+
+逐行流式读取（包括 .gz 压缩的）轮转日志文件，一次遍历得到：
+- 各接口的请求数、状态码分布和延迟百分位（来自 "Response:" 行）；
+- 出现最多的查询参数模式（来自 "Request:" 行，如 GET /api/v1/tasks/search/ ?car&page）。
+旧版本的日志只有 "Address: ... Methods: GET" 和 "Args: ImmutableMultiDict([...])" 行，没有路径、
+状态码和耗时，这些请求只按方法和参数名单独统计，不计入接口延迟，也不导出到流量模型中。
+延迟用固定的对数分桶直方图统计，参数模式用 Space-Saving 算法只保留固定数量的候选，
+内存占用与日志大小无关。统计结果可以导出为 JSON 格式的流量模型，供压力测试回放。
+'''
+import ast
+import glob
+import gzip
+import json
+import math
+import os
+import re
+from collections import Counter
+from datetime import datetime
+from urllib.parse import urlencode
+
+LINE_RE = re.compile(r'^\[(?P<time>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),\d+\] \{.*?\} \w+ - (?P<message>.*)$')
+REQUEST_RE = re.compile(r'^Request: (?P<addr>\S+) (?P<method>[A-Z]+) (?P<path>\S+) args=(?P<args>\{.*?\}) body=')
+RESPONSE_RE = re.compile(r'^Response: (?P<method>[A-Z]+) (?P<path>\S+) (?P<endpoint>\S+) (?P<status>\d+) (?P<ms>[\d.]+)ms$')
+# 旧格式的日志
+LEGACY_ADDRESS_RE = re.compile(r'^Address: (?P<addr>\S+)\s+Methods: (?P<method>[A-Z]+)$')
+LEGACY_ARGS_RE = re.compile(r'^(?:Args: )?ImmutableMultiDict\((?P<args>\[.*\])\)$')
+
+# 延迟直方图：0.1ms 到约 100s，每个桶宽度为 10%
+BUCKET_BASE = 0.1
+BUCKET_RATIO = 1.1
+BUCKET_COUNT = 146
+
+
+class LatencyHistogram(object):
+    def __init__(self):
+        self.counts = [0] * (BUCKET_COUNT + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        if ms <= BUCKET_BASE:
+            index = 0
+        else:
+            index = min(BUCKET_COUNT, int(math.log(ms / BUCKET_BASE, BUCKET_RATIO)) + 1)
+        self.counts[index] += 1
+        self.total += 1
+        self.sum += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p):
+        ''' 近似的百分位（取所在桶的上界，误差不超过 10%） '''
+        if not self.total:
+            return None
+        rank = p / 100.0 * self.total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.max, BUCKET_BASE * BUCKET_RATIO ** index)
+        return self.max
+
+
+class SpaceSaving(object):
+    ''' 近似 Top-K 计数，最多保留 capacity 个键 '''
+    def __init__(self, capacity=200):
+        self.capacity = capacity
+        self.counts = {}
+        self.examples = {}
+
+    def add(self, key, example=None):
+        if key in self.counts:
+            self.counts[key] += 1
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[key] = 1
+        else:
+            # 替换计数最小的键，新键继承其计数（可能高估）
+            smallest = min(self.counts, key=self.counts.get)
+            self.counts[key] = self.counts.pop(smallest) + 1
+            self.examples.pop(smallest, None)
+        self.examples[key] = example
+
+    def top(self, k):
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+class EndpointStats(object):
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.latency = LatencyHistogram()
+        self.statuses = Counter()
+
+
+class LogStats(object):
+    def __init__(self, top_capacity=200):
+        self.endpoints = {}
+        self.patterns = SpaceSaving(top_capacity)
+        self.legacy_patterns = SpaceSaving(top_capacity)
+        self.requests = 0
+        self.legacy_requests = 0
+        self._legacy_method = None   # 上一个 Address 行的方法，等待对应的 Args 行
+        self.lines = 0
+        self.first = None
+        self.last = None
+
+    def add_line(self, line):
+        self.lines += 1
+        match = LINE_RE.match(line)
+        if not match:
+            return
+        message = match.group('message')
+        if message.startswith('Response: '):
+            self._add_response(message)
+        elif message.startswith('Request: '):
+            self._add_request(message)
+        elif not self._add_legacy(message):
+            return
+        when = match.group('time')
+        if self.first is None or when < self.first:
+            self.first = when
+        if self.last is None or when > self.last:
+            self.last = when
+
+    def _add_response(self, message):
+        match = RESPONSE_RE.match(message)
+        if not match:
+            return
+        key = (match.group('method'), match.group('endpoint'))
+        stats = self.endpoints.get(key)
+        if stats is None:
+            stats = self.endpoints[key] = EndpointStats(match.group('method'), match.group('path'))
+        stats.latency.add(float(match.group('ms')))
+        stats.statuses[match.group('status')] += 1
+
+    def _add_request(self, message):
+        match = REQUEST_RE.match(message)
+        if not match:
+            return
+        self.requests += 1
+        try:
+            args = ast.literal_eval(match.group('args'))
+        except (ValueError, SyntaxError):
+            args = {}
+        pattern = '%s %s' % (match.group('method'), match.group('path'))
+        if args:
+            pattern += ' ?' + '&'.join(sorted(args))
+        query = urlencode([(key, value) for key, values in sorted(args.items()) for value in values])
+        self.patterns.add(pattern, match.group('path') + ('?' + query if query else ''))
+
+    def _add_legacy(self, message):
+        ''' 旧格式：Address 行开始一个请求，随后的 Args 行给出参数（更早的日志只有 Args 行） '''
+        match = LEGACY_ADDRESS_RE.match(message)
+        if match:
+            self.requests += 1
+            self.legacy_requests += 1
+            self._legacy_method = match.group('method')
+            return True
+        match = LEGACY_ARGS_RE.match(message)
+        if not match:
+            return False
+        method, self._legacy_method = self._legacy_method, None
+        if method is None:
+            self.requests += 1
+            self.legacy_requests += 1
+        try:
+            args = sorted(set(key for key, _ in ast.literal_eval(match.group('args'))))
+        except (ValueError, SyntaxError, TypeError):
+            args = []
+        pattern = method or '-'
+        if args:
+            pattern += ' ?' + '&'.join(args)
+        self.legacy_patterns.add(pattern)
+        return True
+
+    def add_file(self, path):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                self.add_line(line.rstrip('\n'))
+
+    def duration(self):
+        if not self.first or not self.last:
+            return 0
+        fmt = '%Y-%m-%d %H:%M:%S'
+        return (datetime.strptime(self.last, fmt) - datetime.strptime(self.first, fmt)).total_seconds()
+
+    def report(self, top=20):
+        lines = ['%d log lines, %d sampled requests (%d in the legacy format), %s .. %s'
+                 % (self.lines, self.requests, self.legacy_requests, self.first, self.last), '']
+        lines.append('%-7s %-36s %8s %9s %9s %9s %9s  %s'
+                     % ('method', 'endpoint', 'count', 'p50(ms)', 'p95(ms)', 'p99(ms)', 'max(ms)', 'status'))
+        rows = sorted(self.endpoints.items(), key=lambda item: item[1].latency.total, reverse=True)
+        for (method, endpoint), stats in rows:
+            histogram = stats.latency
+            lines.append('%-7s %-36s %8d %9.1f %9.1f %9.1f %9.1f  %s' % (
+                method, endpoint, histogram.total, histogram.percentile(50),
+                histogram.percentile(95), histogram.percentile(99), histogram.max,
+                ' '.join('%s:%d' % item for item in sorted(stats.statuses.items()))))
+        lines.extend(['', 'Top query patterns:'])
+        for pattern, count in self.patterns.top(top):
+            lines.append('%8d  %s' % (count, pattern))
+        if self.legacy_requests:
+            lines.extend(['', 'Legacy request lines (Address:/Args:) record no path, status or latency;',
+                          'they are not included in the endpoint table or the traffic profile.',
+                          'Top legacy argument patterns (method ?args):'])
+            for pattern, count in self.legacy_patterns.top(top):
+                lines.append('%8d  %s' % (count, pattern))
+        return '\n'.join(lines)
+
+    def traffic_profile(self, top=50):
+        ''' 流量模型：总请求速率、各接口占比，以及可直接回放的请求示例及其权重 '''
+        duration = self.duration()
+        total = sum(stats.latency.total for stats in self.endpoints.values())
+        patterns = self.patterns.top(top)
+        pattern_total = float(sum(count for _, count in patterns)) or 1.0
+        return {
+            'start': self.first,
+            'end': self.last,
+            'duration_seconds': duration,
+            'total_requests': total,
+            'requests_per_second': total / duration if duration else None,
+            'endpoints': [{
+                'method': method,
+                'endpoint': endpoint,
+                'path': stats.path,
+                'weight': stats.latency.total / float(total) if total else 0,
+                'p50_ms': stats.latency.percentile(50),
+                'p95_ms': stats.latency.percentile(95),
+            } for (method, endpoint), stats in sorted(self.endpoints.items())],
+            'requests': [{
+                'method': pattern.split(' ', 1)[0],
+                'pattern': pattern,
+                'example': self.patterns.examples.get(pattern),
+                'weight': count / pattern_total,
+            } for pattern, count in patterns],
+        }
+
+
+def log_files(pattern):
+    ''' 按从旧到新的顺序返回轮转日志文件：nds.log.5 ... nds.log.1, nds.log '''
+    def rotation(path):
+        suffix = os.path.basename(path).split('.log', 1)[-1].replace('.gz', '').lstrip('.')
+        return -int(suffix) if suffix.isdigit() else 0
+    return sorted(glob.glob(pattern), key=rotation)
+
+
+def analyze(pattern, top=20, export=None, log=print):
+    stats = LogStats()
+    files = log_files(pattern)
+    if not files:
+        log('No log files match %s' % pattern)
+        return stats
+    for path in files:
+        stats.add_file(path)
+    log(stats.report(top))
+    if export:
+        with open(export, 'w') as f:
+            json.dump(stats.traffic_profile(), f, indent=2, ensure_ascii=False)
+        log('\nTraffic profile written to %s' % export)
+    return stats
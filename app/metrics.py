@@ -0,0 +1,282 @@
+''' 按接口统计的延迟、吞吐量指标，以 Prometheus 文本格式在 /metrics 输出
+
+统计 api 和 auth 蓝本中每个 endpoint（如 api.search_tasks）的请求延迟直方图、请求/响应大小、
+按状态码的请求数以及正在处理的请求数。指标保存在本进程内存中，
+每次记录只是几次加法，可以在生产环境中常开。
+
+多进程部署（manage.py serve 的多个 worker）时，每次抓取 /metrics 由任意一个 worker 响应，
+只输出本进程的计数会在两次抓取之间倒退。配置 METRICS_MULTIPROC_DIR 后，各进程每隔
+METRICS_DUMP_INTERVAL 秒（以及退出时）把自己的指标写入该目录中的文件，/metrics 输出本进程的实时值
+与其他进程文件之和：计数器和直方图包括已退出的进程，gauge 只统计仍在运行的进程。
+其他进程的值最多落后 METRICS_DUMP_INTERVAL 秒，但每一项都只增不减。register_collector 登记的统计
+（如 user_cache）仍然只是响应请求的进程自己的值。
+'''
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, request
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                             for name, value in zip(names, values))
+
+
+class Counter(object):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, values, other):
+        ''' 把另一个进程的值加到 values 中 '''
+        for labels, value in other.items():
+            values[labels] = values.get(labels, 0) + value
+
+    def samples(self, values=None):
+        values = self._values if values is None else values
+        for labels, value in sorted(values.items()):
+            yield self.name, _labels(self.label_names, labels), value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(object):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}   # labels -> [各个桶的计数..., +Inf 计数, 总和]
+        self._lock = threading.Lock()
+
+    def observe(self, *labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return dict((labels, list(counts)) for labels, counts in self._values.items())
+
+    def merge(self, values, other):
+        for labels, counts in other.items():
+            if labels in values:
+                values[labels] = [a + b for a, b in zip(values[labels], counts)]
+            else:
+                values[labels] = list(counts)
+
+    def samples(self, values=None):
+        values = self._values if values is None else values
+        names = self.label_names + ('le',)
+        for labels, counts in sorted(values.items()):
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                total += count
+                yield self.name + '_bucket', _labels(names, labels + (bound,)), total
+            yield self.name + '_sum', _labels(self.label_names, labels), counts[-1]
+            yield self.name + '_count', _labels(self.label_names, labels), total
+
+
+class Metrics(object):
+    def __init__(self, app=None):
+        self.blueprints = ('api', 'auth')
+        self.multiproc_dir = None
+        self._metrics = []
+        self._collectors = []
+        self._dump_file = None   # (pid, 本进程的指标文件)
+        self._atexit_registered = False
+        self.requests = self.counter('nds_http_requests_total',
+                                     'HTTP requests by endpoint, method and status.',
+                                     ('endpoint', 'method', 'status'))
+        self.latency = self.histogram('nds_http_request_duration_seconds',
+                                      'HTTP request latency by endpoint.', ('endpoint',))
+        self.request_size = self.histogram('nds_http_request_size_bytes',
+                                           'HTTP request body size by endpoint.',
+                                           ('endpoint',), SIZE_BUCKETS)
+        self.response_size = self.histogram('nds_http_response_size_bytes',
+                                            'HTTP response body size by endpoint.',
+                                            ('endpoint',), SIZE_BUCKETS)
+        self.in_flight = self.gauge('nds_http_requests_in_flight',
+                                    'HTTP requests currently being handled.', ('endpoint',))
+        if app is not None:
+            self.init_app(app)
+
+    def counter(self, name, documentation, labels=()):
+        metric = Counter(name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, documentation, labels=()):
+        metric = Gauge(name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        ''' collector() 在每次输出时被调用，返回 (名称, 类型, 说明, 值) 列表，用于导出其他模块的统计。
+        多次 create_app 时同一个 collector 只登记一次
+        '''
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def init_app(self, app):
+        self.blueprints = tuple(app.config.get('METRICS_BLUEPRINTS', self.blueprints))
+        self.multiproc_dir = app.config.get('METRICS_MULTIPROC_DIR')
+        if self.multiproc_dir:
+            os.makedirs(self.multiproc_dir, exist_ok=True)
+            if not self._atexit_registered:
+                atexit.register(self.dump)
+                self._atexit_registered = True
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self.render)
+
+    def _before_request(self):
+        if request.blueprint not in self.blueprints:
+            return
+        g._metrics_start = time.perf_counter()
+        self.in_flight.inc(request.endpoint)
+
+    def _after_request(self, response):
+        start = g.pop('_metrics_start', None)
+        if start is None:
+            return response
+        self.observe(request.endpoint, request.method, response.status_code, time.perf_counter() - start,
+                     request.content_length, response.content_length)
+        return response
+
+    def observe(self, endpoint, method, status, seconds, request_size, response_size):
+        ''' 记录一个已完成的请求（ASGI 服务器的异步路由也调用它），in_flight 减一 '''
+        self.latency.observe(endpoint, value=seconds)
+        self.requests.inc(endpoint, method, status)
+        self.request_size.observe(endpoint, value=request_size or 0)
+        if response_size is not None:
+            self.response_size.observe(endpoint, value=response_size)
+        self.in_flight.dec(endpoint)
+
+    def _teardown_request(self, exc):
+        # 未处理的异常不会经过 after_request，这里补记
+        start = g.pop('_metrics_start', None)
+        if start is None:
+            return
+        endpoint = request.endpoint
+        self.latency.observe(endpoint, value=time.perf_counter() - start)
+        self.requests.inc(endpoint, request.method, 500)
+        self.in_flight.dec(endpoint)
+
+    def _path(self):
+        pid = os.getpid()
+        if self._dump_file is None or self._dump_file[0] != pid:
+            # 文件名包含启动时间，进程号被复用时不会覆盖已退出进程的计数
+            self._dump_file = (pid, os.path.join(self.multiproc_dir,
+                                                 'metrics-%d-%d.json' % (pid, time.time_ns())))
+        return self._dump_file[1]
+
+    def dump(self):
+        ''' 多进程模式下把本进程的指标写入 METRICS_MULTIPROC_DIR（定时任务和退出时调用） '''
+        if not self.multiproc_dir:
+            return
+        state = {metric.name: [[list(labels), value] for labels, value in metric.snapshot().items()]
+                 for metric in self._metrics}
+        path = self._path()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'pid': os.getpid(), 'metrics': state}, f)
+        os.replace(tmp_path, path)
+
+    def _collect(self):
+        ''' 各指标的值：本进程的实时值，多进程模式下再加上其他进程最近一次写入的值 '''
+        values = {metric.name: metric.snapshot() for metric in self._metrics}
+        if not self.multiproc_dir:
+            return values
+        own = self._path()
+        for path in glob.glob(os.path.join(self.multiproc_dir, 'metrics-*.json')):
+            if path == own:
+                continue
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _alive(data['pid'])
+            for metric in self._metrics:
+                if metric.kind == 'gauge' and not alive:
+                    continue
+                other = dict((tuple(labels), value) for labels, value in data['metrics'].get(metric.name, ()))
+                metric.merge(values[metric.name], other)
+        return values
+
+    def render(self):
+        lines = []
+        values = self._collect()
+        for metric in self._metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.documentation))
+            lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            for name, labels, value in metric.samples(values[metric.name]):
+                lines.append('%s%s %s' % (name, labels, value))
+        for collector in self._collectors:
+            for name, kind, documentation, value in collector():
+                lines.append('# HELP %s %s' % (name, documentation))
+                lines.append('# TYPE %s %s' % (name, kind))
+                lines.append('%s %s' % (name, value))
+        lines.append('')
+        return Response('\n'.join(lines), mimetype='text/plain; version=0.0.4')
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def clear_multiproc_dir(directory):
+    ''' 服务启动前删除上次运行留下的指标文件 '''
+    for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+        os.remove(path)
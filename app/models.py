@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+from functools import lru_cache
 from random import randint
 import hashlib
 import calendar
@@ -7,9 +8,20 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 from flask import current_app, request, url_for
 from flask_login import UserMixin, AnonymousUserMixin, current_user
-from . import db, login_manager
+from . import db, login_manager, last_seen, user_cache, credential_cache, token_versions
 from flask_mongoengine.wtf import model_form
 from app.exceptions import ValidationError
+from . import tokens
+
+
+@lru_cache(maxsize=16)
+def _serializer(secret_key, expires_in):
+    return Serializer(secret_key, expires_in=expires_in)
+
+
+def token_serializer(expiration=None):
+    ''' 复用已创建的 Serializer，避免每次生成/校验令牌都重新构造 '''
+    return _serializer(current_app.config['SECRET_KEY'], expiration)
 
 
 class User(UserMixin, db.Document):
@@ -22,6 +34,7 @@ class User(UserMixin, db.Document):
     phone = db.StringField()
     member_since = db.DateTimeField(default=datetime.utcnow)
     last_seen = db.DateTimeField(default=datetime.utcnow)
+    token_version = db.IntField(default=0)  # 认证令牌的版本号，见 app/tokens.py
 
     def __init__(self, **kwargs):
         ''' 注册用户是赋予角色，首先判断是否为管理员（配置中的FLASKY_ADMIN保存的电子邮件识别），
@@ -38,18 +51,20 @@ class User(UserMixin, db.Document):
     @password.setter
     def password(self, password):
         self.password_hash = generate_password_hash(password)
+        tokens.revoke(self)
+        credential_cache.invalidate_user(self.id)
 
     def verify_password(self, password):
         return check_password_hash(self.password_hash, password)
 
     def generate_confirmation_token(self, expiration=3600):
         ''' 通过用户id生成一个令牌（一般用于发送邮箱确认链接），有效期默认为一个小时 '''
-        s = Serializer(current_app.config['SECRET_KEY'], expiration)
+        s = token_serializer(expiration)
         return s.dumps({'confirm': str(self.id)}).decode('utf-8')
 
     def confirm(self, token):
         ''' 校验令牌，通过则返回True，并把数据库中的confirmed字段设为True '''
-        s = Serializer(current_app.config['SECRET_KEY'])
+        s = token_serializer()
         try:
             data = s.loads(token.encode('utf-8'))
         except:
@@ -61,12 +76,12 @@ class User(UserMixin, db.Document):
         return True
 
     def generate_reset_token(self, expiration=3600):
-        s = Serializer(current_app.config['SECRET_KEY'], expiration)
+        s = token_serializer(expiration)
         return s.dumps({'reset': str(self.id)}).decode('utf-8')
 
     @staticmethod
     def reset_password(token, new_password):
-        s = Serializer(current_app.config['SECRET_KEY'])
+        s = token_serializer()
         try:
             data = s.loads(token.encode('utf-8'))
         except:
@@ -75,17 +90,17 @@ class User(UserMixin, db.Document):
         if len(user) != 1:
             return False
         user = user[0]
-        user.password_hash = generate_password_hash(new_password)
+        user.password = new_password
         user.save()
         return True
 
     def generate_email_change_token(self, new_email, expiration=3600):
-        s = Serializer(current_app.config['SECRET_KEY'], expiration)
+        s = token_serializer(expiration)
         return s.dumps(
             {'change_email': str(self.id), 'new_email': new_email}).decode('utf-8')
 
     def change_email(self, token):
-        s = Serializer(current_app.config['SECRET_KEY'])
+        s = token_serializer()
         try:
             data = s.loads(token.encode('utf-8'))
         except:
@@ -102,12 +117,26 @@ class User(UserMixin, db.Document):
         self.save()  # add by leo
         return True
 
+    def save(self, *args, **kwargs):
+        # 令牌中保存了这些字段，变更后吊销该用户已签发的令牌
+        if self.id is not None and set(self._get_changed_fields()) & set(tokens.CLAIM_FIELDS):
+            tokens.revoke(self)
+        result = super(User, self).save(*args, **kwargs)
+        user_cache.invalidate(self.id)
+        return result
+
+    def delete(self, *args, **kwargs):
+        user_cache.invalidate(self.id)
+        token_versions.update(self.id, tokens.DELETED)
+        return super(User, self).delete(*args, **kwargs)
+
     def is_administrator(self):
         return self.admin
 
     def ping(self):
+        ''' 记录用户访问时间，由 app.last_seen 定期批量写回数据库 '''
         self.last_seen = datetime.utcnow()
-        self.save()
+        last_seen.ping(self.id, self.last_seen)
 
     # def gravatar_hash(self):
     #     return hashlib.md5(self.email.lower().encode('utf-8')).hexdigest()
@@ -153,21 +182,33 @@ class User(UserMixin, db.Document):
         
 
     def generate_auth_token(self, expiration):
-        s = Serializer(current_app.config['SECRET_KEY'],
-                       expires_in=expiration)
-        return s.dumps({'id': str(self.id)}).decode('utf-8')
+        ''' 生成自包含的令牌，校验时无需查询数据库，见 app/tokens.py '''
+        s = token_serializer(expiration)
+        version = token_versions.update(self.id, self.token_version or 0)
+        return s.dumps({
+            'id': str(self.id),
+            'username': self.username,
+            'admin': bool(self.admin),
+            'confirmed': bool(self.confirmed),
+            'ver': version
+        }).decode('utf-8')
 
     @staticmethod
     def verify_auth_token(token):
-        # print('recive token: ', token)
-        s = Serializer(current_app.config['SECRET_KEY'])
+        s = token_serializer()
         try:
             data = s.loads(token)
-            # print(data)
         except:
             return None
-        user = User.objects(id=ObjectId(data['id'])).first()
-        return user
+        if 'ver' not in data:
+            # 旧格式的令牌只包含用户id，视为版本 0，权限从 User 文档读取
+            user = user_cache.get(data['id'])
+            if user is None or not token_versions.is_current(user.id, 0):
+                return None
+            return user
+        if not token_versions.is_current(data['id'], data['ver']):
+            return None
+        return tokens.TokenPrincipal(data)
 
     def __repr__(self):
         return '<User %r>' % self.username
@@ -217,12 +258,7 @@ def load_user(user_id):
     此处使用用户id加载
     如果找到用户，必须返回用户Object，否则返回None
     '''
-    user = User.objects(id=user_id)
-    print('load_user: user_id = ', user_id)
-    print('user: ', user)
-    if not len(user):
-        return None
-    return user[0]
+    return user_cache.get(user_id)
 
 
 class Car(db.Document):
@@ -455,34 +491,16 @@ class Driver(db.Document):
 
     @staticmethod
     def delete_all_drivers(condition=None):
+        ''' 删除随机生成的司机，批量执行，见 app/data_migrations.py '''
         if not condition:
-            drivers = Driver.objects()
-            for i in range(len(drivers)):
-                if int(drivers[i].DriverId) > 100000:
-                    drivers[i].delete()
+            from .data_migrations import run_migration
+            run_migration('delete-generated-drivers', restart=True)
 
     @staticmethod
     def merge_firstname_lastname_to_name():
         ''' 将FirstName和LastName融合为Name，然后删除原先字段 '''
-        drivers = Driver.objects()
-        for driver in drivers:
-            if driver.Name is None:
-                name = ''
-                if driver.FirstName:
-                    name = name + driver.FirstName
-                if driver.LastName:
-                    if name == '':
-                        name = driver.LastName
-                    else:
-                        name = name + ' ' + driver.LastName
-                driver.Name = name
-                driver.save()
-            else:
-                if hasattr(driver, 'FirstName'):
-                    delattr(driver, 'FirstName')
-                if hasattr(driver, 'LastName'):
-                    delattr(driver, 'LastName')
-                driver.save()
+        from .data_migrations import run_migration
+        run_migration('driver-merge-name', restart=True)
 
 
 # class Questionnaire(db.EmbeddedDocument):
@@ -595,13 +613,47 @@ class Task(db.Document):
 
     @staticmethod
     def update_is_return():
-        tasks = Task.objects()
-        for task in tasks:
-            if task.end_time:
-                task.is_return = True
-            else:
-                task.is_return = False
-            task.save()
+        from .data_migrations import run_migration
+        run_migration('task-is-return', restart=True)
+
+
+class TelemetryBucket(db.Document):
+    ''' 车辆上报的GPS数据。每辆车每 TELEMETRY_BUCKET_MINUTES 分钟一个文档，
+    各点按列保存在 t/lat/lon/speed 数组中，写入时用 $push 追加，一批数据只需要很少的写操作。
+    '''
+    car = db.ReferenceField(Car, required=True)
+    start = db.DateTimeField(required=True)  # 桶的起始时间
+    count = db.IntField(default=0)
+    first = db.DateTimeField()
+    last = db.DateTimeField()
+    t = db.ListField(db.DateTimeField())
+    lat = db.ListField(db.FloatField())
+    lon = db.ListField(db.FloatField())
+    speed = db.ListField(db.FloatField())
+
+    meta = {
+        'indexes': [
+            {'fields': ['car', 'start'], 'unique': True}
+        ]
+    }
+
+    @classmethod
+    def ensure_ttl_index(cls, ttl):
+        ''' start 上的 TTL 索引按 TELEMETRY_RAW_TTL 创建，已存在但保留时间不同时用 collMod 修改 '''
+        collection = cls._get_collection()
+        for name, info in collection.index_information().items():
+            if info['key'] == [('start', 1)]:
+                if info.get('expireAfterSeconds') != ttl:
+                    collection.database.command('collMod', collection.name,
+                                                index={'name': name, 'expireAfterSeconds': ttl})
+                return
+        collection.create_index('start', expireAfterSeconds=ttl)
+
+    @staticmethod
+    def bucket_start(timestamp, minutes):
+        ''' UTC时间戳所在桶的起始时间 '''
+        size = minutes * 60
+        return datetime.utcfromtimestamp(int(timestamp // size * size))
 
 
 def datetime_to_timestamp(time):
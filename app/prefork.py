@@ -0,0 +1,30 @@
+''' 预加载（preload）部署时的 fork 安全处理
+
+gunicorn --preload 在 master 进程中创建应用，再 fork 出各个 worker。db.init_app 在 master 中
+已经创建了 MongoClient，而 MongoClient 不是 fork 安全的：子进程继续使用父进程的连接池和监控线程
+可能死锁或读到别的进程的响应。fork 之后在子进程中丢弃 mongoengine 缓存的客户端、数据库和
+各 Document 类缓存的集合对象（不关闭，连接仍属于父进程），下一次查询时按已注册的连接设置重新连接。
+
+调度器在每个进程收到第一个请求时才启动（scheduler.py），日志监听线程在 fork 后重新创建（logs.py）。
+'''
+import os
+
+_installed = []
+
+
+def reset_mongo_connections():
+    from mongoengine import connection
+    from mongoengine.base import _document_registry
+    connection._connections.clear()
+    connection._dbs.clear()
+    for document in _document_registry.values():
+        if getattr(document, '_collection', None) is not None:
+            document._collection = None
+
+
+def install():
+    ''' 注册 fork 后的处理，多次调用只注册一次 '''
+    if _installed or not hasattr(os, 'register_at_fork'):
+        return
+    os.register_at_fork(after_in_child=reset_mongo_connections)
+    _installed.append(True)
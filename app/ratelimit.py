@@ -0,0 +1,92 @@
+''' 基于令牌桶的限流
+
+每个 (路由, 客户端) 对应一个令牌桶，桶容量为 burst，每 per 秒补充 rate 个令牌。
+状态默认保存在进程内存中；配置 RATELIMIT_STORAGE_URL（redis://...）后改为保存在 Redis 中，
+多个进程共享同一组令牌桶（需要安装 redis 包）。
+'''
+import threading
+import time
+
+
+class MemoryBackend(object):
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self._buckets = {}   # key -> [剩余令牌数, 上次更新时间, 补满的时间]
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, per, burst):
+        ''' 取一个令牌，返回 (是否允许, 需要等待的秒数) '''
+        now = time.time()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_size:
+                    self._prune(now)
+                bucket = self._buckets[key] = [float(burst), now, now]
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate / per)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            # 各个桶按自己的 rate/per/burst 记录补满的时间，清理时不依赖调用方的参数
+            bucket[:] = [tokens, now, now + (burst - tokens) * per / rate]
+        if allowed:
+            return True, 0
+        return False, (1 - tokens) * per / rate
+
+    def _prune(self, now):
+        # 删除已经补满的桶，它们与新建的桶没有区别
+        full = [key for key, bucket in self._buckets.items() if bucket[2] <= now]
+        for key in full:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_size:
+            self._buckets.clear()
+
+
+class RedisBackend(object):
+    SCRIPT = '''
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local rate, per, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+    local tokens = tonumber(bucket[1]) or burst
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + (now - updated) * rate / per)
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(per * burst / rate) + 1)
+    return {allowed, tostring(tokens)}
+    '''
+
+    def __init__(self, url, prefix='ratelimit:'):
+        import redis
+        self.prefix = prefix
+        self._redis = redis.StrictRedis.from_url(url)
+        self._script = self._redis.register_script(self.SCRIPT)
+
+    def consume(self, key, rate, per, burst):
+        allowed, tokens = self._script(keys=[self.prefix + key],
+                                       args=[rate, per, burst, time.time()])
+        if int(allowed):
+            return True, 0
+        return False, (1 - float(tokens)) * per / rate
+
+
+class RateLimiter(object):
+    def __init__(self, app=None):
+        self.enabled = True
+        self.backend = MemoryBackend()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATELIMIT_ENABLED', True)
+        url = app.config.get('RATELIMIT_STORAGE_URL')
+        if url:
+            self.backend = RedisBackend(url)
+
+    def consume(self, key, rate, per, burst=None):
+        if not self.enabled:
+            return True, 0
+        return self.backend.consume(key, rate, per, burst or rate)
@@ -0,0 +1,56 @@
+''' 只读查询的路由
+
+写入和需要立即读到自己写入结果的查询走默认连接（主节点）。列表、搜索等只读查询用
+read_router.queryset(Document) 代替 Document.objects：
+- 配置了 MONGODB_READ_SETTINGS 时，使用单独注册的只读连接（例如只读副本或分析节点）；
+- 否则配置了 MONGODB_READ_PREFERENCE 时（如 secondaryPreferred），按该读偏好发送到副本集的从节点；
+- 都没有配置时与 Document.objects 相同。
+从节点的数据可能略有延迟，刚写入的数据不一定能立即在列表中看到。
+'''
+from mongoengine.connection import register_connection
+from pymongo import ReadPreference
+
+READ_ALIAS = 'read'
+
+READ_PREFERENCES = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST,
+}
+
+
+def client_options(settings):
+    ''' MONGODB_SETTINGS 中除 db/host/port 以外的项，即传给 MongoClient 的连接池、超时等参数 '''
+    return {key: value for key, value in settings.items()
+            if key.lower() not in ('db', 'name', 'host', 'port', 'alias')}
+
+
+class ReadRouter(object):
+    def __init__(self, app=None):
+        self.alias = None
+        self.read_preference = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        preference = app.config.get('MONGODB_READ_PREFERENCE')
+        if preference and preference not in READ_PREFERENCES:
+            raise ValueError('Unknown MONGODB_READ_PREFERENCE: %s' % preference)
+        self.read_preference = READ_PREFERENCES[preference] if preference else None
+        settings = app.config.get('MONGODB_READ_SETTINGS')
+        self.alias = None
+        if settings:
+            register_connection(READ_ALIAS, db=settings.get('db'), host=settings.get('host'),
+                                port=settings.get('port'), **client_options(settings))
+            self.alias = READ_ALIAS
+
+    def queryset(self, document):
+        ''' 只读查询使用的 QuerySet，可以继续 filter、paginate '''
+        queryset = document.objects
+        if self.alias:
+            return queryset.using(self.alias)
+        if self.read_preference is not None:
+            return queryset.read_preference(self.read_preference)
+        return queryset
@@ -0,0 +1,188 @@
+''' 后台定时任务
+
+原来 ghost_car 在导入时就启动 BackgroundScheduler，预分叉（pre-fork）部署时每个 worker 各自运行
+一份所有任务，导入 API 包也会启动线程。这里只在 create_app 中登记任务，收到第一个请求时
+（此时已在 fork 之后）才在本进程启动调度线程。
+
+任务分两种：
+- leader_only 的任务只在 leader 进程中运行。各进程对 SCHEDULER_LOCK_FILE 尝试非阻塞的排他锁
+  （fcntl.flock），拿到锁的就是 leader；锁随进程退出由操作系统释放，其他进程在下次运行任务时接替。
+- 其余任务在每个进程中运行，例如写回本进程缓冲的数据、读取 leader 的结果。
+leader 把结果写入 SharedState（SCHEDULER_STATE_DIR 中的文件，先写临时文件再原子替换），
+其他进程按文件的修改时间判断是否有更新，只在变化时重新读取。
+'''
+import atexit
+import json
+import os
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # 没有 fcntl 的平台上每个进程都是 leader
+    fcntl = None
+
+
+class SharedState(object):
+    def __init__(self):
+        self.directory = None
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def _path(self, name, ext):
+        return os.path.join(self.directory, name + ext)
+
+    def _replace(self, path, write):
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    def _read(self, path, read):
+        ''' 文件未变化时返回缓存的内容，不存在时返回 None '''
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None, None
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._cache.get(path)
+        if cached is not None and cached[0] == version:
+            return version, cached[1]
+        with open(path, 'rb') as f:
+            value = read(f)
+        with self._lock:
+            self._cache[path] = (version, value)
+        return version, value
+
+    def put_array(self, name, array):
+        if self.directory:
+            self._replace(self._path(name, '.npy'), lambda f: np.save(f, array))
+
+    def get_array(self, name):
+        if not self.directory:
+            return None
+        return self._read(self._path(name, '.npy'), np.load)[1]
+
+    def array_version(self, name):
+        if not self.directory:
+            return None
+        return self._read(self._path(name, '.npy'), np.load)[0]
+
+    def put_json(self, name, value):
+        if self.directory:
+            self._replace(self._path(name, '.json'), lambda f: f.write(json.dumps(value).encode('utf-8')))
+
+    def get_json(self, name):
+        if not self.directory:
+            return None
+        return self._read(self._path(name, '.json'), lambda f: json.loads(f.read().decode('utf-8')))[1]
+
+
+class Scheduler(object):
+    def __init__(self, app=None):
+        self.enabled = False
+        self.lock_file = None
+        self.state = SharedState()
+        self.jobs = {}          # name -> (func, seconds, leader_only)
+        self._scheduler = None
+        self._pid = None
+        self._lock_fd = None
+        self._lock_pid = None
+        self._start_lock = threading.Lock()
+        self._atexit_registered = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SCHEDULER_ENABLED', True)
+        if not self.enabled:
+            return
+        self.lock_file = app.config['SCHEDULER_LOCK_FILE']
+        self.state.init_app(app.config['SCHEDULER_STATE_DIR'])
+        app.before_request(self._start_once)
+        # serve --no-preload 的 worker 会再次 create_app，只注册一次
+        if not self._atexit_registered:
+            atexit.register(self.shutdown)
+            self._atexit_registered = True
+
+    def add_job(self, name, func, seconds, leader_only=True):
+        ''' 登记定时任务，同名任务会被替换；调度器已启动时立即生效 '''
+        self.jobs[name] = (func, seconds, leader_only)
+        if self.running:
+            self._schedule(name)
+
+    @property
+    def running(self):
+        return self._scheduler is not None and self._pid == os.getpid()
+
+    def _start_once(self):
+        if not self.running:
+            self.start()
+
+    def start(self):
+        with self._start_lock:
+            if self.running or not self.enabled:
+                return
+            # fork 得到的子进程中没有父进程的调度线程，也不应继续持有父进程的锁
+            if self._lock_fd is not None and self._lock_pid != os.getpid():
+                os.close(self._lock_fd)
+                self._lock_fd = None
+            # 调度器启动时才导入 APScheduler，不影响应用的启动时间
+            from apscheduler.schedulers.background import BackgroundScheduler
+            self._scheduler = BackgroundScheduler(daemon=True)
+            self._pid = os.getpid()
+            for name in self.jobs:
+                self._schedule(name)
+            self._scheduler.start()
+
+    def _schedule(self, name):
+        seconds = self.jobs[name][1]
+        self._scheduler.add_job(self._run, trigger='interval', seconds=seconds, args=(name,), id=name,
+                                replace_existing=True, max_instances=1, coalesce=True)
+
+    def _run(self, name):
+        func, seconds, leader_only = self.jobs[name]
+        if leader_only and not self.is_leader():
+            return
+        func()
+
+    def is_leader(self):
+        ''' 尝试获得（或确认仍持有）leader 锁 '''
+        if fcntl is None or not self.lock_file:
+            return True
+        if self._lock_fd is not None and self._lock_pid == os.getpid():
+            return True
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode('ascii'))
+        self._lock_fd = fd
+        self._lock_pid = os.getpid()
+        return True
+
+    def shutdown(self):
+        if self.running:
+            self._scheduler.shutdown(wait=False)
+            self._scheduler = None
+        if self._lock_fd is not None and self._lock_pid == os.getpid():
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def status(self):
+        return {
+            'pid': os.getpid(),
+            'running': self.running,
+            'leader': self._lock_fd is not None and self._lock_pid == os.getpid(),
+            'jobs': [{'name': name, 'seconds': seconds, 'leader_only': leader_only}
+                     for name, (func, seconds, leader_only) in sorted(self.jobs.items())]
+        }
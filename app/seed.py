@@ -0,0 +1,209 @@
+''' 基准测试用的大规模模拟数据生成
+
+与各模型的 generate_fake 不同，这里按批次用 NumPy 一次生成整批记录，
+由进程池中的每个进程各自连接数据库并 insert_many。所有文档的 _id 由序号确定，
+task 通过序号引用 car/driver/user，因此数据在引用上一致，且同一个 seed 下结果完全可复现：
+随机数按固定大小（RNG_CHUNK 条记录）的块生成，每块使用由 seed、集合和块序号确定的生成器，
+与进程数、批次大小和执行顺序无关。
+'''
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+import numpy as np
+from bson import ObjectId
+from mongoengine.connection import disconnect, get_db, register_connection
+from werkzeug.security import generate_password_hash
+
+from .models import User, Car, Driver, Task
+from .read_routing import client_options
+
+
+BRANDS = ['Audi', 'Toyota', 'Nissan', 'Buick', 'BMW', 'Cadillac']
+TYPES = ['SUV', 'Van', 'Trucks', 'Bus', 'Taxi', 'Car']
+PROJECTS = ['华为项目', '宝马项目', 'VTTI项目', '通用项目']
+PLATE_LETTERS = ['A', 'B', 'C', 'D', 'E', 'H']
+FIRST_NAMES = ['James', 'Mary', 'John', 'Linda', 'Robert', 'Susan', 'Michael', 'Karen',
+               'William', 'Lisa', 'David', 'Nancy', 'Richard', 'Betty', 'Thomas', 'Helen']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Miller', 'Davis', 'Wilson',
+              'Moore', 'Taylor', 'Anderson', 'Thomas', 'Jackson', 'White', 'Harris', 'Martin']
+CITIES = ['Shanghai', 'Beijing', 'Suzhou', 'Hangzhou', 'Nanjing', 'Wuxi']
+
+# 每种集合在 _id 中的前缀，保证不同集合、不同序号的 _id 互不相同
+KIND_PREFIX = {'user': 1, 'car': 2, 'driver': 3, 'task': 4}
+EPOCH = datetime(2015, 1, 1)
+FAKE_PASSWORD = 'password'
+# 每块记录使用一个独立的随机数生成器
+RNG_CHUNK = 1000
+SEED_ALIAS = 'seed'
+
+
+def object_id(kind, index):
+    return ObjectId('%08x%016x' % (0x5eed0000 + KIND_PREFIX[kind], index))
+
+
+def dataset_sizes(scale):
+    ''' scale 为 task 数量，其他集合按比例生成 '''
+    return {
+        'task': scale,
+        'car': max(1, scale // 100),
+        'driver': max(1, scale // 50),
+        'user': max(1, scale // 1000),
+    }
+
+
+def _chunks(seed, kind, start, stop):
+    ''' 按 RNG_CHUNK 划分 [start, stop)，依次返回 (rng, 块的起始序号, 块内需要生成的序号) '''
+    for base in range(start - start % RNG_CHUNK, stop, RNG_CHUNK):
+        rng = np.random.default_rng([seed, KIND_PREFIX[kind], base // RNG_CHUNK])
+        yield rng, base, range(max(start, base), min(stop, base + RNG_CHUNK))
+
+
+def _dates(rng, size, days=365 * 5):
+    seconds = rng.integers(0, days * 86400, size=size)
+    return [EPOCH + timedelta(seconds=int(s)) for s in seconds]
+
+
+def _names(rng, size):
+    first = rng.integers(0, len(FIRST_NAMES), size=size)
+    last = rng.integers(0, len(LAST_NAMES), size=size)
+    return ['%s %s' % (FIRST_NAMES[f], LAST_NAMES[l]) for f, l in zip(first, last)]
+
+
+def make_users(seed, start, stop, sizes, password_hash):
+    users = []
+    for rng, base, indexes in _chunks(seed, 'user', start, stop):
+        names = _names(rng, RNG_CHUNK)
+        since = _dates(rng, RNG_CHUNK)
+        users.extend({'_id': object_id('user', i),
+                      'email': 'seed%d@example.com' % i,
+                      'username': 'seed_user_%d' % i,
+                      'admin': False,
+                      'password_hash': password_hash,
+                      'confirmed': True,
+                      'name': names[i - base],
+                      'member_since': since[i - base],
+                      'last_seen': since[i - base]}
+                     for i in indexes)
+    return users
+
+
+def make_cars(seed, start, stop, sizes, password_hash):
+    cars = []
+    for rng, base, indexes in _chunks(seed, 'car', start, stop):
+        brands = rng.integers(0, len(BRANDS), size=RNG_CHUNK)
+        types = rng.integers(0, len(TYPES), size=RNG_CHUNK)
+        projects = rng.integers(0, len(PROJECTS), size=RNG_CHUNK)
+        letters = rng.integers(0, len(PLATE_LETTERS), size=RNG_CHUNK)
+        bought = _dates(rng, RNG_CHUNK)
+        # CarId 与车牌号由序号推出，无需查询数据库检查重复
+        cars.extend({'_id': object_id('car', i),
+                     'CarId': str(10000000 + i),
+                     'LicensePlate': '沪%s%06d' % (PLATE_LETTERS[letters[i - base]], i % 1000000),
+                     'Brand': BRANDS[brands[i - base]],
+                     'Project': PROJECTS[projects[i - base]],
+                     'VehicleType': TYPES[types[i - base]],
+                     'BuyTime': bought[i - base]}
+                    for i in indexes)
+    return cars
+
+
+def make_drivers(seed, start, stop, sizes, password_hash):
+    drivers = []
+    for rng, base, indexes in _chunks(seed, 'driver', start, stop):
+        names = _names(rng, RNG_CHUNK)
+        cities = rng.integers(0, len(CITIES), size=RNG_CHUNK)
+        years = rng.integers(0, 41, size=RNG_CHUNK)
+        zips = rng.integers(100000, 999999, size=RNG_CHUNK)
+        birthdays = _dates(rng, RNG_CHUNK, days=365 * 40)
+        drivers.extend({'_id': object_id('driver', i),
+                        'DriverId': str(20000000 + i),
+                        'Name': names[i - base],
+                        'City': CITIES[cities[i - base]],
+                        'Zip': str(zips[i - base]),
+                        'DrivingYears': int(years[i - base]),
+                        'BirthDay': birthdays[i - base] - timedelta(days=365 * 20)}
+                       for i in indexes)
+    return drivers
+
+
+def make_tasks(seed, start, stop, sizes, password_hash):
+    tasks = []
+    for rng, base, indexes in _chunks(seed, 'task', start, stop):
+        cars = rng.integers(0, sizes['car'], size=RNG_CHUNK)
+        drivers = rng.integers(0, sizes['driver'], size=RNG_CHUNK)
+        users = rng.integers(0, sizes['user'], size=RNG_CHUNK)
+        durations = rng.integers(3600, 3 * 86400, size=RNG_CHUNK)
+        starts = _dates(rng, RNG_CHUNK)
+        for i in indexes:
+            n = i - base
+            task = {'_id': object_id('task', i),
+                    'car': object_id('car', int(cars[n])),
+                    'driver': object_id('driver', int(drivers[n])),
+                    'recorder': object_id('user', int(users[n])),
+                    'start_time': starts[n],
+                    'is_return': bool(i % 5)}
+            # 与 Task.generate_fake 一致：每 5 个任务中有 1 个车辆未返回
+            if i % 5:
+                task['end_time'] = starts[n] + timedelta(seconds=int(durations[n]))
+            tasks.append(task)
+    return tasks
+
+
+GENERATORS = [('user', User, make_users),
+              ('car', Car, make_cars),
+              ('driver', Driver, make_drivers),
+              ('task', Task, make_tasks)]
+
+_db = None
+
+
+def _connect(settings):
+    ''' 按 MONGODB_SETTINGS 注册连接，认证、副本集 URI、超时等参数全部传给 MongoClient '''
+    register_connection(SEED_ALIAS, db=settings.get('db'), host=settings.get('host'),
+                        port=settings.get('port'), **client_options(settings))
+    return get_db(SEED_ALIAS)
+
+
+def _init_worker(settings):
+    ''' 每个子进程各自创建 MongoClient（MongoClient 不能跨 fork 共享） '''
+    global _db
+    _db = _connect(settings)
+
+
+def _insert_chunk(job):
+    kind, collection, start, stop, seed, sizes, password_hash = job
+    generator = dict((k, g) for k, _, g in GENERATORS)[kind]
+    docs = generator(seed, start, stop, sizes, password_hash)
+    _db[collection].insert_many(docs, ordered=False)
+    return kind, len(docs)
+
+
+def seed_database(settings, scale, seed=2018, batch_size=5000, processes=None,
+                  drop=False, log=print):
+    ''' 生成规模为 scale（task 数量）的数据集，返回各集合插入的文档数 '''
+    sizes = dataset_sizes(scale)
+    password_hash = generate_password_hash(FAKE_PASSWORD)
+    if drop:
+        database = _connect(settings)
+        for kind, document, _ in GENERATORS:
+            database.drop_collection(document._get_collection_name())
+        # 关闭后再创建进程池，子进程不会继承这个客户端
+        disconnect(SEED_ALIAS)
+
+    inserted = dict.fromkeys(sizes, 0)
+    started = time.time()
+    with Pool(processes, initializer=_init_worker, initargs=(settings,)) as pool:
+        # 依次生成各集合，保证 task 插入前其引用的文档已存在
+        for kind, document, _ in GENERATORS:
+            jobs = [(kind, document._get_collection_name(), start,
+                     min(start + batch_size, sizes[kind]), seed, sizes, password_hash)
+                    for start in range(0, sizes[kind], batch_size)]
+            for kind, count in pool.imap_unordered(_insert_chunk, jobs):
+                inserted[kind] += count
+            elapsed = time.time() - started
+            log('%-6s %9d documents  %.1fs  (%.0f docs/s overall)'
+                % (kind, inserted[kind], elapsed, sum(inserted.values()) / elapsed))
+    if sizes['user']:
+        log('Seed users log in with password %r.' % FAKE_PASSWORD)
+    return inserted
@@ -0,0 +1,179 @@
+''' 慢查询记录
+
+api 蓝本的请求中，耗时超过 SLOW_QUERY_THRESHOLD_MS 的查询命令（find/aggregate/count/distinct）
+连同发起请求的 endpoint、去掉具体值后的过滤条件结构，以及 explain("executionStats") 的结果，
+保存到固定集合（capped collection）SLOW_QUERY_COLLECTION 中。
+explain 在后台线程中执行，不增加请求本身的耗时；队列满时直接丢弃记录。
+'''
+import json
+import queue
+import threading
+from datetime import datetime
+
+from flask import has_request_context, request
+from mongoengine.connection import get_connection
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+EXPLAINABLE = ('find', 'aggregate', 'count', 'distinct')
+
+
+def filter_shape(value):
+    ''' 把查询条件中的具体值替换为 1，只保留字段和操作符结构，例如
+    {'car': ObjectId(...), 'start_time': {'$gte': ...}} -> {"car": 1, "start_time": {"$gte": 1}}
+    '''
+    if isinstance(value, dict):
+        return {key: filter_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # $and/$or 等操作符的子条件保留结构，$in 等的取值列表视为一个值
+        if value and all(isinstance(item, dict) for item in value):
+            return [filter_shape(item) for item in value]
+        return 1
+    return 1
+
+
+def command_filter(command_name, command):
+    if command_name == 'find':
+        return command.get('filter', {})
+    if command_name in ('count', 'distinct'):
+        return command.get('query', {})
+    if command_name == 'aggregate':
+        pipeline = command.get('pipeline') or []
+        stages = [list(stage)[0] for stage in pipeline if stage]
+        match = pipeline[0].get('$match', {}) if pipeline else {}
+        return {'$match': match, '$stages': stages}
+    return {}
+
+
+def _winning_stage(plan):
+    ''' 获胜执行计划中由外到内的各阶段，例如 FETCH <- IXSCAN '''
+    stages = []
+    while isinstance(plan, dict):
+        stages.append(plan.get('stage'))
+        plan = plan.get('inputStage') or (plan.get('inputStages') or [None])[0]
+    return ' <- '.join(stage for stage in stages if stage)
+
+
+def summarize_explain(explain):
+    planner = explain.get('queryPlanner', {})
+    stats = explain.get('executionStats', {})
+    # aggregate 的 explain 把计划放在 stages[0].$cursor 中
+    if not planner and explain.get('stages'):
+        cursor = explain['stages'][0].get('$cursor', {})
+        planner = cursor.get('queryPlanner', {})
+        stats = cursor.get('executionStats', {})
+    return {
+        'plan': _winning_stage(planner.get('winningPlan')),
+        'index_filter_set': planner.get('indexFilterSet'),
+        'n_returned': stats.get('nReturned'),
+        'keys_examined': stats.get('totalKeysExamined'),
+        'docs_examined': stats.get('totalDocsExamined'),
+        'execution_ms': stats.get('executionTimeMillis'),
+    }
+
+
+class SlowQueryRecorder(object):
+    def __init__(self, app=None):
+        self.threshold = 100
+        self.collection_name = 'slow_queries'
+        self.capped_size = 10 * 1024 * 1024
+        self.blueprints = ('api',)
+        self._queue = queue.Queue(maxsize=100)
+        self._worker = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, monitor=None):
+        self.threshold = app.config.get('SLOW_QUERY_THRESHOLD_MS', self.threshold)
+        self.collection_name = app.config.get('SLOW_QUERY_COLLECTION', self.collection_name)
+        self.capped_size = app.config.get('SLOW_QUERY_CAPPED_SIZE', self.capped_size)
+        if monitor is not None and self.threshold:
+            monitor.add_observer(self.observe)
+
+    def observe(self, started, succeeded):
+        ''' 由 db_monitor 在请求中每条命令成功后调用 '''
+        if succeeded.duration_micros < self.threshold * 1000:
+            return
+        if started.command_name not in EXPLAINABLE or not has_request_context():
+            return
+        if request.blueprint not in self.blueprints:
+            return
+        command = {key: value for key, value in started.command.items()
+                   if not key.startswith('$') and key not in ('lsid', 'txnNumber', 'cursor')}
+        if command.get(started.command_name) == self.collection_name:
+            return
+        if started.command_name == 'aggregate':
+            command['cursor'] = {}
+        record = {
+            'time': datetime.utcnow(),
+            'endpoint': request.endpoint,
+            'method': request.method,
+            'database': started.database_name,
+            'collection': command.get(started.command_name),
+            'command': started.command_name,
+            'shape': json.dumps(filter_shape(command_filter(started.command_name, command)),
+                                sort_keys=True),
+            'duration_ms': succeeded.duration_micros / 1000.0,
+        }
+        try:
+            self._queue.put_nowait((record, command))
+        except queue.Full:
+            return
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        # 后台线程按需启动（fork 后的子进程中也会重新启动）
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='nds-slow-queries',
+                                                daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            record, command = self._queue.get()
+            try:
+                self._save(record, command)
+            except PyMongoError:
+                pass
+
+    def _save(self, record, command):
+        db = get_connection()[record['database']]
+        try:
+            explain = db.command('explain', command, verbosity='executionStats')
+            record['explain'] = summarize_explain(explain)
+        except PyMongoError as why:
+            record['explain'] = {'error': str(why)}
+        self.collection(db).insert_one(record)
+
+    def collection(self, db=None):
+        if db is None:
+            from mongoengine.connection import get_db
+            db = get_db()
+        if self.collection_name not in db.list_collection_names():
+            try:
+                db.create_collection(self.collection_name, capped=True, size=self.capped_size)
+            except CollectionInvalid:
+                pass
+        return db[self.collection_name]
+
+    def summary(self, limit=50):
+        ''' 按 (集合, 命令, 条件结构) 汇总慢查询，按总耗时倒序 '''
+        pipeline = [
+            {'$sort': {'time': 1}},
+            {'$group': {
+                '_id': {'collection': '$collection', 'command': '$command', 'shape': '$shape'},
+                'count': {'$sum': 1},
+                'total_ms': {'$sum': '$duration_ms'},
+                'avg_ms': {'$avg': '$duration_ms'},
+                'max_ms': {'$max': '$duration_ms'},
+                'endpoints': {'$addToSet': '$endpoint'},
+                'last_seen': {'$last': '$time'},
+                'explain': {'$last': '$explain'},
+            }},
+            {'$sort': {'total_ms': -1}},
+            {'$limit': limit},
+        ]
+        return list(self.collection().aggregate(pipeline))
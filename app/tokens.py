@@ -0,0 +1,137 @@
+''' 自包含的认证令牌及其吊销
+
+令牌中签名保存用户 id、username、admin、confirmed 和令牌版本号 ver，校验令牌时只检查签名和
+内存中的版本表，不查询数据库，得到的是由这些声明构造的 TokenPrincipal 而不是 User 文档。
+需要完整用户信息时（例如修改密码），通过 user_cache 按需加载 User。
+
+吊销通过版本号实现。User 文档的 token_version 字段保存当前版本，修改密码或权限时调用 revoke(user)
+使其加一并随 user.save() 写入数据库，令牌中的 ver 小于当前版本即失效。每个进程在 token_versions
+中缓存见过的用户的版本：
+- 本进程中的修改、删除立即写入版本表；
+- 第一次见到某个用户时读取一次数据库；
+- 定时任务每隔 TOKEN_VERSION_REFRESH 秒重新读取版本表中各用户的版本（只读 token_version 字段），
+  其他进程中的吊销和删除最迟在这个时间后生效；
+- 令牌经过签名，其中的 ver 只能由服务端签发，因此遇到更高的 ver 时直接更新版本表。
+admin、confirmed 和 username 变化后 User.save() 同样吊销令牌，令牌中的声明因此不会比数据库旧。
+'''
+import threading
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# 已删除的用户，任何版本的令牌都无效
+DELETED = float('inf')
+# 令牌中保存的用户字段，User.save() 时这些字段有变化则吊销令牌
+CLAIM_FIELDS = ('username', 'admin', 'confirmed')
+
+
+class TokenVersions(object):
+    def __init__(self, app=None):
+        self.refresh_interval = 30
+        self._versions = {}  # user id -> 当前令牌版本
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.refresh_interval = app.config.get('TOKEN_VERSION_REFRESH', self.refresh_interval)
+
+    def update(self, user_id, version):
+        ''' 记录用户的令牌版本，版本号只增不减，返回记录后的版本 '''
+        key = str(user_id)
+        with self._lock:
+            version = max(self._versions.get(key, 0), version)
+            self._versions[key] = version
+        return version
+
+    def is_current(self, user_id, version):
+        ''' 令牌中的版本号不小于用户当前的版本时有效 '''
+        with self._lock:
+            current = self._versions.get(str(user_id))
+        if current is None:
+            current = self._load(user_id)
+            if current is None:
+                return False
+        if version > current:
+            # 其他进程已吊销并签发了新令牌，本进程的版本表还没有刷新
+            self.update(user_id, version)
+            return True
+        return version == current
+
+    def _load(self, user_id):
+        from .models import User
+        try:
+            doc = User._get_collection().find_one({'_id': ObjectId(user_id)},
+                                                  projection={'token_version': True})
+        except (InvalidId, TypeError):
+            return None
+        return self.update(user_id, (doc.get('token_version') or 0) if doc else DELETED)
+
+    def refresh(self):
+        ''' 重新读取版本表中各用户的当前版本（定时任务），返回读取的用户数 '''
+        from .models import User
+        with self._lock:
+            ids = [key for key, version in self._versions.items() if version != DELETED]
+        if not ids:
+            return 0
+        found = dict((str(doc['_id']), doc.get('token_version') or 0)
+                     for doc in User._get_collection().find(
+                         {'_id': {'$in': [ObjectId(key) for key in ids]}},
+                         projection={'token_version': True}))
+        for key in ids:
+            self.update(key, found.get(key, DELETED))
+        return len(ids)
+
+    def clear(self):
+        with self._lock:
+            self._versions.clear()
+
+
+def revoke(user):
+    ''' 使该用户此前签发的所有令牌失效，调用方随后需要 save() '''
+    from . import token_versions
+    user.token_version = (user.token_version or 0) + 1
+    if user.id is not None:
+        token_versions.update(user.id, user.token_version)
+
+
+class TokenPrincipal(object):
+    ''' 由令牌声明构造的当前用户，提供 API 鉴权所需的属性 '''
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, claims):
+        self.id = ObjectId(claims['id'])
+        self.username = claims.get('username')
+        self.admin = bool(claims.get('admin'))
+        self.confirmed = bool(claims.get('confirmed'))
+        self.token_version = claims.get('ver', 0)
+
+    def get_id(self):
+        return str(self.id)
+
+    def is_administrator(self):
+        return self.admin
+
+    def ping(self):
+        from . import last_seen
+        last_seen.ping(self.id)
+
+    @property
+    def user(self):
+        ''' 完整的 User 文档（按需从缓存或数据库加载） '''
+        from . import user_cache
+        return user_cache.get(self.id)
+
+    def __getattr__(self, name):
+        # 令牌中没有的属性交给 User 文档处理
+        if name.startswith('_') or name == 'user':
+            raise AttributeError(name)
+        user = self.user
+        if user is None:
+            raise AttributeError(name)
+        return getattr(user, name)
+
+    def __repr__(self):
+        return '<TokenPrincipal %r>' % self.username
@@ -0,0 +1,152 @@
+''' 轨迹抽稀（Douglas-Peucker）与多级细节缓存
+
+对一条轨迹只运行一次 Douglas-Peucker，记录每个点被保留所需的最小容差（significance，单位米）：
+容差为 tol 的抽稀结果就是 significance > tol 的那些点（首尾点始终保留）。
+因此每个任务只需计算一次，之后任意缩放级别的查询都只是一次向量化的比较。
+'''
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+METERS_PER_DEGREE_LAT = 110574.0
+METERS_PER_DEGREE_LON = 111320.0
+
+
+def project(lat, lon):
+    ''' 经纬度投影为以米为单位的平面坐标（等距圆柱投影，轨迹范围内误差可忽略） '''
+    scale = np.cos(np.radians(np.mean(lat))) if len(lat) else 1.0
+    return lon * METERS_PER_DEGREE_LON * scale, lat * METERS_PER_DEGREE_LAT
+
+
+def dp_significance(x, y):
+    ''' 计算每个点在 Douglas-Peucker 中被保留所需的最小容差 '''
+    n = len(x)
+    significance = np.zeros(n)
+    if n == 0:
+        return significance
+    significance[0] = significance[-1] = np.inf
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        i, j, parent = stack.pop()
+        if j - i < 2:
+            continue
+        dx, dy = x[j] - x[i], y[j] - y[i]
+        px, py = x[i + 1:j] - x[i], y[i + 1:j] - y[i]
+        length = dx * dx + dy * dy
+        if length == 0:
+            distances = np.hypot(px, py)
+        else:
+            t = np.clip((px * dx + py * dy) / length, 0.0, 1.0)
+            distances = np.hypot(px - t * dx, py - t * dy)
+        k = int(np.argmax(distances))
+        index = i + 1 + k
+        # 子区间只有在父区间被分割时才会被处理，所以取不超过父区间的值
+        value = min(distances[k], parent)
+        significance[index] = value
+        stack.append((i, index, value))
+        stack.append((index, j, value))
+    return significance
+
+
+class Track(object):
+    def __init__(self, t, lat, lon):
+        self.t = t
+        self.lat = lat
+        self.lon = lon
+        x, y = project(lat, lon)
+        self.significance = dp_significance(x, y)
+        self.created = time.time()
+
+    def __len__(self):
+        return len(self.t)
+
+    def simplify(self, tolerance):
+        ''' 返回容差为 tolerance（米）时保留的点，[[时间戳, 纬度, 经度], ...] '''
+        mask = self.significance > tolerance
+        return np.column_stack((self.t[mask], self.lat[mask], self.lon[mask])).tolist()
+
+
+def load_track(car, start, end):
+    ''' 从 TelemetryBucket 中读取车辆在 [start, end] 内的轨迹，按时间排序 '''
+    from .models import TelemetryBucket
+    from flask import current_app
+    minutes = current_app.config['TELEMETRY_BUCKET_MINUTES']
+    first_bucket = TelemetryBucket.bucket_start(
+        (start - datetime(1970, 1, 1)).total_seconds(), minutes)
+    cursor = TelemetryBucket._get_collection().find(
+        {'car': car, 'start': {'$gte': first_bucket, '$lte': end}},
+        projection={'_id': False, 't': True, 'lat': True, 'lon': True})
+    times, lats, lons = [], [], []
+    for bucket in cursor:
+        times.extend(bucket.get('t', ()))
+        lats.extend(bucket.get('lat', ()))
+        lons.extend(bucket.get('lon', ()))
+    t = np.array(times, dtype='datetime64[ms]').astype(np.int64) / 1000.0
+    lat = np.array(lats, dtype=np.float64)
+    lon = np.array(lons, dtype=np.float64)
+    order = np.argsort(t, kind='stable')
+    t, lat, lon = t[order], lat[order], lon[order]
+    window = (t >= (start - datetime(1970, 1, 1)).total_seconds()) & \
+        (t <= (end - datetime(1970, 1, 1)).total_seconds())
+    return Track(t[window], lat[window], lon[window])
+
+
+class TrackCache(object):
+    ''' 按任务缓存 Track（包括各点的 significance），最近最少使用的先淘汰。
+    未结束的任务轨迹还会增长，缓存 ttl 秒后重新读取。
+
+    读取和计算一条长轨迹可能需要数秒，同一任务同时只由一个请求计算：没有缓存时其他请求等待
+    该请求的结果；已有过期的轨迹时其他请求直接返回旧的轨迹，不等待刷新。
+    '''
+    def __init__(self, max_size=64, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._tracks = OrderedDict()
+        self._loading = {}   # 任务 id -> 正在计算该任务的请求持有的锁
+        self._lock = threading.Lock()
+
+    def _fresh(self, key):
+        ''' 缓存中未过期的轨迹，调用时需持有 self._lock '''
+        entry = self._tracks.get(key)
+        if entry is not None:
+            track, closed = entry
+            if closed or time.time() - track.created < self.ttl:
+                self._tracks.move_to_end(key)
+                return track
+        return None
+
+    def get(self, task):
+        key = str(task.id)
+        with self._lock:
+            track = self._fresh(key)
+            if track is not None:
+                return track
+            stale = self._tracks.get(key)
+            loading = self._loading.setdefault(key, threading.Lock())
+        if not loading.acquire(blocking=stale is None):
+            return stale[0]
+        try:
+            # 等待期间其他请求可能已经完成计算
+            with self._lock:
+                track = self._fresh(key)
+            if track is not None:
+                return track
+            closed = task.end_time is not None
+            track = load_track(task.car.id, task.start_time, task.end_time or datetime.utcnow())
+            with self._lock:
+                self._tracks[key] = (track, closed)
+                self._tracks.move_to_end(key)
+                while len(self._tracks) > self.max_size:
+                    self._tracks.popitem(last=False)
+            return track
+        finally:
+            with self._lock:
+                if self._loading.get(key) is loading:
+                    del self._loading[key]
+            loading.release()
+
+
+track_cache = TrackCache()
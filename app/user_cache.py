@@ -0,0 +1,87 @@
+''' 已认证用户的缓存
+
+令牌认证的每个请求都要按 id 查询一次用户。这里按用户 id 缓存用户文档的原始数据（SON）
+USER_CACHE_TTL 秒，每次 get 都由它新建一个 User 对象，各请求对用户对象的修改互不影响。
+User.save()/delete() 时使缓存失效。缓存只在本进程内有效。
+'''
+import copy
+import threading
+import time
+
+from bson import ObjectId
+
+
+class UserCache(object):
+    def __init__(self, app=None):
+        self.ttl = 30
+        self.max_size = 10000
+        self._users = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        self.max_size = app.config.get('USER_CACHE_SIZE', self.max_size)
+
+    def get(self, user_id):
+        ''' 按 id 获取用户，缓存未命中时查询数据库；用户不存在时返回 None（不缓存） '''
+        from .models import User
+        key = str(user_id)
+        now = time.time()
+        with self._lock:
+            entry = self._users.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+            else:
+                entry = None
+                self.misses += 1
+        if entry is not None:
+            return User._from_son(copy.deepcopy(entry[1]))
+
+        try:
+            user = User.objects(id=ObjectId(key)).first()
+        except Exception:
+            return None
+        if user is not None and self.ttl > 0:
+            son = user.to_mongo()
+            with self._lock:
+                if len(self._users) >= self.max_size:
+                    self._evict(now)
+                self._users[key] = (now + self.ttl, son)
+        return user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+    def _evict(self, now):
+        expired = [key for key, entry in self._users.items() if entry[0] <= now]
+        for key in expired:
+            del self._users[key]
+        if len(self._users) >= self.max_size:
+            self._users.clear()
+
+    def collect(self):
+        ''' 供 app.metrics 输出的统计 '''
+        return [('nds_user_cache_hits_total', 'counter', 'User cache hits.', self.hits),
+                ('nds_user_cache_misses_total', 'counter', 'User cache misses.', self.misses),
+                ('nds_user_cache_size', 'gauge', 'Users currently cached.', len(self._users))]
+
+    def stats(self):
+        with self._lock:
+            hits, misses, size = self.hits, self.misses, len(self._users)
+        total = hits + misses
+        return {
+            'size': size,
+            'ttl': self.ttl,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': float(hits) / total if total else 0.0
+        }
@@ -0,0 +1,7 @@
+''' ASGI 入口，例如：uvicorn asgi:app --workers 4
+需要安装 requirements/asgi.txt 中的依赖
+'''
+import os
+from app.asgi import create_asgi_app
+
+app = create_asgi_app(os.getenv('FLASK_CONFIG') or 'default')
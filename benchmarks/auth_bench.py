@@ -0,0 +1,67 @@
+''' HTTP Basic 认证请求的吞吐量：比较启用与不启用凭据缓存
+
+需要可连接的 MongoDB。运行方式（在项目根目录）：
+    python benchmarks/auth_bench.py --seconds 5
+脚本会创建一个临时用户，结束后删除。
+'''
+import argparse
+import base64
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, credential_cache, limiter  # noqa: E402
+from app.models import User  # noqa: E402
+
+EMAIL = 'auth-bench@example.com'
+PASSWORD = 'auth-bench-password'
+
+
+def run(client, headers, seconds):
+    count = 0
+    started = time.time()
+    while time.time() - started < seconds:
+        response = client.post('/api/v1/tokens/', headers=headers)
+        assert response.status_code == 200, response.status_code
+        count += 1
+    return count / (time.time() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--config', default=os.getenv('FLASK_CONFIG') or 'testing')
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+    # /tokens/ 每个客户端每分钟只允许 10 个请求，测试时关闭限流（与 --config 无关）
+    limiter.enabled = False
+    with app.app_context():
+        User.objects(email=EMAIL).delete()
+        user = User(email=EMAIL, username='auth_bench', name='auth bench', confirmed=True)
+        user.password = PASSWORD
+        user.save()
+        credentials = base64.b64encode(('%s:%s' % (EMAIL, PASSWORD)).encode('utf-8'))
+        headers = {'Authorization': 'Basic ' + credentials.decode('ascii')}
+        try:
+            client = app.test_client()
+            ttl = credential_cache.ttl
+
+            credential_cache.ttl = 0
+            without_cache = run(client, headers, args.seconds)
+
+            credential_cache.ttl = ttl or 60
+            credential_cache.clear()
+            with_cache = run(client, headers, args.seconds)
+        finally:
+            user.delete()
+
+    print('without credential cache: %8.1f req/s' % without_cache)
+    print('with credential cache:    %8.1f req/s' % with_cache)
+    print('speedup:                  %8.1fx' % (with_cache / without_cache))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+''' 开发服务器与生产服务器（manage.py serve）的吞吐量对比
+
+需要可连接的 MongoDB。运行方式（在项目根目录）：
+    python benchmarks/serve_bench.py --seconds 10 --concurrency 32 --path /api/v1/cars/
+脚本依次启动 runserver 和 serve，用多个线程持续请求 path，输出每秒请求数。
+'''
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import URLError
+from urllib.request import urlopen
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def wait_until_ready(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urlopen(url, timeout=1).read()
+            return
+        except (URLError, ConnectionError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError('server did not start: %s' % url)
+
+
+def load(url, seconds, concurrency):
+    stop = time.time() + seconds
+    counts = [0] * concurrency
+    errors = [0] * concurrency
+
+    def worker(i):
+        while time.time() < stop:
+            try:
+                urlopen(url, timeout=10).read()
+                counts[i] += 1
+            except (URLError, ConnectionError, OSError):
+                errors[i] += 1
+    started = time.time()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return sum(counts) / (time.time() - started), sum(errors)
+
+
+def bench(name, command, url, args):
+    env = dict(os.environ, FLASK_CONFIG=args.config)
+    process = subprocess.Popen([sys.executable, 'manage.py'] + command, cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(url)
+        load(url, 1, args.concurrency)  # 预热
+        rps, errors = load(url, args.seconds, args.concurrency)
+    finally:
+        process.terminate()
+        process.wait(10)
+    print('%-28s %8.1f req/s  %d errors' % (name, rps, errors))
+    return rps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--path', default='/api/v1/cars/')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--config', default=os.getenv('FLASK_CONFIG') or 'production')
+    args = parser.parse_args()
+
+    dev = bench('runserver (threaded)', ['runserver', '--threaded', '-p', '5055'],
+                'http://127.0.0.1:5055' + args.path, args)
+    prod = bench('serve (%d workers x %d threads)' % (args.workers, args.threads),
+                 ['serve', '--bind', '127.0.0.1:5056', '--workers', str(args.workers),
+                  '--threads', str(args.threads)],
+                 'http://127.0.0.1:5056' + args.path, args)
+    print('speedup: %.1fx' % (prod / dev if dev else float('nan')))
+
+
+if __name__ == '__main__':
+    main()
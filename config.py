@@ -23,11 +23,84 @@ class Config:
     FLASKY_FOLLOWERS_PER_PAGE = 50
     FLASKY_COMMENTS_PER_PAGE = 30
 
+    # 除 db/host/port 外的项直接传给 MongoClient：连接池大小、等待连接超时、连接/选择服务器/读写超时（毫秒）
     MONGODB_SETTINGS = {
         'db': 'ndsdata',
         'host': 'localhost',
-        'port': 27017
+        'port': 27017,
+        'maxPoolSize': int(os.environ.get('MONGODB_MAX_POOL_SIZE') or 50),
+        'minPoolSize': 0,
+        'maxIdleTimeMS': 60000,
+        'waitQueueTimeoutMS': 2000,
+        'connectTimeoutMS': 5000,
+        'serverSelectionTimeoutMS': 5000,
+        'socketTimeoutMS': 30000
     }
+    # 只读查询（列表、搜索）的读偏好，如 secondaryPreferred；为空时与写入相同，走主节点
+    MONGODB_READ_PREFERENCE = os.environ.get('MONGODB_READ_PREFERENCE')
+    # 只读查询使用单独的连接（格式同 MONGODB_SETTINGS），设置后优先于 MONGODB_READ_PREFERENCE
+    MONGODB_READ_SETTINGS = None
+
+    # last_seen 缓冲写回的间隔（秒），以及判断用户在线的时间窗口（秒）
+    LAST_SEEN_FLUSH_INTERVAL = 60
+    ONLINE_USER_WINDOW = 300
+    # 令牌认证时缓存用户文档的时间（秒），0 表示不缓存
+    USER_CACHE_TTL = 30
+    # 各进程刷新令牌版本表的间隔（秒），其他进程中的令牌吊销最迟在这个时间后生效
+    TOKEN_VERSION_REFRESH = 30
+    # HTTP Basic认证通过后缓存凭据的时间（秒），0 表示不缓存
+    CREDENTIAL_CACHE_TTL = 60
+    # 限流，RATELIMIT_STORAGE_URL 为空时令牌桶保存在进程内存中
+    RATELIMIT_ENABLED = True
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL')
+
+    # 日志，LOG_LISTENER 为 'thread'（进程内线程写文件）或 'process'（单独的监听进程写文件）
+    LOG_FILE = os.environ.get('LOG_FILE', 'nds.log')
+    LOG_MAX_BYTES = 10000000
+    LOG_BACKUP_COUNT = 5
+    LOG_LISTENER = 'thread'
+    LOG_BODY_MAX = 1024
+    LOG_REQUEST_SAMPLE_RATE = 1.0
+
+    # /metrics：多进程部署时各进程每隔 METRICS_DUMP_INTERVAL 秒把指标写入 METRICS_MULTIPROC_DIR，
+    # 输出时汇总所有进程的值；为空时只输出响应请求的进程自己的指标（单进程部署）
+    METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR')
+    METRICS_DUMP_INTERVAL = 10
+
+    # 单个请求的数据库命令数超过该值时记录警告，0 表示不检查
+    DB_QUERY_WARN_THRESHOLD = 20
+    # api请求中超过该耗时（毫秒）的查询连同explain结果记录到固定集合中，0 表示不记录
+    SLOW_QUERY_THRESHOLD_MS = 100
+    SLOW_QUERY_COLLECTION = 'slow_queries'
+    SLOW_QUERY_CAPPED_SIZE = 10 * 1024 * 1024
+
+    # 管理员请求带 X-Profile: 1 头时进行性能分析，结果保存在 PROFILE_DIR
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '').lower() in ['true', 'on', '1']
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(basedir, 'profiles')
+    PROFILE_SAMPLE_INTERVAL = 0.005
+
+    # 车辆GPS数据：每辆车每 TELEMETRY_BUCKET_MINUTES 分钟保存为一个文档，
+    # 原始数据保留 TELEMETRY_RAW_TTL 秒（每个进程第一次写入前按该值创建TTL索引，值变化时用 collMod 修改）
+    TELEMETRY_BUCKET_MINUTES = 10
+    TELEMETRY_RAW_TTL = 7 * 24 * 3600
+    TELEMETRY_MAX_BATCH = 10000
+
+    # 模拟车辆回放：轨迹文件目录、采样间隔（秒）、回放倍速、车辆数（0 表示每个轨迹文件一辆，
+    # 多于文件数时轨迹循环复用）、起始偏移（spread 把各车错开分布在轨迹上，zero 全部从头开始）
+    GHOST_DATA_DIR = os.environ.get('GHOST_DATA_DIR') or './ghost_data'
+    GHOST_SAMPLE_INTERVAL = float(os.environ.get('GHOST_SAMPLE_INTERVAL') or 2.0)
+    GHOST_REPLAY_SPEED = float(os.environ.get('GHOST_REPLAY_SPEED') or 1.0)
+    GHOST_FLEET_SIZE = int(os.environ.get('GHOST_FLEET_SIZE') or 0)
+    GHOST_START_OFFSETS = os.environ.get('GHOST_START_OFFSETS') or 'spread'
+    GHOST_TICK_INTERVAL = 2
+    # 每辆在线车辆保留最近多少次 tick 的位置（/tasks/online/?history=秒）
+    ONLINE_HISTORY_SIZE = 150
+
+    # 后台定时任务在收到第一个请求时启动；多进程部署时持有 SCHEDULER_LOCK_FILE 锁的进程为 leader，
+    # leader 的结果写入 SCHEDULER_STATE_DIR 供其他进程读取
+    SCHEDULER_ENABLED = True
+    SCHEDULER_STATE_DIR = os.environ.get('SCHEDULER_STATE_DIR') or os.path.join(basedir, 'run')
+    SCHEDULER_LOCK_FILE = os.path.join(SCHEDULER_STATE_DIR, 'scheduler.lock')
 
     VEHICLE_TYPE = ('Car', 'Bus', 'SUV', 'Taxi', 'Truck', 'Motorcycle')
     POWER_TYPE = ('Gasoline', 'Electric', 'Hybrid')
@@ -45,11 +118,31 @@ class DevelopmentConfig(Config):
 
 class TestingConfig(Config):
     TESTING = True
+    RATELIMIT_ENABLED = False
+    SCHEDULER_ENABLED = False
+    MONGODB_SETTINGS = dict(Config.MONGODB_SETTINGS, maxPoolSize=10, serverSelectionTimeoutMS=2000)
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite://'
 
 
 class ProductionConfig(Config):
+    LOG_LISTENER = 'process'
+    METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR') or \
+        os.path.join(Config.SCHEDULER_STATE_DIR, 'metrics')
+    LOG_BODY_MAX = 256
+    LOG_REQUEST_SAMPLE_RATE = 0.1
+    # 每个 worker 进程一个连接池；压缩在跨机房或带宽受限时减少传输量（需服务器支持）
+    MONGODB_SETTINGS = dict(Config.MONGODB_SETTINGS,
+                            maxPoolSize=int(os.environ.get('MONGODB_MAX_POOL_SIZE') or 100),
+                            minPoolSize=5,
+                            compressors=os.environ.get('MONGODB_COMPRESSORS') or 'zlib')
+    MONGODB_READ_PREFERENCE = os.environ.get('MONGODB_READ_PREFERENCE') or 'secondaryPreferred'
+    MONGODB_READ_SETTINGS = {
+        'db': 'ndsdata',
+        'host': os.environ.get('MONGODB_READ_HOST'),
+        'port': 27017,
+        'readPreference': 'secondaryPreferred'
+    } if os.environ.get('MONGODB_READ_HOST') else None
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'data.sqlite')
 
@@ -1,10 +1,11 @@
 import os
+import multiprocessing
 from app import create_app, db
 from app.models import User, Car, Driver, Task
 
 
-app = create_app(os.getenv('FLASK_CONFIG') or 'default')
-from flask_script import Manager, Shell
+app = create_app(os.getenv('FLASK_CONFIG') or 'default', profile=os.getenv('FLASK_PROFILE') or 'full')
+from flask_script import Manager, Shell, Command, Option
 from flask_migrate import Migrate, MigrateCommand
 manager = Manager(app)
 # migrate = Migrate(app, db)
@@ -15,5 +16,114 @@ def make_shell_context():
 manager.add_command('shell', Shell(make_context=make_shell_context))
 manager.add_command('db', MigrateCommand)
 
+
+class MigrateData(Command):
+    ''' 批量执行数据迁移，支持断点续跑，例如：python manage.py migrate-data task-is-return '''
+    option_list = (
+        Option('names', nargs='*', help='migrations to run (default: all)'),
+        Option('--batch-size', dest='batch_size', type=int, default=1000),
+        Option('--restart', dest='restart', action='store_true', default=False,
+               help='ignore saved checkpoints'),
+        Option('--list', dest='show', action='store_true', default=False,
+               help='list available migrations'),
+    )
+
+    def run(self, names, batch_size, restart, show):
+        from app.data_migrations import migrations, run_migration
+        if show:
+            for name, migration in migrations.items():
+                print('%-28s %s' % (name, migration.description))
+            return
+        for name in names or list(migrations):
+            run_migration(name, batch_size=batch_size, restart=restart)
+manager.add_command('migrate-data', MigrateData())
+
+
+class Seed(Command):
+    ''' 生成可复现的基准测试数据，例如：python manage.py seed --scale 1000000 --drop '''
+    option_list = (
+        Option('--scale', dest='scale', type=int, default=10000, help='number of tasks'),
+        Option('--seed', dest='seed', type=int, default=2018),
+        Option('--batch-size', dest='batch_size', type=int, default=5000),
+        Option('--processes', dest='processes', type=int, default=None),
+        Option('--drop', dest='drop', action='store_true', default=False,
+               help='drop user/car/driver/task collections first'),
+    )
+
+    def run(self, scale, seed, batch_size, processes, drop):
+        from app.seed import seed_database
+        seed_database(app.config['MONGODB_SETTINGS'], scale, seed=seed,
+                      batch_size=batch_size, processes=processes, drop=drop)
+manager.add_command('seed', Seed())
+
+
+class LogStatsCommand(Command):
+    ''' 统计 nds.log* 中的请求，例如：python manage.py logstats --export profile.json '''
+    option_list = (
+        Option('--files', dest='files', default=None, help='log file glob (default: LOG_FILE*)'),
+        Option('--top', dest='top', type=int, default=20),
+        Option('--export', dest='export', default=None, help='write a JSON traffic profile'),
+    )
+
+    def run(self, files, top, export):
+        from app.logstats import analyze
+        analyze(files or app.config['LOG_FILE'] + '*', top=top, export=export)
+manager.add_command('logstats', LogStatsCommand())
+
+
+class Serve(Command):
+    ''' 生产环境的预分叉服务器（gunicorn，预加载应用），例如：python manage.py serve --workers 4 --threads 8 '''
+    option_list = (
+        Option('--bind', dest='bind', default=os.getenv('SERVE_BIND', '0.0.0.0:8000')),
+        Option('--workers', dest='workers', type=int,
+               default=int(os.getenv('SERVE_WORKERS') or multiprocessing.cpu_count() * 2 + 1)),
+        Option('--threads', dest='threads', type=int, default=int(os.getenv('SERVE_THREADS') or 4)),
+        Option('--timeout', dest='timeout', type=int, default=30),
+        Option('--no-preload', dest='preload', action='store_false', default=True),
+        Option('--access-log', dest='access_log', default=None, help="access log file, '-' for stdout"),
+    )
+
+    def run(self, bind, workers, threads, timeout, preload, access_log):
+        from gunicorn.app.base import BaseApplication
+        from app.metrics import clear_multiproc_dir
+        if app.config.get('METRICS_MULTIPROC_DIR'):
+            clear_multiproc_dir(app.config['METRICS_MULTIPROC_DIR'])
+
+        class Application(BaseApplication):
+            def load_config(self):
+                self.cfg.set('bind', bind)
+                self.cfg.set('workers', workers)
+                self.cfg.set('threads', threads)
+                self.cfg.set('worker_class', 'gthread' if threads > 1 else 'sync')
+                self.cfg.set('timeout', timeout)
+                self.cfg.set('preload_app', preload)
+                self.cfg.set('accesslog', access_log)
+
+            def load(self):
+                if preload:
+                    return app
+                # 不预加载时每个 worker 在 fork 之后各自创建应用，日志监听器和退出处理复用导入 manage.py 时已初始化的
+                return create_app(os.getenv('FLASK_CONFIG') or 'default',
+                                  profile=os.getenv('FLASK_PROFILE') or 'full')
+        Application().run()
+manager.add_command('serve', Serve())
+
+
+class ImportTime(Command):
+    ''' 统计应用的启动耗时，例如：python manage.py importtime --profile api --budget 1500 '''
+    option_list = (
+        Option('--profile', dest='profiles', action='append', choices=['full', 'api'],
+               help='app profile to measure (default: both)'),
+        Option('--top', dest='top', type=int, default=15),
+        Option('--budget', dest='budget', type=float, default=None,
+               help='exit with status 1 if create_app takes longer (ms)'),
+    )
+
+    def run(self, profiles, top, budget):
+        from app.importtime import report
+        return report(os.getenv('FLASK_CONFIG') or 'default', profiles or ['full', 'api'],
+                      top=top, budget=budget)
+manager.add_command('importtime', ImportTime())
+
 if __name__ == '__main__':
-    manager.run()
\ No newline at end of file
+    manager.run()
@@ -0,0 +1,63 @@
+''' 测试使用 TestingConfig，数据库换成内存中的 mongomock，不需要 MongoDB 服务器 '''
+import base64
+
+import mongomock
+import pytest
+from mongoengine.connection import get_db
+
+from app import create_app, credential_cache, last_seen, token_versions, user_cache
+from app.models import User
+from config import TestingConfig
+
+
+@pytest.fixture
+def make_app(monkeypatch, tmp_path):
+    ''' 返回 create_app 的包装，测试结束后清空数据库和进程内的缓存 '''
+    monkeypatch.setattr(TestingConfig, 'MONGODB_SETTINGS',
+                        dict(TestingConfig.MONGODB_SETTINGS, mongo_client_class=mongomock.MongoClient))
+    monkeypatch.setattr(TestingConfig, 'LOG_FILE', str(tmp_path / 'nds.log'))
+    monkeypatch.setattr(TestingConfig, 'SCHEDULER_STATE_DIR', str(tmp_path / 'run'))
+
+    def make(profile='full'):
+        return create_app('testing', profile=profile)
+    yield make
+    database = get_db()
+    database.client.drop_database(database.name)
+    user_cache.clear()
+    token_versions.clear()
+    credential_cache.clear()
+    last_seen._seen.clear()
+    last_seen._pending.clear()
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    def make(username='john', password='cat', **kwargs):
+        kwargs.setdefault('email', '%s@example.com' % username)
+        kwargs.setdefault('name', username)
+        user = User(username=username, **kwargs)
+        user.password = password
+        user.save()
+        return user
+    return make
+
+
+@pytest.fixture
+def basic_auth():
+    ''' 返回生成 HTTP Basic 认证请求头的函数，令牌认证时 password 为空 '''
+    def headers(username, password='', extra=None):
+        credentials = base64.b64encode(('%s:%s' % (username, password)).encode('utf-8')).decode('ascii')
+        return dict({'Authorization': 'Basic ' + credentials, 'Accept': 'application/json'}, **(extra or {}))
+    return headers
@@ -0,0 +1,124 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from pymongo import ReadPreference
+
+pytest.importorskip('starlette')
+pytest.importorskip('motor')
+
+from starlette.testclient import TestClient  # noqa: E402
+
+from app import asgi  # noqa: E402
+from app.models import Car  # noqa: E402
+
+
+class AsyncCursor(object):
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def skip(self, count):
+        self.cursor = self.cursor.skip(count)
+        return self
+
+    def limit(self, count):
+        self.cursor = self.cursor.limit(count)
+        return self
+
+    async def to_list(self, length):
+        return list(self.cursor)
+
+
+class AsyncCollection(object):
+    ''' 用 mongomock 的集合模拟 motor 的接口 '''
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def count_documents(self, query):
+        return self.collection.count_documents(query)
+
+    async def find_one(self, query):
+        return self.collection.find_one(query)
+
+    def find(self, *args):
+        return AsyncCursor(self.collection.find(*args))
+
+
+@pytest.fixture
+def client(make_app, monkeypatch):
+    monkeypatch.setattr(asgi, 'client_options', lambda settings: {})
+    monkeypatch.setattr(asgi.AsyncApi, 'collection',
+                        lambda self, document: AsyncCollection(document._get_collection()))
+    app = asgi.create_asgi_app('testing')
+    with app.state.flask_app.app_context():
+        with TestClient(app) as client:
+            yield client
+
+
+def test_async_routes_match_flask(client):
+    car = Car(CarId='1', LicensePlate='沪A00001')
+    car.save()
+    response = client.get('/api/v1/cars/')
+    assert response.status_code == 200
+    assert response.json()['count'] == 1
+    assert response.headers['X-DB-Queries'] == '2'
+    assert 'X-DB-Time' in response.headers
+    response = client.get('/api/v1/cars/%s' % car.id)
+    assert response.json()['LicensePlate'] == '沪A00001'
+
+
+def test_async_routes_are_logged_and_counted(client):
+    client.get('/api/v1/drivers/?page=1')
+    metrics = client.get('/metrics').text
+    assert 'nds_http_requests_total{endpoint="api.get_drivers",method="GET",status="200"} 1' in metrics
+    log_file = client.app.state.flask_app.config['LOG_FILE']
+    deadline = time.time() + 2
+    while True:
+        with open(log_file, encoding='utf-8') as f:
+            text = f.read()
+        if 'Response:' in text or time.time() > deadline:
+            break
+    assert "Request: testclient GET /api/v1/drivers/ args={'page': ['1']} body=b''" in text
+    assert 'Response: GET /api/v1/drivers/ api.get_drivers 200 ' in text
+
+
+def test_non_object_ids_fall_through_to_flask(client):
+    response = client.get('/api/v1/tasks/search', follow_redirects=False)
+    assert response.status_code in (301, 308)
+    assert response.headers['location'].endswith('/api/v1/tasks/search/')
+    response = client.get('/api/v1/cars/not-an-id', headers={'Accept': 'application/json'})
+    assert response.status_code == 404
+
+
+def make_api(monkeypatch, alias=None, read_preference=None):
+    monkeypatch.setattr(asgi.read_router, 'alias', alias)
+    monkeypatch.setattr(asgi.read_router, 'read_preference', read_preference)
+    config = {'MONGODB_SETTINGS': {'db': 'nds', 'host': 'primary-host'},
+              'MONGODB_READ_SETTINGS': {'db': 'nds-read', 'host': 'read-host', 'port': 27018}}
+    return asgi.AsyncApi(SimpleNamespace(config=config))
+
+
+def test_reads_follow_read_router(monkeypatch):
+    api = make_api(monkeypatch, read_preference=ReadPreference.SECONDARY_PREFERRED)
+    assert api.db.name == 'nds'
+    assert api.db.read_preference == ReadPreference.SECONDARY_PREFERRED
+    # 配置了只读连接时连接该节点，读偏好不再生效
+    api = make_api(monkeypatch, alias='read', read_preference=ReadPreference.SECONDARY_PREFERRED)
+    assert api.db.name == 'nds-read'
+    assert api.db.read_preference == ReadPreference.PRIMARY
+    assert api.client.delegate._topology_settings.seeds == {('read-host', 27018)}
+
+
+def test_one_flask_context_per_request(client, monkeypatch):
+    Car(CarId='1', LicensePlate='沪A00001').save()
+    flask_app = client.app.state.flask_app
+    monkeypatch.setattr(flask_app, 'test_request_context', None)
+    contexts = []
+    request_context = flask_app.request_context
+    monkeypatch.setattr(flask_app, 'request_context',
+                        lambda environ: contexts.append(environ) or request_context(environ))
+    response = client.get('/api/v1/cars/?page=1')
+    assert response.json()['cars'][0]['LicensePlate'] == '沪A00001'
+    assert len(contexts) == 1
+    assert contexts[0]['PATH_INFO'] == '/api/v1/cars/'
+    assert contexts[0]['QUERY_STRING'] == 'page=1'
@@ -0,0 +1,40 @@
+import asyncio
+
+from app.api.broadcast import Broadcaster
+
+
+def test_slow_subscriber_keeps_latest():
+    broadcaster = Broadcaster(queue_size=2)
+    q = broadcaster.subscribe()
+    for data in (b'1', b'2', b'3', b'4'):
+        broadcaster.publish(data)
+    assert [q.get_nowait(), q.get_nowait()] == [b'3', b'4']
+    assert broadcaster.dropped == 2
+
+
+def test_listen_sends_latest_then_keepalive():
+    broadcaster = Broadcaster()
+    broadcaster.publish(b'first')
+    q = broadcaster.subscribe()
+    stream = broadcaster.listen(q, keepalive=0.01)
+    assert next(stream) == b'first'
+    broadcaster.publish(b'second')
+    assert next(stream) == b'second'
+    assert next(stream) == b': keepalive\n\n'
+    stream.close()
+    assert len(broadcaster) == 0
+
+
+def test_async_subscriber():
+    async def run():
+        broadcaster = Broadcaster(queue_size=1)
+        q = broadcaster.subscribe_async()
+        stream = broadcaster.listen_async(q, keepalive=1)
+        broadcaster.publish(b'a')
+        broadcaster.publish(b'b')
+        # latest 先发送，随后是队列中保留的最新一条
+        assert await stream.__anext__() == b'b'
+        assert await stream.__anext__() == b'b'
+        await stream.aclose()
+        return len(broadcaster)
+    assert asyncio.run(run()) == 0
@@ -0,0 +1,39 @@
+from app import credential_cache
+from app.models import User
+
+
+def test_lookup_and_invalidate(make_user):
+    user = make_user()
+    digest = credential_cache.digest(user.email, 'cat')
+    assert credential_cache.lookup(digest) is None
+    credential_cache.add(digest, user)
+    assert credential_cache.lookup(digest) == (str(user.id), user.password_hash)
+    assert credential_cache.digest(user.email, 'dog') != digest
+    credential_cache.invalidate_user(user.id)
+    assert credential_cache.lookup(digest) is None
+
+
+def test_cached_login_skips_password_hash(client, make_user, monkeypatch, basic_auth):
+    user = make_user()
+    headers = basic_auth(user.email, 'cat')
+    assert client.post('/api/v1/tokens/', headers=headers).status_code == 200
+
+    def fail(self, password):
+        raise AssertionError('password hash checked again')
+    monkeypatch.setattr(User, 'verify_password', fail)
+    assert client.post('/api/v1/tokens/', headers=headers).status_code == 200
+
+
+def test_wrong_password_is_not_cached(client, make_user, basic_auth):
+    user = make_user()
+    assert client.post('/api/v1/tokens/', headers=basic_auth(user.email, 'dog')).status_code == 401
+    assert credential_cache.lookup(credential_cache.digest(user.email, 'dog')) is None
+
+
+def test_old_password_rejected_after_change(client, make_user, basic_auth):
+    user = make_user()
+    assert client.post('/api/v1/tokens/', headers=basic_auth(user.email, 'cat')).status_code == 200
+    user.password = 'dog'
+    user.save()
+    assert client.post('/api/v1/tokens/', headers=basic_auth(user.email, 'cat')).status_code == 401
+    assert client.post('/api/v1/tokens/', headers=basic_auth(user.email, 'dog')).status_code == 200
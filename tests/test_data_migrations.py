@@ -0,0 +1,78 @@
+from datetime import datetime
+
+import pytest
+
+from app.data_migrations import checkpoints, run_migration
+from app.models import Driver, Task
+
+
+def insert_tasks(count):
+    now = datetime(2019, 1, 1)
+    docs = [{'start_time': now, 'end_time': now if i % 2 else None, 'is_return': not i % 2}
+            for i in range(count)]
+    return Task._get_collection().insert_many(docs).inserted_ids
+
+
+def is_return(ids):
+    return [doc['is_return'] for doc in Task._get_collection().find({'_id': {'$in': ids}}, sort=[('_id', 1)])]
+
+
+def test_task_is_return_in_batches(app):
+    ids = insert_tasks(5)
+    lines = []
+    count, _ = run_migration('task-is-return', batch_size=2, log=lines.append)
+    assert count == 5
+    assert is_return(ids) == [False, True, False, True, False]
+    state = checkpoints().find_one({'_id': 'task-is-return'})
+    assert state['last_id'] == ids[-1]
+    assert state['processed'] == 5
+    assert state['finished_at'] is not None
+
+
+def test_finished_migration_is_skipped_unless_restarted(app):
+    insert_tasks(3)
+    run_migration('task-is-return', log=lambda line: None)
+    assert run_migration('task-is-return', log=lambda line: None)[0] == 0
+    assert run_migration('task-is-return', restart=True, log=lambda line: None)[0] == 3
+
+
+def test_resume_after_checkpoint(app):
+    ids = insert_tasks(4)
+    checkpoints().insert_one({'_id': 'task-is-return', 'last_id': ids[1], 'processed': 2})
+    count, _ = run_migration('task-is-return', batch_size=10, log=lambda line: None)
+    assert count == 2
+    # 检查点之前的文档不再处理
+    assert is_return(ids) == [True, False, False, True]
+    assert checkpoints().find_one({'_id': 'task-is-return'})['processed'] == 4
+
+
+def test_unknown_migration(app):
+    with pytest.raises(KeyError):
+        run_migration('no-such-migration')
+
+
+def test_driver_merge_name(app):
+    collection = Driver._get_collection()
+    collection.insert_many([
+        {'DriverId': '1', 'FirstName': 'Ada', 'LastName': 'Lovelace'},
+        {'DriverId': '2', 'LastName': 'Hopper'},
+        {'DriverId': '3', 'Name': 'Kept', 'FirstName': 'Old'},
+        {'DriverId': '4', 'Name': 'Plain'},
+    ])
+    count, _ = run_migration('driver-merge-name', batch_size=2, log=lambda line: None)
+    # 已经只有 Name 的文档不在 query 范围内
+    assert count == 3
+    docs = list(collection.find({}, projection={'_id': False}, sort=[('DriverId', 1)]))
+    assert docs == [{'DriverId': '1', 'Name': 'Ada Lovelace'},
+                    {'DriverId': '2', 'Name': 'Hopper'},
+                    {'DriverId': '3', 'Name': 'Kept'},
+                    {'DriverId': '4', 'Name': 'Plain'}]
+
+
+def test_delete_generated_drivers(app):
+    collection = Driver._get_collection()
+    collection.insert_many([{'DriverId': driver_id, 'Name': 'x'}
+                            for driver_id in ('100000', '100001', '99999999', 'abc', None)])
+    count, _ = run_migration('delete-generated-drivers', batch_size=2, log=lambda line: None)
+    assert count == 5
+    assert sorted(str(doc['DriverId']) for doc in collection.find()) == ['100000', 'None', 'abc']
@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+
+from flask import g
+
+from app import db_monitor
+
+
+def command_events(request_id, name, collection, micros, reply):
+    started = SimpleNamespace(request_id=request_id, command_name=name,
+                              command={name: collection}, database_name='ndsdata')
+    succeeded = SimpleNamespace(request_id=request_id, command_name=name,
+                                duration_micros=micros, reply=reply)
+    return started, succeeded
+
+
+def test_commands_are_counted_per_request(app):
+    with app.test_request_context('/api/v1/cars/'):
+        for request_id in range(3):
+            started, succeeded = command_events(request_id, 'find', 'car', 1500,
+                                                {'cursor': {'firstBatch': [{}, {}]}})
+            db_monitor.started(started)
+            db_monitor.succeeded(succeeded)
+        stats = g._db_stats
+        assert stats.count == 3
+        assert stats.time == 4.5
+        assert stats.commands[0] == ('find', 'car', 1.5, 2)
+        response = db_monitor._after_request(app.response_class())
+        assert response.headers['X-DB-Queries'] == '3'
+        assert response.headers['X-DB-Time'] == '4.5'
+
+
+def test_commands_outside_requests_are_ignored(app):
+    started, succeeded = command_events(1, 'find', 'car', 1000, {})
+    db_monitor.started(started)
+    db_monitor.succeeded(succeeded)
+    assert db_monitor.stats() is None
+
+
+def test_headers_without_queries(client):
+    response = client.get('/metrics')
+    assert response.headers['X-DB-Queries'] == '0'
+    assert response.headers['X-DB-Time'] == '0.0'
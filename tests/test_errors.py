@@ -0,0 +1,31 @@
+import pytest
+from bson import ObjectId
+
+JSON = {'Accept': 'application/json'}
+
+
+@pytest.fixture(params=['full', 'api'])
+def profile_client(request, make_app):
+    app = make_app(request.param)
+    with app.app_context():
+        yield app.test_client()
+
+
+def test_abort_404_returns_json(profile_client):
+    for path in ('/api/v1/cars/not-an-id', '/api/v1/cars/%s' % ObjectId(), '/api/v1/no-such-route'):
+        response = profile_client.get(path, headers=JSON)
+        assert response.status_code == 404
+        assert response.is_json
+        assert response.get_json()['error'] == 'notfound'
+
+
+def test_html_clients_get_default_page(profile_client):
+    response = profile_client.get('/api/v1/no-such-route', headers={'Accept': 'text/html'})
+    assert response.status_code == 404
+    assert not response.is_json
+
+
+def test_api_profile_skips_html_pages(make_app):
+    app = make_app('api')
+    assert 'main' not in app.blueprints
+    assert {'api', 'auth'} <= set(app.blueprints)
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from app.geo import GridIndex, haversine, parse_bbox, parse_point
+
+
+@pytest.fixture
+def points():
+    rng = np.random.RandomState(3)
+    return rng.uniform(121.0, 122.0, 2000), rng.uniform(30.8, 31.6, 2000)
+
+
+def test_bbox_matches_brute_force(points):
+    lon, lat = points
+    grid = GridIndex(lon, lat)
+    for box in ([121.2, 31.0, 121.25, 31.1], [121.0, 30.8, 122.0, 31.6], [100, 10, 101, 11]):
+        expected = np.nonzero((lon >= box[0]) & (lon <= box[2]) & (lat >= box[1]) & (lat <= box[3]))[0]
+        assert grid.bbox(*box).tolist() == expected.tolist()
+
+
+def test_wide_bbox_falls_back_to_full_scan(points):
+    lon, lat = points
+    grid = GridIndex(lon, lat, max_columns=2)
+    assert len(grid.bbox(121.0, 30.8, 122.0, 31.6)) == 2000
+
+
+def test_near_sorted_by_distance(points):
+    lon, lat = points
+    grid = GridIndex(lon, lat)
+    indices, distances = grid.near(121.5, 31.2, 2000)
+    expected = np.nonzero(haversine(121.5, 31.2, lon, lat) <= 2000)[0]
+    assert sorted(indices.tolist()) == expected.tolist()
+    assert (np.diff(distances) >= 0).all()
+
+
+def test_empty_index():
+    grid = GridIndex([], [])
+    assert len(grid.bbox(0, 0, 1, 1)) == 0
+    assert len(grid.near(0, 0, 100)[0]) == 0
+
+
+def test_haversine():
+    # 纬度 1 度约 111 公里
+    assert abs(haversine(121.0, 31.0, 121.0, 32.0) - 111195) < 10
+
+
+def test_parse_arguments():
+    assert parse_bbox('121,31,122,32') == [121, 31, 122, 32]
+    assert parse_point('121.5,31.2') == [121.5, 31.2]
+    for value in ('122,31,121,32', '1,2,3'):
+        with pytest.raises(ValueError):
+            parse_bbox(value)
+    with pytest.raises(ValueError):
+        parse_point('200,31')
@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+
+from app import scheduler
+from app.api import ghost_car
+from app.api.ghost_car import COORD_SCALE, ReplayEngine, convert_track, load_tracks, pack_tracks
+from config import TestingConfig
+
+
+def write_csv(path, points):
+    with open(str(path), 'w') as f:
+        f.write('time,lon,lat\n')
+        for i, (lon, lat) in enumerate(points):
+            f.write('%d,%f,%f\n' % (i, lon, lat))
+
+
+def test_convert_track(tmp_path):
+    csv_path = tmp_path / 'car_0.csv'
+    write_csv(csv_path, [(121.5, 31.25), (121.500001, 31.250002)])
+    npy_path = convert_track(str(csv_path))
+    track = np.load(npy_path)
+    assert track.dtype == np.int32
+    assert track.tolist() == [[121500000, 31250000], [121500001, 31250002]]
+    # 已是最新时不再转换
+    mtime = os.path.getmtime(npy_path)
+    assert convert_track(str(csv_path)) == npy_path
+    assert os.path.getmtime(npy_path) == mtime
+
+
+def test_csv_update_is_reconverted(tmp_path):
+    csv_path = tmp_path / 'car_0.csv'
+    write_csv(csv_path, [(121.5, 31.25)])
+    npy_path = convert_track(str(csv_path))
+    write_csv(csv_path, [(120.0, 30.0), (120.1, 30.1)])
+    os.utime(str(csv_path), (os.path.getmtime(npy_path) + 10,) * 2)
+    assert np.load(convert_track(str(csv_path))).shape == (2, 2)
+
+
+def test_load_tracks_in_numeric_order(tmp_path):
+    for index in (10, 2, 1):
+        write_csv(tmp_path / ('car_%d.csv' % index), [(index, index)])
+    write_csv(tmp_path / 'car_3.csv', [])
+    tracks = load_tracks(str(tmp_path))
+    assert [int(track[0][0]) // COORD_SCALE for track in tracks] == [1, 2, 10]
+    assert all(isinstance(track, np.memmap) for track in tracks)
+
+
+def test_pack_tracks_is_memory_mapped(tmp_path):
+    write_csv(tmp_path / 'car_0.csv', [(121.0, 31.0), (121.1, 31.1)])
+    write_csv(tmp_path / 'car_1.csv', [])
+    write_csv(tmp_path / 'car_2.csv', [(120.0, 30.0)])
+    engine = ReplayEngine(str(tmp_path), sample_interval=1.0, start_offsets='zero')
+    engine.load()
+    assert isinstance(engine.points, np.memmap)
+    assert engine.points.shape == (3, 2)
+    # 空轨迹不对应车辆
+    assert engine.car_offsets.tolist() == [0, 2]
+    assert engine.positions_at(0).tolist() == [[121.0, 31.0], [120.0, 30.0]]
+
+
+def test_pack_is_rebuilt_after_csv_update(tmp_path):
+    write_csv(tmp_path / 'car_0.csv', [(121.0, 31.0)])
+    packed_path, lengths = pack_tracks(str(tmp_path))
+    mtime = os.path.getmtime(packed_path)
+    assert pack_tracks(str(tmp_path))[1].tolist() == [1]
+    assert os.path.getmtime(packed_path) == mtime
+    write_csv(tmp_path / 'car_0.csv', [(120.0, 30.0), (120.1, 30.1)])
+    os.utime(str(tmp_path / 'car_0.csv'), (mtime + 10,) * 2)
+    write_csv(tmp_path / 'car_1.csv', [(122.0, 32.0)])
+    os.utime(str(tmp_path / 'car_1.csv'), (mtime + 10,) * 2)
+    packed_path, lengths = pack_tracks(str(tmp_path))
+    assert lengths.tolist() == [2, 1]
+    assert np.load(packed_path).tolist() == [[120000000, 30000000], [120100000, 30100000],
+                                             [122000000, 32000000]]
+
+
+def test_engine_and_jobs_follow_app_config(make_app, monkeypatch, tmp_path):
+    monkeypatch.setattr(TestingConfig, 'GHOST_DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(TestingConfig, 'GHOST_FLEET_SIZE', 7)
+    monkeypatch.setattr(TestingConfig, 'GHOST_TICK_INTERVAL', 6)
+    make_app()
+    assert (ghost_car.engine.data_dir, ghost_car.engine.fleet_size) == (str(tmp_path), 7)
+    assert scheduler.jobs['ghost_car.tick'][1] == 6
+    assert scheduler.jobs['ghost_car.sync'][1] == 3
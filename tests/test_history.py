@@ -0,0 +1,76 @@
+import time
+
+import numpy as np
+import pytest
+
+from app.api import tasks
+from app.history import RingBuffer
+from app.models import Car, Driver
+from config import TestingConfig
+
+
+def test_window_returns_points_in_time_order():
+    buffer = RingBuffer(capacity=3)
+    for second in range(5):
+        buffer.append([[121.0 + second, 31.0], [120.0, 30.0 + second]], when=100.0 + second)
+    assert len(buffer) == 3
+    times, points = buffer.window(0)
+    assert times.tolist() == [102.0, 103.0, 104.0]
+    assert points.shape == (2, 3, 2)
+    assert points[0, :, 0].tolist() == [123.0, 124.0, 125.0]
+    times, points = buffer.window(103.5, indices=[1])
+    assert times.tolist() == [104.0]
+    assert points.tolist() == [[[120.0, 34.0]]]
+
+
+def test_fleet_size_change_restarts():
+    buffer = RingBuffer(capacity=3)
+    buffer.append([[121.0, 31.0]], when=1.0)
+    buffer.append([[121.0, 31.0], [120.0, 30.0]], when=2.0)
+    times, points = buffer.window(0)
+    assert times.tolist() == [2.0]
+    assert points.shape == (2, 1, 2)
+
+
+def test_empty_window():
+    times, points = RingBuffer().window(0, indices=[0, 1])
+    assert len(times) == 0
+    assert points.shape == (2, 0, 2)
+
+
+@pytest.fixture
+def online(app, monkeypatch):
+    Car(CarId='1', LicensePlate='沪A00001').save()
+    Driver(DriverId='1', Name='driver').save()
+    positions = np.array([[121.0, 31.0], [121.5, 31.5]])
+    history = RingBuffer(capacity=10)
+    now = time.time()
+    history.append(positions - 0.1, now - 100)
+    history.append(positions, now)
+    monkeypatch.setattr(tasks, 'fleet', [])
+    monkeypatch.setattr(tasks, 'online_index', [None])
+    monkeypatch.setattr(tasks, 'online_history', history)
+    monkeypatch.setattr(tasks, 'get_current_pos', lambda: positions)
+    return positions
+
+
+def test_online_history_endpoint(client, online):
+    data = client.get('/api/v1/tasks/online/?history=50').get_json()
+    assert data['count'] == 2
+    # 当前位置与原来的接口一样是字符串
+    assert data['tasks'][1]['position'] == ['121.500000', '31.500000']
+    assert [point[1:] for point in data['tasks'][0]['history']] == [[121.0, 31.0]]
+    data = client.get('/api/v1/tasks/online/?history=300&bbox=121.4,31.4,121.6,31.6').get_json()
+    assert data['count'] == 1
+    assert [point[1:] for point in data['tasks'][0]['history']] == [[121.4, 31.4], [121.5, 31.5]]
+    assert client.get('/api/v1/tasks/online/?history=-1').status_code == 400
+
+
+def test_capacity_follows_app_config(make_app, monkeypatch):
+    monkeypatch.setattr(TestingConfig, 'ONLINE_HISTORY_SIZE', 12)
+    make_app()
+    assert tasks.online_history.capacity == 12
+    history = RingBuffer(capacity=3)
+    history.append(np.zeros((2, 2)), 1.0)
+    history.resize(5)
+    assert (history.capacity, len(history)) == (5, 0)
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app import last_seen
+from app.last_seen import LastSeenTracker
+from app.models import User
+
+
+@pytest.fixture
+def tracker():
+    tracker = LastSeenTracker()
+    tracker.online_window = 300
+    return tracker
+
+
+def test_ping_does_not_write(tracker, monkeypatch):
+    monkeypatch.setattr(tracker, 'flush', lambda: pytest.fail('ping must not flush'))
+    tracker.ping('a')
+    assert tracker.last_seen('a') is not None
+    assert 'a' in tracker._pending
+
+
+def test_online_users_window(tracker):
+    now = datetime.utcnow()
+    tracker.ping('new', now - timedelta(seconds=10))
+    tracker.ping('old', now - timedelta(seconds=200))
+    tracker.ping('gone', now - timedelta(seconds=400))
+    assert [user_id for user_id, _ in tracker.online_users()] == ['new', 'old']
+    assert [user_id for user_id, _ in tracker.online_users(60)] == ['new']
+    # 较小的 window 不会清理其他用户的记录
+    assert set(tracker._seen) == {'new', 'old'}
+    # 超过 ONLINE_USER_WINDOW 的 window 被截断
+    assert len(tracker.online_users(10 ** 9)) == 2
+
+
+def test_flush_writes_latest_time(make_user):
+    user = make_user()
+    when = datetime(2030, 1, 1)
+    last_seen.ping(user.id, when)
+    assert last_seen.flush() == 1
+    assert User.objects(id=user.id).first().last_seen == when
+    assert last_seen.flush() == 0
+
+
+def test_flush_failure_keeps_pending(app, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('mongo unavailable')
+    monkeypatch.setattr(User._get_collection(), 'bulk_write', fail)
+    user_id = ObjectId()
+    last_seen.ping(user_id)
+    with pytest.raises(RuntimeError):
+        last_seen.flush()
+    assert user_id in last_seen._pending
+
+
+def test_online_endpoint_requires_admin(client, make_user, basic_auth):
+    make_user()
+    assert client.get('/api/v1/users/online/').status_code == 401
+    response = client.get('/api/v1/users/online/', headers=basic_auth('john@example.com', 'cat'))
+    assert response.status_code == 403
+
+
+def test_online_endpoint_rejects_bad_window(client, make_user, basic_auth):
+    make_user('admin', admin=True)
+    headers = basic_auth('admin@example.com', 'cat')
+    last_seen.ping(ObjectId())
+    assert client.get('/api/v1/users/online/?window=-5', headers=headers).status_code == 400
+    assert client.get('/api/v1/users/online/?window=0', headers=headers).status_code == 400
+    response = client.get('/api/v1/users/online/?window=1000000', headers=headers)
+    assert response.status_code == 200
+    # 管理员本次请求也被记录
+    assert response.get_json()['count'] == 2
+
+
+def test_atexit_flush_registered_once(monkeypatch, app):
+    registered = []
+    monkeypatch.setattr('atexit.register', registered.append)
+    tracker = LastSeenTracker()
+    tracker.init_app(app)
+    tracker.init_app(app)
+    assert registered == [tracker.flush]
@@ -0,0 +1,80 @@
+import time
+
+
+def read_log(app, marker, timeout=2.0):
+    ''' 日志由监听线程异步写入，等待包含 marker 的行出现 '''
+    deadline = time.time() + timeout
+    while True:
+        with open(app.config['LOG_FILE'], encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        if any(marker in line for line in lines) or time.time() > deadline:
+            return lines
+
+
+def test_request_and_response_are_logged(app, client):
+    client.get('/api/v1/cars/?page=2', headers={'Accept': 'application/json'})
+    lines = read_log(app, 'Response:')
+    requests = [line for line in lines if 'Request:' in line]
+    responses = [line for line in lines if 'Response:' in line]
+    assert len(requests) == 1 and len(responses) == 1
+    assert "GET /api/v1/cars/ args={'page': ['2']}" in requests[0]
+    assert ' api.get_cars ' in responses[0]
+
+
+def test_body_is_truncated(app, client):
+    app.config['LOG_BODY_MAX'] = 8
+    client.post('/api/v1/cars/', data=b'x' * 100, content_type='application/json')
+    request = [line for line in read_log(app, 'Response:') if 'Request:' in line][0]
+    assert "body=b'xxxxxxxx...(100 bytes)'" in request
+
+
+def test_sampling_skips_request_lines(app, client):
+    app.config['LOG_REQUEST_SAMPLE_RATE'] = 0.0
+    client.get('/api/v1/cars/')
+    lines = read_log(app, 'Response:')
+    assert not [line for line in lines if 'Request:' in line]
+    # 响应行不采样，logstats 依靠它统计延迟
+    assert [line for line in lines if 'Response:' in line]
+
+
+def test_repeated_create_app_shares_one_listener(app, make_app, client):
+    from app import logs
+    handler = logs._listener['handler']
+    second = make_app()
+    assert second.logger.handlers.count(handler) == 1
+    assert logs._listener['handler'] is handler
+    client.get('/api/v1/cars/?page=3')
+    lines = read_log(app, 'Response:')
+    assert len([line for line in lines if "args={'page': ['3']}" in line]) == 1
+
+
+def test_hooks_are_registered_once(make_app, monkeypatch):
+    from app import logs
+    calls = []
+    monkeypatch.setattr(logs, '_hooks_installed', [])
+    monkeypatch.setattr(logs.atexit, 'register', calls.append)
+    make_app()
+    make_app()
+    assert calls.count(logs._stop_listener) == 1
+
+
+def test_process_listener_started_once_per_process(make_app, monkeypatch):
+    # manage.py serve --no-preload：worker 中再次 create_app 时复用监听进程和 QueueHandler
+    from app import logs
+    from config import TestingConfig
+    monkeypatch.setattr(TestingConfig, 'LOG_LISTENER', 'process')
+    started = []
+    start_listener = logs._start_listener
+    monkeypatch.setattr(logs, '_start_listener',
+                        lambda mode, config: started.append(mode) or start_listener(mode, config))
+    first = make_app()
+    second = make_app()
+    try:
+        assert started == ['process']
+        handler = logs._listener['handler']
+        assert first.logger is second.logger
+        assert first.logger.handlers.count(handler) == 1
+        first.logger.info('process listener marker')
+        assert any('process listener marker' in line for line in read_log(first, 'process listener marker'))
+    finally:
+        logs._stop_listener()
@@ -0,0 +1,85 @@
+import json
+import os
+
+from app.logstats import LatencyHistogram, LogStats, SpaceSaving, analyze, log_files
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LINES = [
+    "[2026-01-01 10:00:00,001] {app/logs.py:96} INFO - Request: 127.0.0.1 GET /api/v1/tasks/search/ "
+    "args={'car': ['1'], 'page': ['2']} body=b''",
+    "[2026-01-01 10:00:00,010] {app/logs.py:105} INFO - Response: GET /api/v1/tasks/search/ "
+    "api.search_tasks 200 12.5ms",
+    "[2026-01-01 10:00:05,000] {app/logs.py:96} INFO - Request: 127.0.0.1 GET /api/v1/tasks/search/ "
+    "args={'page': ['1'], 'car': ['3']} body=b''",
+    "[2026-01-01 10:00:05,100] {app/logs.py:105} INFO - Response: GET /api/v1/tasks/search/ "
+    "api.search_tasks 500 100.0ms",
+    "continuation of a multi-line message",
+]
+
+LEGACY_LINES = [
+    "[2019-01-15 14:46:13,669] {authentication.py:36} INFO - ------------------------------------",
+    "[2019-01-15 14:46:13,673] {authentication.py:38} INFO - Address: 127.0.0.1  Methods: GET",
+    "[2019-01-15 14:46:13,674] {authentication.py:39} INFO - Args: ImmutableMultiDict([('page', '1'), "
+    "('CarId', '')])",
+    "[2019-01-15 14:46:13,675] {authentication.py:40} INFO - Body: b''",
+    "[2019-01-15 14:47:00,000] {authentication.py:38} INFO - Address: 127.0.0.1  Methods: DELETE",
+    "[2019-01-15 14:47:00,001] {authentication.py:39} INFO - Args: ImmutableMultiDict([])",
+    "[2019-01-15 14:30:44,349] {authentication.py:38} INFO - ImmutableMultiDict([('page', '8')])",
+]
+
+
+def test_latency_percentiles_within_bucket_error():
+    histogram = LatencyHistogram()
+    for ms in range(1, 101):
+        histogram.add(float(ms))
+    assert abs(histogram.percentile(50) - 50) <= 5
+    assert abs(histogram.percentile(99) - 99) <= 10
+    assert histogram.percentile(100) == 100
+
+
+def test_space_saving_keeps_heavy_hitters():
+    top = SpaceSaving(capacity=3)
+    for key in ['a'] * 10 + ['b'] * 5 + list('cdefg'):
+        top.add(key)
+    assert [key for key, _ in top.top(2)] == ['a', 'b']
+
+
+def test_requests_and_responses():
+    stats = LogStats()
+    for line in LINES:
+        stats.add_line(line)
+    assert stats.lines == 5 and stats.requests == 2
+    endpoint = stats.endpoints[('GET', 'api.search_tasks')]
+    assert endpoint.latency.total == 2
+    assert dict(endpoint.statuses) == {'200': 1, '500': 1}
+    assert stats.patterns.top(1) == [('GET /api/v1/tasks/search/ ?car&page', 2)]
+    profile = stats.traffic_profile()
+    assert profile['duration_seconds'] == 5
+    assert profile['requests'][0]['example'] == '/api/v1/tasks/search/?car=1&page=2'
+
+
+def test_legacy_lines():
+    stats = LogStats()
+    for line in LEGACY_LINES:
+        stats.add_line(line)
+    assert stats.requests == stats.legacy_requests == 3
+    assert dict(stats.legacy_patterns.top(5)) == {'GET ?CarId&page': 1, 'DELETE': 1, '- ?page': 1}
+    assert not stats.endpoints
+    assert 'legacy format' in stats.report()
+    assert stats.traffic_profile()['requests'] == []
+
+
+def test_analyze_repository_log(tmp_path):
+    export = str(tmp_path / 'profile.json')
+    stats = analyze(os.path.join(ROOT, 'nds.log'), export=export, log=lambda text: None)
+    assert stats.legacy_requests > 0
+    with open(export) as f:
+        assert json.load(f)['start'] == stats.first
+
+
+def test_log_files_order(tmp_path):
+    for name in ('nds.log', 'nds.log.1', 'nds.log.2.gz', 'nds.log.10'):
+        (tmp_path / name).write_text('')
+    names = [os.path.basename(path) for path in log_files(str(tmp_path / 'nds.log*'))]
+    assert names == ['nds.log.10', 'nds.log.2.gz', 'nds.log.1', 'nds.log']
@@ -0,0 +1,81 @@
+import json
+import os
+import subprocess
+import sys
+
+from app.metrics import Counter, Histogram, Metrics, clear_multiproc_dir
+
+
+def test_counter_samples():
+    counter = Counter('requests_total', 'Requests.', ('endpoint', 'status'))
+    counter.inc('api.get_cars', 200)
+    counter.inc('api.get_cars', 200, amount=2)
+    counter.inc('api.get_car', 404)
+    assert list(counter.samples()) == [
+        ('requests_total', '{endpoint="api.get_car",status="404"}', 1),
+        ('requests_total', '{endpoint="api.get_cars",status="200"}', 3)]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency', 'Latency.', ('endpoint',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe('e', value=value)
+    samples = {(name, labels): value for name, labels, value in histogram.samples()}
+    assert samples[('latency_bucket', '{endpoint="e",le="0.1"}')] == 1
+    assert samples[('latency_bucket', '{endpoint="e",le="1.0"}')] == 3
+    assert samples[('latency_bucket', '{endpoint="e",le="+Inf"}')] == 4
+    assert samples[('latency_count', '{endpoint="e"}')] == 4
+    assert samples[('latency_sum', '{endpoint="e"}')] == 6.05
+
+
+def test_metrics_endpoint(client):
+    client.get('/api/v1/cars/')
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'nds_http_requests_total{endpoint="api.get_cars",method="GET",status="' in text
+    assert 'nds_http_request_duration_seconds_count{endpoint="api.get_cars"}' in text
+
+
+def test_collectors_are_registered_once(make_app):
+    make_app()
+    app = make_app()
+    text = app.test_client().get('/metrics').get_data(as_text=True)
+    assert text.count('# TYPE nds_user_cache_hits_total counter') == 1
+
+
+def write_process(directory, pid, requests, in_flight):
+    path = directory / ('metrics-%d-1.json' % pid)
+    path.write_text(json.dumps({'pid': pid, 'metrics': {
+        'nds_http_requests_total': [[['api.get_cars', 'GET', 200], requests]],
+        'nds_http_request_duration_seconds': [[['api.get_cars'], [requests] + [0] * 11 + [0.5]]],
+        'nds_http_requests_in_flight': [[['api.get_cars'], in_flight]],
+    }}))
+
+
+def test_multiprocess_render_sums_workers(tmp_path):
+    metrics = Metrics()
+    metrics.multiproc_dir = str(tmp_path)
+    metrics.requests.inc('api.get_cars', 'GET', 200)
+    metrics.in_flight.inc('api.get_cars')
+    metrics.latency.observe('api.get_cars', value=0.001)
+    dead = subprocess.Popen([sys.executable, '-c', '']).pid
+    os.waitpid(dead, 0)
+    write_process(tmp_path, os.getppid(), 2, 1)
+    write_process(tmp_path, dead, 4, 3)
+    text = metrics.render().get_data(as_text=True)
+    # 计数器和直方图包括已退出的进程，gauge 只统计仍在运行的进程
+    assert 'nds_http_requests_total{endpoint="api.get_cars",method="GET",status="200"} 7' in text
+    assert 'nds_http_request_duration_seconds_count{endpoint="api.get_cars"} 7' in text
+    assert 'nds_http_requests_in_flight{endpoint="api.get_cars"} 2' in text
+
+
+def test_dump_is_read_by_other_processes(tmp_path):
+    worker, other = Metrics(), Metrics()
+    worker.multiproc_dir = other.multiproc_dir = str(tmp_path)
+    worker.requests.inc('api.get_cars', 'GET', 200, amount=5)
+    worker.dump()
+    # 同一进程中的另一个实例把 worker 的文件当作其他进程的文件读取
+    other._dump_file = (os.getpid(), str(tmp_path / 'metrics-other.json'))
+    text = other.render().get_data(as_text=True)
+    assert 'nds_http_requests_total{endpoint="api.get_cars",method="GET",status="200"} 5' in text
+    clear_multiproc_dir(str(tmp_path))
+    assert not list(tmp_path.glob('metrics-*.json'))
@@ -0,0 +1,49 @@
+import os
+
+import pytest
+from mongoengine.connection import get_connection
+
+from app import prefork
+from app.models import User
+
+
+def test_reset_drops_cached_clients(make_user):
+    make_user()
+    client = get_connection()
+    assert User._collection is not None
+    prefork.reset_mongo_connections()
+    assert User._collection is None
+    # 下一次查询时按已注册的设置重新连接（mongomock 的新客户端不共享数据）
+    User.objects.count()
+    assert User._collection is not None
+    assert get_connection() is not client
+
+
+def test_install_registers_once(monkeypatch):
+    if not hasattr(os, 'register_at_fork'):
+        pytest.skip('os.register_at_fork is not available')
+    calls = []
+    monkeypatch.setattr(os, 'register_at_fork', lambda **kwargs: calls.append(kwargs))
+    monkeypatch.setattr(prefork, '_installed', [])
+    prefork.install()
+    prefork.install()
+    assert calls == [{'after_in_child': prefork.reset_mongo_connections}]
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='os.fork is not available')
+def test_child_reconnects_after_fork(make_user):
+    make_user()
+    parent = get_connection()
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            ok = User._collection is None and get_connection() is not parent
+            os.write(write, b'1' if ok else b'0')
+        finally:
+            os._exit(0)
+    os.close(write)
+    result = os.read(read, 1)
+    os.close(read)
+    os.waitpid(pid, 0)
+    assert result == b'1'
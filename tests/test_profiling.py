@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+from config import TestingConfig
+
+
+@pytest.fixture
+def profiled_client(make_app, monkeypatch, tmp_path):
+    monkeypatch.setattr(TestingConfig, 'PROFILING_ENABLED', True)
+    monkeypatch.setattr(TestingConfig, 'PROFILE_DIR', str(tmp_path / 'profiles'))
+    app = make_app()
+    with app.app_context():
+        yield app.test_client()
+
+
+PROFILE = {'X-Profile': '1'}
+
+
+def test_admin_request_is_profiled(profiled_client, make_user, tmp_path, basic_auth):
+    make_user('admin', admin=True)
+    response = profiled_client.get('/api/v1/cars/', headers=basic_auth('admin@example.com', 'cat', PROFILE))
+    profile_id = response.headers['X-Profile-Id']
+    files = sorted(os.listdir(str(tmp_path / 'profiles')))
+    assert files == [profile_id + '.collapsed', profile_id + '.prof']
+
+
+def test_profiling_requires_admin(profiled_client, make_user, basic_auth):
+    make_user('john')
+    response = profiled_client.get('/api/v1/cars/', headers=basic_auth('john@example.com', 'cat', PROFILE))
+    assert response.status_code == 403
+    assert 'X-Profile-Id' not in response.headers
+
+
+def test_disabled_by_default(client, make_user, basic_auth):
+    make_user('admin', admin=True)
+    response = client.get('/api/v1/cars/', headers=basic_auth('admin@example.com', 'cat', PROFILE))
+    assert 'X-Profile-Id' not in response.headers
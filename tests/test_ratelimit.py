@@ -0,0 +1,51 @@
+from app import limiter
+from app.ratelimit import MemoryBackend
+
+
+def test_bucket_allows_burst_then_refills(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('app.ratelimit.time.time', lambda: now[0])
+    backend = MemoryBackend()
+    assert [backend.consume('k', 2, 10, 3)[0] for _ in range(4)] == [True, True, True, False]
+    allowed, retry_after = backend.consume('k', 2, 10, 3)
+    assert not allowed and retry_after == 5
+    now[0] += 5
+    assert backend.consume('k', 2, 10, 3) == (True, 0)
+    assert backend.consume('other', 2, 10, 3) == (True, 0)
+
+
+def test_prune_drops_full_buckets(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('app.ratelimit.time.time', lambda: now[0])
+    backend = MemoryBackend(max_size=2)
+    backend.consume('a', 1, 1, 1)
+    backend.consume('b', 1, 1, 1)
+    now[0] += 10
+    backend.consume('c', 1, 1, 1)
+    assert set(backend._buckets) == {'c'}
+
+
+def test_token_endpoint_returns_429(client, monkeypatch):
+    monkeypatch.setattr(limiter, 'enabled', True)
+    monkeypatch.setattr(limiter, 'backend', MemoryBackend())
+    statuses = [client.post('/api/v1/tokens/').status_code for _ in range(10)]
+    assert statuses == [401] * 10
+    response = client.post('/api/v1/tokens/')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+
+
+def test_prune_uses_each_buckets_own_limits(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('app.ratelimit.time.time', lambda: now[0])
+    backend = MemoryBackend(max_size=2)
+    # 宽松的路由：每 60 秒 100 个，用掉 50 个后需要 30 秒补满
+    for _ in range(50):
+        backend.consume('generous', 100, 60, 100)
+    backend.consume('idle', 100, 60, 100)
+    now[0] += 20
+    # 严格的路由（每 60 秒 1 个）新建桶时只清理已经补满的桶，不会按严格的参数误删宽松的桶
+    backend.consume('strict', 1, 60, 1)
+    assert set(backend._buckets) == {'generous', 'strict'}
+    assert backend.consume('generous', 100, 60, 100) == (True, 0)
+    assert backend._buckets['generous'][0] < 99
@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+import mongomock
+import pytest
+from mongoengine.connection import disconnect, get_db
+from pymongo import ReadPreference
+
+from app.models import User
+from app.read_routing import READ_ALIAS, ReadRouter, client_options
+
+
+def make_router(**config):
+    return ReadRouter(SimpleNamespace(config=config))
+
+
+def test_client_options_excludes_connection_keys():
+    settings = {'db': 'nds', 'host': 'localhost', 'port': 27017, 'alias': 'x', 'NAME': 'nds',
+                'maxPoolSize': 50, 'serverSelectionTimeoutMS': 2000}
+    assert client_options(settings) == {'maxPoolSize': 50, 'serverSelectionTimeoutMS': 2000}
+
+
+def test_unknown_preference_is_rejected():
+    with pytest.raises(ValueError):
+        make_router(MONGODB_READ_PREFERENCE='secondary-preferred')
+
+
+def test_default_uses_primary(app):
+    router = make_router()
+    assert router.alias is None
+    assert router.queryset(User)._read_preference is None
+
+
+def test_read_preference(app):
+    router = make_router(MONGODB_READ_PREFERENCE='secondaryPreferred')
+    assert router.queryset(User)._read_preference == ReadPreference.SECONDARY_PREFERRED
+
+
+@pytest.fixture
+def read_alias():
+    yield READ_ALIAS
+    disconnect(READ_ALIAS)
+
+
+def test_read_settings_use_separate_alias(make_user, read_alias):
+    make_user()
+    router = make_router(MONGODB_READ_PREFERENCE='secondaryPreferred',
+                         MONGODB_READ_SETTINGS={'db': 'nds-read', 'host': 'localhost',
+                                                'mongo_client_class': mongomock.MongoClient})
+    assert router.alias == read_alias
+    # 只读连接优先于读偏好，且查询的是只读连接上的数据库
+    assert router.queryset(User).count() == 0
+    assert get_db(read_alias).name == 'nds-read'
+    assert User.objects.count() == 1
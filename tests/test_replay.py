@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from app.api.ghost_car import COORD_SCALE, ReplayEngine
+
+
+def track(*points):
+    return np.array([(lon * COORD_SCALE, lat * COORD_SCALE) for lon, lat in points], dtype=np.int32)
+
+
+@pytest.fixture
+def engine():
+    engine = ReplayEngine(sample_interval=2.0, start_offsets='zero')
+    engine.load([track((121.0, 31.0), (121.2, 31.2), (121.4, 31.4)),
+                 track((120.0, 30.0), (120.1, 30.1))])
+    return engine
+
+
+def test_interpolates_between_samples(engine):
+    assert engine.positions_at(0).tolist() == [[121.0, 31.0], [120.0, 30.0]]
+    assert engine.positions_at(1).tolist() == [[121.1, 31.1], [120.05, 30.05]]
+
+
+def test_wraps_to_start_after_last_point(engine):
+    # 第二条轨迹 2 个点，时长 4 秒：t=3 时停在最后一个点，t=4 时回到起点
+    assert engine.positions_at(3)[1].tolist() == [120.1, 30.1]
+    assert engine.positions_at(4)[1].tolist() == [120.0, 30.0]
+
+
+def test_advance_uses_speed(engine):
+    engine.speed = 2.0
+    positions = engine.advance(1.0)
+    assert engine.sim_time == 2.0
+    assert positions[0].tolist() == [121.2, 31.2]
+    assert engine.current() is positions
+    engine.resume(0.0)
+    assert engine.sim_time == 0.0
+
+
+def test_fleet_reuses_tracks_with_spread_offsets():
+    engine = ReplayEngine(sample_interval=1.0, fleet_size=5, start_offsets='spread', seed=1)
+    engine.load([track((121.0, 31.0), (121.0, 31.1), (121.0, 31.2), (121.0, 31.3))])
+    assert len(engine) == 5
+    assert (engine.car_start < 4).all()
+    positions = engine.positions_at(0)
+    assert positions.shape == (5, 2)
+    assert len(set(positions[:, 1].tolist())) > 1
+
+
+def test_no_tracks():
+    engine = ReplayEngine()
+    engine.load([])
+    assert len(engine) == 0
+    assert engine.positions_at(10).shape == (0, 2)
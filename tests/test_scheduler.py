@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from app.scheduler import Scheduler, SharedState, fcntl
+
+
+@pytest.fixture
+def state(tmp_path):
+    state = SharedState()
+    state.init_app(str(tmp_path / 'run'))
+    return state
+
+
+def test_shared_state_round_trip(state):
+    assert state.get_json('clock') is None
+    state.put_json('clock', {'sim_time': 1.5})
+    assert state.get_json('clock') == {'sim_time': 1.5}
+    state.put_array('positions', np.arange(6).reshape(3, 2))
+    version = state.array_version('positions')
+    assert state.get_array('positions').tolist() == [[0, 1], [2, 3], [4, 5]]
+    # 文件未变化时返回缓存的同一个对象
+    assert state.get_array('positions') is state.get_array('positions')
+    state.put_array('positions', np.zeros((1, 2)))
+    assert state.array_version('positions') != version
+
+
+def test_unconfigured_state():
+    state = SharedState()
+    state.put_json('clock', {})
+    assert state.get_json('clock') is None
+    assert state.get_array('positions') is None
+
+
+def make_scheduler(tmp_path):
+    scheduler = Scheduler()
+    scheduler.lock_file = str(tmp_path / 'scheduler.lock')
+    return scheduler
+
+
+@pytest.mark.skipif(fcntl is None, reason='requires fcntl')
+def test_only_one_leader(tmp_path):
+    first, second = make_scheduler(tmp_path), make_scheduler(tmp_path)
+    assert first.is_leader()
+    assert not second.is_leader()
+    first.shutdown()
+    assert second.is_leader()
+    second.shutdown()
+
+
+@pytest.mark.skipif(fcntl is None, reason='requires fcntl')
+def test_leader_only_jobs(tmp_path):
+    leader, follower = make_scheduler(tmp_path), make_scheduler(tmp_path)
+    assert leader.is_leader()
+    runs = []
+    follower.add_job('tick', lambda: runs.append('tick'), 2)
+    follower.add_job('sync', lambda: runs.append('sync'), 1, leader_only=False)
+    follower._run('tick')
+    follower._run('sync')
+    assert runs == ['sync']
+    assert [job['name'] for job in follower.status()['jobs']] == ['sync', 'tick']
+    leader.shutdown()
+
+
+def test_disabled_in_testing(app):
+    from app import scheduler
+    assert not scheduler.enabled
+    scheduler.start()
+    assert not scheduler.running
+
+
+def test_shutdown_registered_once(tmp_path, monkeypatch):
+    import atexit
+    from flask import Flask
+    calls = []
+    monkeypatch.setattr(atexit, 'register', calls.append)
+    scheduler = Scheduler()
+    for _ in range(2):
+        app = Flask(__name__)
+        app.config.update(SCHEDULER_LOCK_FILE=str(tmp_path / 'scheduler.lock'),
+                          SCHEDULER_STATE_DIR=str(tmp_path / 'run'))
+        scheduler.init_app(app)
+    assert calls == [scheduler.shutdown]
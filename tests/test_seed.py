@@ -0,0 +1,63 @@
+import mongomock
+from mongoengine.connection import disconnect, get_db
+
+from app import seed
+from app.seed import dataset_sizes, make_cars, make_tasks, make_users, object_id
+
+
+def test_dataset_sizes():
+    assert dataset_sizes(100000) == {'task': 100000, 'car': 1000, 'driver': 2000, 'user': 100}
+    assert dataset_sizes(10) == {'task': 10, 'car': 1, 'driver': 1, 'user': 1}
+
+
+def test_object_ids_are_unique_per_kind():
+    ids = {object_id(kind, index) for kind in ('user', 'car', 'driver', 'task') for index in range(100)}
+    assert len(ids) == 400
+
+
+def test_same_seed_gives_same_documents():
+    sizes = dataset_sizes(1000)
+    assert make_cars(7, 0, 10, sizes, 'hash') == make_cars(7, 0, 10, sizes, 'hash')
+    assert make_cars(7, 0, 10, sizes, 'hash') != make_cars(8, 0, 10, sizes, 'hash')
+    users = make_users(7, 0, 5, sizes, 'hash')
+    assert [user['username'] for user in users] == ['seed_user_%d' % i for i in range(5)]
+    assert all(user['password_hash'] == 'hash' for user in users)
+
+
+def test_tasks_reference_generated_documents():
+    sizes = dataset_sizes(500)
+    tasks = make_tasks(1, 0, 500, sizes, 'hash')
+    cars = {object_id('car', i) for i in range(sizes['car'])}
+    drivers = {object_id('driver', i) for i in range(sizes['driver'])}
+    users = {object_id('user', i) for i in range(sizes['user'])}
+    assert all(task['car'] in cars and task['driver'] in drivers and task['recorder'] in users
+               for task in tasks)
+    # 每 5 个任务中有 1 个车辆未返回
+    unreturned = [task for task in tasks if not task['is_return']]
+    assert len(unreturned) == 100
+    assert all('end_time' not in task for task in unreturned)
+    assert all(task['end_time'] > task['start_time'] for task in tasks if task['is_return'])
+
+
+def test_documents_do_not_depend_on_batch_size():
+    sizes = dataset_sizes(5000)
+    whole = make_tasks(3, 0, 1200, sizes, 'hash')
+    for batch_size in (7, 999, 1001):
+        batches = []
+        for start in range(0, 1200, batch_size):
+            batches.extend(make_tasks(3, start, min(start + batch_size, 1200), sizes, 'hash'))
+        assert batches == whole
+
+
+def test_worker_connects_with_full_settings():
+    settings = {'db': 'seed-test', 'host': 'localhost', 'port': 27017,
+                'mongo_client_class': mongomock.MongoClient, 'serverSelectionTimeoutMS': 1000}
+    try:
+        seed._init_worker(settings)
+        assert seed._insert_chunk(('car', 'car', 0, 3, 1, dataset_sizes(300), 'hash')) == ('car', 3)
+        database = get_db(seed.SEED_ALIAS)
+        assert database.name == 'seed-test'
+        assert isinstance(database.client, mongomock.MongoClient)
+        assert database.car.count_documents({}) == 3
+    finally:
+        disconnect(seed.SEED_ALIAS)
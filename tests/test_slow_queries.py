@@ -0,0 +1,54 @@
+import json
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+from app import db_monitor, slow_queries
+from app.slow_queries import command_filter, filter_shape, summarize_explain
+
+
+def test_filter_shape_drops_values():
+    query = {'car': ObjectId(), 'start_time': {'$gte': 1, '$lt': 2},
+             '$or': [{'a': 'x'}, {'b': {'$in': [1, 2, 3]}}]}
+    assert filter_shape(query) == {'car': 1, 'start_time': {'$gte': 1, '$lt': 1},
+                                   '$or': [{'a': 1}, {'b': {'$in': 1}}]}
+
+
+def test_aggregate_filter():
+    command = {'aggregate': 'task', 'pipeline': [{'$match': {'car': 1}}, {'$group': {}}]}
+    assert command_filter('aggregate', command) == {'$match': {'car': 1}, '$stages': ['$match', '$group']}
+
+
+def test_summarize_explain():
+    explain = {'queryPlanner': {'winningPlan': {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN'}}},
+               'executionStats': {'nReturned': 5, 'totalKeysExamined': 5,
+                                  'totalDocsExamined': 5, 'executionTimeMillis': 3}}
+    summary = summarize_explain(explain)
+    assert summary['plan'] == 'FETCH <- IXSCAN'
+    assert summary['docs_examined'] == 5
+
+
+def test_observer_registered_once(make_app):
+    make_app()
+    make_app()
+    assert db_monitor._observers.count(slow_queries.observe) == 1
+
+
+def test_only_slow_api_queries_are_queued(app, monkeypatch):
+    monkeypatch.setattr(slow_queries, '_ensure_worker', lambda: None)
+    started = SimpleNamespace(command_name='find', database_name='ndsdata',
+                              command={'find': 'car', 'filter': {'CarId': '1'}, 'lsid': {}})
+
+    def observe(path, micros):
+        with app.test_request_context(path):
+            app.preprocess_request()
+            slow_queries.observe(started, SimpleNamespace(duration_micros=micros))
+
+    observe('/api/v1/cars/', 10 * 1000)
+    observe('/metrics', 500 * 1000)
+    assert slow_queries._queue.empty()
+    observe('/api/v1/cars/', 500 * 1000)
+    record, command = slow_queries._queue.get_nowait()
+    assert record['collection'] == 'car'
+    assert json.loads(record['shape']) == {'CarId': 1}
+    assert 'lsid' not in command
@@ -0,0 +1,123 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from app.api.telemetry import parse_point
+from app.exceptions import ValidationError
+from app.models import Car, TelemetryBucket
+
+# 原始数据有 TTL 索引，测试数据使用前一天的 06:30:44 UTC
+DAY = (int(time.time()) // 86400 - 1) * 86400
+TIMESTAMP = DAY + 6 * 3600 + 30 * 60 + 44
+BUCKET = datetime.utcfromtimestamp(DAY) + timedelta(hours=6, minutes=30)
+
+
+@pytest.fixture
+def car(app):
+    car = Car(CarId='1', LicensePlate='沪A00001')
+    car.save()
+    return car
+
+
+@pytest.fixture
+def auth(make_user, basic_auth):
+    return basic_auth(make_user().generate_auth_token(3600))
+
+
+def post(client, auth, points):
+    return client.post('/api/v1/telemetry/batch', json={'points': points}, headers=auth)
+
+
+def test_bucket_start():
+    assert TelemetryBucket.bucket_start(TIMESTAMP, 10) == BUCKET
+    assert TelemetryBucket.bucket_start(TIMESTAMP + 0.5, 60) == BUCKET - timedelta(minutes=30)
+
+
+def test_parse_point_formats():
+    car = str(ObjectId())
+    assert parse_point([car, TIMESTAMP, 31.2, 121.4, 30]) == (ObjectId(car), TIMESTAMP, 31.2, 121.4, 30.0)
+    assert parse_point({'car': car, 'timestamp': TIMESTAMP, 'lat': 31.2, 'lon': 121.4})[4] is None
+
+
+@pytest.mark.parametrize('timestamp, lat, lon, speed', [
+    ('nan', 31.2, 121.4, 1), ('inf', 31.2, 121.4, 1), (1e20, 31.2, 121.4, 1), (-1, 31.2, 121.4, 1),
+    (TIMESTAMP, 'nan', 121.4, 1), (TIMESTAMP, 91, 121.4, 1), (TIMESTAMP, 31.2, 121.4, 'inf'),
+    (TIMESTAMP, 31.2, 121.4, '1e400'), ('x', 31.2, 121.4, 1)])
+def test_parse_point_rejects(timestamp, lat, lon, speed):
+    with pytest.raises(ValidationError):
+        parse_point([str(ObjectId()), timestamp, lat, lon, speed])
+
+
+def test_batch_groups_points_by_bucket(client, auth, car):
+    points = [[str(car.id), TIMESTAMP + 60, 31.3, 121.5, 20],
+              [str(car.id), TIMESTAMP, 31.2, 121.4, 10],
+              [str(car.id), TIMESTAMP + 3600, 31.4, 121.6, 30]]
+    response = post(client, auth, points)
+    assert response.get_json() == {'accepted': 3, 'buckets': 2}
+    bucket = TelemetryBucket.objects(car=car, start=BUCKET).first()
+    assert bucket.count == 2
+    assert bucket.lat == [31.2, 31.3]
+    assert bucket.first == BUCKET + timedelta(seconds=44)
+    # 同一个桶的后续批次追加到已有文档
+    post(client, auth, [[str(car.id), TIMESTAMP + 120, 31.5, 121.7, 40]])
+    assert TelemetryBucket.objects(car=car, start=BUCKET).first().count == 3
+
+
+def test_batch_rejects_bad_points(client, auth, car):
+    assert post(client, auth, [[str(car.id), 1e20, 31.2, 121.4, 10]]).status_code == 400
+    assert post(client, auth, [[str(ObjectId()), TIMESTAMP, 31.2, 121.4, 10]]).status_code == 400
+    assert TelemetryBucket.objects.count() == 0
+
+
+def test_duplicate_key_upsert_is_retried(client, auth, car, monkeypatch):
+    collection = TelemetryBucket._get_collection()
+    bulk_write = collection.bulk_write
+    calls = []
+
+    def racing_bulk_write(requests, ordered=True):
+        calls.append(len(requests))
+        if len(calls) == 1:
+            # 模拟另一个请求先创建了第二个桶：第一个操作成功，第二个报重复键
+            bulk_write(requests[:1], ordered=ordered)
+            raise BulkWriteError({'writeErrors': [{'index': 1, 'code': 11000, 'errmsg': 'E11000'}]})
+        return bulk_write(requests, ordered=ordered)
+    monkeypatch.setattr(collection.__class__, 'bulk_write',
+                        lambda self, requests, ordered=True: racing_bulk_write(requests, ordered))
+    response = post(client, auth, [[str(car.id), TIMESTAMP, 31.2, 121.4, 10],
+                             [str(car.id), TIMESTAMP + 3600, 31.4, 121.6, 30]])
+    assert response.status_code == 200
+    assert calls == [2, 1]
+    assert TelemetryBucket.objects.count() == 2
+
+
+def test_batch_requires_authentication(client, car):
+    response = client.post('/api/v1/telemetry/batch', json={'points': [[str(car.id), TIMESTAMP, 31.2, 121.4, 10]]})
+    assert response.status_code == 401
+    assert TelemetryBucket.objects.count() == 0
+
+
+def ttl_index():
+    for info in TelemetryBucket._get_collection().index_information().values():
+        if info['key'] == [('start', 1)]:
+            return info.get('expireAfterSeconds')
+
+
+def test_ttl_index_created_from_app_config(app, client, auth, car):
+    assert ttl_index() is None
+    post(client, auth, [[str(car.id), TIMESTAMP, 31.2, 121.4, 10]])
+    assert ttl_index() == app.config['TELEMETRY_RAW_TTL']
+
+
+def test_changed_ttl_uses_coll_mod(app, monkeypatch):
+    TelemetryBucket.ensure_ttl_index(3600)
+    collection = TelemetryBucket._get_collection()
+    commands = []
+    monkeypatch.setattr(collection.database.__class__, 'command',
+                        lambda self, *args, **kwargs: commands.append((args, kwargs)))
+    TelemetryBucket.ensure_ttl_index(3600)
+    assert commands == []
+    TelemetryBucket.ensure_ttl_index(7200)
+    assert commands == [(('collMod', collection.name), {'index': {'name': 'start_1', 'expireAfterSeconds': 7200}})]
@@ -0,0 +1,120 @@
+from app import token_versions, user_cache
+from app.models import User, token_serializer
+from app.tokens import TokenPrincipal
+
+
+def forbid_db(monkeypatch):
+    ''' 之后的数据库查询都会失败 '''
+    def fail(*args, **kwargs):
+        raise AssertionError('token verification must not query the database')
+    monkeypatch.setattr(User, '_get_collection', fail)
+    monkeypatch.setattr(user_cache, 'get', fail)
+
+
+def bump_version_elsewhere(user):
+    ''' 模拟其他进程修改密码：只改数据库，不经过本进程的版本表 '''
+    User._get_collection().update_one({'_id': user.id}, {'$inc': {'token_version': 1}})
+
+
+def test_token_carries_claims(make_user, monkeypatch):
+    user = make_user(admin=True, confirmed=True)
+    token = user.generate_auth_token(3600)
+    forbid_db(monkeypatch)
+    principal = User.verify_auth_token(token)
+    assert isinstance(principal, TokenPrincipal)
+    assert (principal.id, principal.username, principal.admin, principal.confirmed) == \
+        (user.id, 'john', True, True)
+    assert User.verify_auth_token(token + 'x') is None
+
+
+def test_first_verification_reads_version_once(make_user, monkeypatch):
+    user = make_user()
+    token = user.generate_auth_token(3600)
+    token_versions.clear()
+    assert User.verify_auth_token(token).id == user.id
+    forbid_db(monkeypatch)
+    assert User.verify_auth_token(token).id == user.id
+
+
+def test_password_change_revokes_tokens(make_user):
+    user = make_user()
+    token = user.generate_auth_token(3600)
+    user.password = 'dog'
+    user.save()
+    assert User.verify_auth_token(token) is None
+    assert User.verify_auth_token(user.generate_auth_token(3600)).id == user.id
+
+
+def test_claim_change_revokes_tokens(make_user):
+    user = make_user(admin=True)
+    token = user.generate_auth_token(3600)
+    user.name = 'renamed'
+    user.save()
+    assert User.verify_auth_token(token).admin
+    user.admin = False
+    user.save()
+    assert User.verify_auth_token(token) is None
+    assert not User.verify_auth_token(user.generate_auth_token(3600)).admin
+
+
+def test_revocation_in_other_process_applies_after_refresh(make_user):
+    user = make_user()
+    token = user.generate_auth_token(3600)
+    bump_version_elsewhere(user)
+    # 刷新之前仍使用本进程的版本表，不查询数据库
+    assert User.verify_auth_token(token) is not None
+    assert token_versions.refresh() == 1
+    assert User.verify_auth_token(token) is None
+    # 重启后（版本表为空）同样失效
+    token_versions.clear()
+    assert User.verify_auth_token(token) is None
+
+
+def test_newer_token_advances_version_table(make_user):
+    user = make_user()
+    old_token = user.generate_auth_token(3600)
+    bump_version_elsewhere(user)
+    new_token = token_serializer(3600).dumps({'id': str(user.id), 'username': 'john',
+                                              'ver': user.token_version + 1}).decode('utf-8')
+    assert User.verify_auth_token(new_token) is not None
+    assert User.verify_auth_token(old_token) is None
+
+
+def test_deleted_user_token_is_invalid(make_user):
+    user = make_user()
+    token = user.generate_auth_token(3600)
+    user.delete()
+    assert User.verify_auth_token(token) is None
+
+
+def test_deleted_in_other_process_applies_after_refresh(make_user):
+    user = make_user()
+    token = user.generate_auth_token(3600)
+    User._get_collection().delete_one({'_id': user.id})
+    token_versions.refresh()
+    assert User.verify_auth_token(token) is None
+
+
+def test_legacy_token_without_version(make_user):
+    # 增加 token_version 字段之前签发的令牌只有用户 id，版本为 0
+    user = make_user()
+    User._get_collection().update_one({'_id': user.id}, {'$unset': {'token_version': ''}})
+    token_versions.clear()
+    user = User.objects(id=user.id).first()
+    token = token_serializer(3600).dumps({'id': str(user.id)}).decode('utf-8')
+    assert User.verify_auth_token(token).id == user.id
+    user.password = 'dog'
+    user.save()
+    assert User.verify_auth_token(token) is None
+
+
+def test_token_authenticates_api_request(client, make_user, basic_auth):
+    user = make_user()
+    token = user.generate_auth_token(3600)
+    response = client.put('/api/v1/users/change-password/', headers=basic_auth(token),
+                          json={'old_password': 'cat', 'new_password': 'new password'})
+    assert response.status_code == 200
+    assert User.objects(id=user.id).first().verify_password('new password')
+    response = client.put('/api/v1/users/change-password/', headers=basic_auth(token),
+                          json={'old_password': 'new password', 'new_password': 'other password'})
+    assert response.status_code == 401
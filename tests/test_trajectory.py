@@ -0,0 +1,103 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from app import trajectory
+from app.trajectory import Track, TrackCache, dp_significance
+
+
+def douglas_peucker(x, y, tolerance):
+    ''' 递归实现，作为对照 '''
+    def distance(k, i, j):
+        dx, dy = x[j] - x[i], y[j] - y[i]
+        length = dx * dx + dy * dy
+        px, py = x[k] - x[i], y[k] - y[i]
+        if length == 0:
+            return np.hypot(px, py)
+        t = min(1.0, max(0.0, (px * dx + py * dy) / length))
+        return np.hypot(px - t * dx, py - t * dy)
+
+    def simplify(i, j):
+        if j - i < 2:
+            return []
+        k = max(range(i + 1, j), key=lambda k: distance(k, i, j))
+        if distance(k, i, j) <= tolerance:
+            return []
+        return simplify(i, k) + [k] + simplify(k, j)
+    return [0] + simplify(0, len(x) - 1) + [len(x) - 1]
+
+
+def test_significance_matches_douglas_peucker():
+    rng = np.random.RandomState(1)
+    x = np.cumsum(rng.uniform(-50, 50, 300))
+    y = np.cumsum(rng.uniform(-50, 50, 300))
+    significance = dp_significance(x, y)
+    for tolerance in (0, 5, 20, 100, 1000):
+        kept = np.nonzero(significance > tolerance)[0].tolist()
+        assert kept == douglas_peucker(x, y, tolerance)
+
+
+def test_track_simplify_keeps_endpoints():
+    t = np.arange(5, dtype=float)
+    lat = np.array([31.0, 31.0001, 31.0, 31.0001, 31.0])
+    lon = np.array([121.0, 121.001, 121.002, 121.003, 121.004])
+    track = Track(t, lat, lon)
+    assert len(track.simplify(1e9)) == 2
+    assert track.simplify(1e9)[0] == [0.0, 31.0, 121.0]
+    assert len(track.simplify(0)) == 5
+    assert dp_significance(np.array([]), np.array([])).size == 0
+
+
+def fake_task(task_id, closed=True):
+    return SimpleNamespace(id=task_id, car=SimpleNamespace(id='car'), start_time=None,
+                           end_time=1 if closed else None)
+
+
+def counting_loader(monkeypatch, delay=0.0):
+    calls = []
+
+    def load_track(car, start, end):
+        calls.append(car)
+        time.sleep(delay)
+        return Track(np.arange(3.0), np.zeros(3), np.arange(3.0))
+    monkeypatch.setattr(trajectory, 'load_track', load_track)
+    return calls
+
+
+def test_concurrent_requests_load_once(monkeypatch):
+    calls = counting_loader(monkeypatch, delay=0.2)
+    cache = TrackCache()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(fake_task('t'))))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert len(set(map(id, results))) == 1
+    assert not cache._loading
+
+
+def test_stale_track_served_during_refresh(monkeypatch):
+    calls = counting_loader(monkeypatch)
+    cache = TrackCache(ttl=0)
+    stale = cache.get(fake_task('t', closed=False))
+    # 另一个请求正在刷新时返回旧的轨迹
+    cache._loading['t'] = lock = threading.Lock()
+    lock.acquire()
+    assert cache.get(fake_task('t', closed=False)) is stale
+    lock.release()
+    del cache._loading['t']
+    assert cache.get(fake_task('t', closed=False)) is not stale
+    assert len(calls) == 2
+
+
+def test_lru_eviction(monkeypatch):
+    counting_loader(monkeypatch)
+    cache = TrackCache(max_size=2)
+    for task_id in ('a', 'b', 'a', 'c'):
+        cache.get(fake_task(task_id))
+    assert list(cache._tracks) == ['a', 'c']
@@ -0,0 +1,45 @@
+from bson import ObjectId
+
+from app import user_cache
+
+
+def test_get_caches_and_counts(make_user):
+    user = make_user()
+    user_cache.hits = user_cache.misses = 0
+    assert user_cache.get(user.id).username == 'john'
+    assert user_cache.get(str(user.id)).username == 'john'
+    stats = user_cache.stats()
+    assert (stats['hits'], stats['misses'], stats['size']) == (1, 1, 1)
+
+
+def test_each_get_returns_a_copy(make_user):
+    user = make_user()
+    first = user_cache.get(user.id)
+    first.name = 'changed'
+    second = user_cache.get(user.id)
+    assert second is not first
+    assert second.name == 'john'
+
+
+def test_save_invalidates(make_user):
+    user = make_user()
+    user_cache.get(user.id)
+    user.name = 'renamed'
+    user.save()
+    assert user_cache.get(user.id).name == 'renamed'
+
+
+def test_missing_user_is_not_cached(app):
+    assert user_cache.get(ObjectId()) is None
+    assert user_cache.get('not-an-id') is None
+    assert user_cache.stats()['size'] == 0
+
+
+def test_cached_copy_can_be_saved(make_user):
+    user = make_user()
+    user_cache.get(user.id)
+    cached = user_cache.get(user.id)
+    cached.phone = '123'
+    cached.save()
+    assert user_cache.get(user.id).phone == '123'
+    assert user_cache.get(user.id).username == 'john'